@@ -3,68 +3,123 @@ Agentic Commerce Protocol Client
 
 Handles communication with the seller backend following ACP specification.
 Provides methods for managing products, checkout sessions, and payment processing.
+
+Configuration, payloads and response shaping shared with the async client
+live in acp_common; this module only adds the requests-based I/O.
 """
 
 import requests
-from typing import Optional, Dict, List, Any
-from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from typing import Optional, Dict, List, Any, Iterator, Callable
 import os
+import threading
+import time
 import stripe
 from dotenv import load_dotenv
 
+from acp_common import (
+    SELLER_BACKEND_URL,
+    DEFAULT_PAYMENT_PROVIDER,
+    PRODUCT_LIST_LIMIT,
+    PRODUCT_PAGE_SIZE,
+    HTTP_POOL_CONNECTIONS,
+    HTTP_POOL_MAXSIZE,
+    HTTP_POOL_MAX_IDLE_SECONDS,
+    HTTP_KEEP_ALIVE,
+    HTTP_CONNECT_TIMEOUT_SECONDS,
+    CHECKOUT_READ_TIMEOUT_SECONDS,
+    COMPLETE_READ_TIMEOUT_SECONDS,
+    SPT_READ_TIMEOUT_SECONDS,
+    STRIPE_TIMEOUT_SECONDS,
+    BATCH_MAX_CONCURRENCY,
+    IdempotentWrite,
+    batch_error,
+    build_complete_params,
+    build_complete_payload,
+    build_create_payload,
+    build_error_response,
+    build_headers,
+    build_product_page,
+    build_product_page_error,
+    build_product_page_params,
+    build_spt_form_data,
+    build_spt_headers,
+    build_update_payload,
+    catalog_deadline_error,
+    check_batch_size,
+    extract_total_amount_from_checkout,
+    get_checkout_flight_key,
+    remember_write,
+    resolve_batch_operation,
+    spt_issue_url,
+    validate_method
+)
+from catalog_cache import CatalogCache
+from checkout_session_cache import CheckoutSessionCache
+from checkout_state import CheckoutStateCache
+from circuit_breaker import CircuitBreaker, CircuitOpenError, SELLER_BACKEND, SPT_SERVER, create_circuit_breakers
+from deadline import Deadline, DeadlineExceeded, resolve_timeout
+from idempotency import IdempotencyStore, create_idempotency_store
+from single_flight import SingleFlight
 
-load_dotenv()
 
-# ============================================================================
-# CONSTANTS
-# ============================================================================
+load_dotenv()
 
-SELLER_BACKEND_URL: str = os.getenv('SELLER_BACKEND_URL', 'http://localhost:3000')
-API_VERSION: str = '2025-09-29'
-CONTENT_TYPE_JSON: str = 'application/json'
-FACILITATOR_TOKEN: str = 'Bearer facilitator_token'
-DEFAULT_PAYMENT_PROVIDER: str = 'stripe'
-SPT_EXPIRATION_DAYS: int = 1
+# Failures of the requests library that map to 504
+REQUESTS_TIMEOUT_ERRORS = (requests.exceptions.Timeout,)
 
 
 # ============================================================================
 # HELPER FUNCTIONS
 # ============================================================================
 
-def _calculate_expiration_timestamp(days_ahead: int) -> int:
+def _build_error_response(error: Exception) -> Dict[str, Any]:
     """
-    Calculate Unix timestamp for a date in the future.
+    Convert a requests failure to the client's error dictionary format.
     
     Args:
-        days_ahead: Number of days from now
-        
+        error: Exception raised while calling an upstream service
+    
     Returns:
-        Unix timestamp as integer
+        Dictionary with 'error' message and 'status_code'
     """
-    expiration_date = datetime.now() + timedelta(days=days_ahead)
-    return int(expiration_date.timestamp())
+    return build_error_response(error, REQUESTS_TIMEOUT_ERRORS)
 
 
-def _extract_total_amount_from_checkout(checkout_response: Dict[str, Any]) -> int:
+def _create_pooled_session(pool_connections: int, pool_maxsize: int, keep_alive: bool) -> requests.Session:
     """
-    Extract the total amount from a checkout response.
+    Create a requests session backed by a keep-alive connection pool.
     
     Args:
-        checkout_response: Response dictionary from get_checkout
-        
+        pool_connections: Number of per-host connection pools to keep
+        pool_maxsize: Maximum number of connections kept per host
+        keep_alive: Whether connections are reused between requests
+    
     Returns:
-        Total amount as integer
-        
-    Raises:
-        ValueError: If total amount not found in checkout response
+        Session with pooled HTTP and HTTPS adapters mounted
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    session.headers['Connection'] = 'keep-alive' if keep_alive else 'close'
+    return session
+
+
+def _count_idle_connections(pool: Any) -> int:
     """
-    totals = checkout_response.get('totals', [])
+    Count connections currently parked in a urllib3 connection pool.
     
-    for total_entry in totals:
-        if total_entry.get('type') == 'total':
-            return total_entry['amount']
+    Args:
+        pool: urllib3 HTTPConnectionPool instance
     
-    raise ValueError('Total amount not found in checkout response')
+    Returns:
+        Number of open connections waiting to be reused
+    """
+    if pool.pool is None:
+        return 0
+    return sum(1 for connection in list(pool.pool.queue) if connection is not None)
 
 
 # ============================================================================
@@ -79,36 +134,167 @@ class ACPClient:
     product listing, checkout session management, and payment processing.
     """
     
-    def __init__(self, base_url: str = SELLER_BACKEND_URL) -> None:
+    def __init__(
+        self,
+        base_url: str = SELLER_BACKEND_URL,
+        pool_connections: int = HTTP_POOL_CONNECTIONS,
+        pool_maxsize: int = HTTP_POOL_MAXSIZE,
+        max_idle_seconds: float = HTTP_POOL_MAX_IDLE_SECONDS,
+        keep_alive: bool = HTTP_KEEP_ALIVE,
+        circuit_breakers: Optional[Dict[str, CircuitBreaker]] = None,
+        checkout_state: Optional[CheckoutStateCache] = None,
+        idempotency_store: Optional[IdempotencyStore] = None,
+        checkout_sessions: Optional[CheckoutSessionCache] = None
+    ) -> None:
         """
         Initialize ACP client with seller backend URL.
         
         Args:
             base_url: Base URL of the seller backend (defaults to config value)
+            pool_connections: Number of per-host connection pools to keep
+            pool_maxsize: Maximum number of pooled connections per host
+            max_idle_seconds: Idle time after which pooled connections are dropped
+            keep_alive: Whether to reuse connections between requests
+            circuit_breakers: Circuit breakers per upstream, to share them with another client
+                (defaults to new ones)
+            checkout_state: Checkout state cache, to share it with another client (defaults to a new one)
+            idempotency_store: Idempotency store, to share it with another client (defaults to a new store of the configured backend)
+            checkout_sessions: Session cache that sessions returned by writes are written through to (optional);
+                it must be tied to checkout_state
         """
         self.base_url = base_url.rstrip('/')
         self.stripe = stripe
         self.stripe.api_key = os.environ["FACILITATOR_API_KEY"]
-
+        self.stripe.default_http_client = stripe.RequestsClient(timeout=STRIPE_TIMEOUT_SECONDS)
+        
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.max_idle_seconds = max_idle_seconds
+        self.keep_alive = keep_alive
+        self._session_lock = threading.Lock()
+        self._session = _create_pooled_session(pool_connections, pool_maxsize, keep_alive)
+        self._last_used = time.monotonic()
+        self._pool_recycles = 0
+        
+        self.circuit_breakers = circuit_breakers if circuit_breakers is not None else create_circuit_breakers()
+        # Misses already load one at a time; single flight also keeps a background refresh
+        # and a miss load from hitting Stripe at the same time
+        self.catalog_cache = CatalogCache(loader=lambda: self.single_flight.do(('list_products',), self._fetch_products))
+        self.checkout_state = checkout_state if checkout_state is not None else CheckoutStateCache()
+        self.idempotency_store = idempotency_store if idempotency_store is not None else create_idempotency_store()
+        self.checkout_sessions = checkout_sessions
+        self.single_flight = SingleFlight()
+        # Shared by all batches, so concurrent batches together stay within the bound
+        self._batch_executor = ThreadPoolExecutor(max_workers=BATCH_MAX_CONCURRENCY, thread_name_prefix='acp-batch')
     
-    def _build_headers(self) -> Dict[str, str]:
+    def _get_session(self) -> requests.Session:
         """
-        Build HTTP headers required for ACP API requests.
+        Return the pooled session, recycling it if it sat idle for too long.
+        
+        Connections idle longer than max_idle_seconds are likely to have been
+        closed by the server, so the whole pool is dropped and rebuilt.
         
         Returns:
-            Dictionary containing required headers
+            The shared requests session
         """
-        return {
-            'Content-Type': CONTENT_TYPE_JSON,
-            'Authorization': FACILITATOR_TOKEN,
-            'API-Version': API_VERSION
-        }
+        with self._session_lock:
+            now = time.monotonic()
+            if now - self._last_used > self.max_idle_seconds:
+                self._session.close()
+                self._session = _create_pooled_session(self.pool_connections, self.pool_maxsize, self.keep_alive)
+                self._pool_recycles += 1
+            self._last_used = now
+            return self._session
+    
+    def pool_stats(self) -> Dict[str, Any]:
+        """
+        Get connection pool statistics for sizing the pool.
+        
+        Returns:
+            Dictionary with pool configuration and per-host connection counters
+        """
+        with self._session_lock:
+            adapter = self._session.get_adapter('http://')
+            pools = adapter.poolmanager.pools
+            hosts: Dict[str, Dict[str, int]] = {}
+            for pool_key in pools.keys():
+                pool = pools.get(pool_key)
+                if pool is None:
+                    continue
+                host = f"{pool_key.key_scheme}://{pool_key.key_host}:{pool_key.key_port}"
+                hosts[host] = {
+                    'connections_created': pool.num_connections,
+                    'requests': pool.num_requests,
+                    'idle_connections': _count_idle_connections(pool)
+                }
+            
+            return {
+                'pool_connections': self.pool_connections,
+                'pool_maxsize': self.pool_maxsize,
+                'max_idle_seconds': self.max_idle_seconds,
+                'keep_alive': self.keep_alive,
+                'pool_recycles': self._pool_recycles,
+                'hosts': hosts
+            }
+    
+    def circuit_stats(self) -> Dict[str, Any]:
+        """
+        Get the circuit breaker state of each upstream.
+        
+        Returns:
+            Dictionary of upstream name to circuit statistics
+        """
+        return {upstream: breaker.stats() for upstream, breaker in self.circuit_breakers.items()}
+    
+    def close(self) -> None:
+        """Close all pooled connections."""
+        self._batch_executor.shutdown(wait=False)
+        with self._session_lock:
+            self._session.close()
+    
+    def _send(self, upstream: str, method: str, url: str, **kwargs: Any) -> requests.Response:
+        """
+        Send a request over the pooled session through the upstream's circuit breaker.
+        
+        Connection errors, timeouts and 5xx responses count as upstream failures;
+        any other response counts as a success.
+        
+        Args:
+            upstream: Name of the upstream's circuit breaker
+            method: HTTP method
+            url: Absolute request URL
+            **kwargs: Extra arguments passed to requests
+        
+        Returns:
+            The response
+        
+        Raises:
+            CircuitOpenError: If the upstream's circuit is open
+            requests.exceptions.RequestException: If the request fails
+        """
+        breaker = self.circuit_breakers[upstream]
+        breaker.before_call()
+        
+        try:
+            response = self._get_session().request(method, url, **kwargs)
+        except BaseException:
+            breaker.record_failure()
+            raise
+        
+        if response.status_code >= 500:
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+        return response
     
     def _make_request(
         self,
         method: str,
         endpoint: str,
-        data: Optional[Dict[str, Any]] = None
+        data: Optional[Dict[str, Any]] = None,
+        read_timeout: float = CHECKOUT_READ_TIMEOUT_SECONDS,
+        deadline: Optional[Deadline] = None,
+        idempotency_key: Optional[str] = None
     ) -> Dict[str, Any]:
         """
         Make HTTP request to seller backend.
@@ -117,28 +303,33 @@ class ACPClient:
             method: HTTP method (GET, POST, PUT)
             endpoint: API endpoint path
             data: Optional request body data
-            
+            read_timeout: Read timeout budget for this operation in seconds
+            deadline: Optional end-to-end deadline; the timeout is clipped to what remains
+            idempotency_key: Optional Idempotency-Key header value
+        
         Returns:
             JSON response as dictionary, or error dictionary if request fails
-            
+        
         Raises:
             ValueError: If unsupported HTTP method is used
         """
         url = f"{self.base_url}{endpoint}"
-        headers = self._build_headers()
+        headers = build_headers(idempotency_key)
         
         # Step 1: Validate HTTP method
-        if method not in ['GET', 'POST', 'PUT']:
-            raise ValueError(f"Unsupported HTTP method: {method}")
+        validate_method(method)
         
-        # Step 2: Execute HTTP request based on method
+        # Step 2: Execute HTTP request over the pooled session, failing fast while the seller is down
         try:
-            if method == 'GET':
-                response = requests.get(url, headers=headers)
-            elif method == 'POST':
-                response = requests.post(url, json=data, headers=headers)
-            elif method == 'PUT':
-                response = requests.put(url, json=data, headers=headers)
+            timeout = resolve_timeout(HTTP_CONNECT_TIMEOUT_SECONDS, read_timeout, deadline)
+            response = self._send(
+                SELLER_BACKEND,
+                method,
+                url,
+                json=data if method != 'GET' else None,
+                headers=headers,
+                timeout=timeout
+            )
             
             # Step 3: Raise exception for HTTP errors
             response.raise_for_status()
@@ -146,31 +337,150 @@ class ACPClient:
             # Step 4: Return JSON response
             return response.json()
         
-        except requests.exceptions.RequestException as e:
+        except (requests.exceptions.RequestException, DeadlineExceeded, CircuitOpenError) as e:
             # Step 5: Convert HTTP exceptions to error dictionary format
-            status_code = None
-            if hasattr(e, 'response') and e.response is not None:
-                status_code = e.response.status_code
-            
-            return {
-                'error': str(e),
-                'status_code': status_code
-            }
+            return _build_error_response(e)
+    
+    def _run_idempotent(
+        self,
+        operation: str,
+        idempotency_key: Optional[str],
+        params: Dict[str, Any],
+        run: Callable[[str], Dict[str, Any]],
+        record_client_errors: bool = True
+    ) -> Dict[str, Any]:
+        """
+        Run a write operation under an idempotency key (see IdempotentWrite).
+        
+        Args:
+            operation: Operation name
+            idempotency_key: Key supplied by the caller, or None
+            params: Operation parameters the key is bound to
+            run: Function running the operation with the key to forward
+            record_client_errors: Whether a 4xx result is recorded (see IdempotencyStore.finish())
+        
+        Returns:
+            Result dictionary of the operation, a recorded result, or an idempotency error
+        """
+        write = IdempotentWrite(self.idempotency_store, operation, idempotency_key, params, record_client_errors)
+        recorded = write.begin()
+        if recorded is not None:
+            return recorded
+        
+        result = write.failed_result()
+        try:
+            result = run(write.forward_key)
+        finally:
+            write.finish(result)
+        return result
+    
+    def _fetch_products(self) -> Dict[str, Any]:
+        """
+        Fetch the product catalog from Stripe, bypassing the cache.
+        
+        Returns:
+            Dictionary containing products list
+        """
+        return self.stripe.Product.list(limit=PRODUCT_LIST_LIMIT)
     
-    def list_products(self) -> Dict[str, Any]:
+    def list_products(self, deadline: Optional[Deadline] = None) -> Dict[str, Any]:
         """
-        Get list of available products from seller backend.
+        Get list of available products, served from the catalog cache when possible.
+        
+        Args:
+            deadline: Optional end-to-end deadline of the incoming request
         
         Returns:
             Dictionary containing products list
         """
-        return self.stripe.Product.list(limit=3)
+        # Cached reads cost nothing, so the deadline only guards an upstream fetch
+        if deadline is not None and deadline.expired() and not self.catalog_cache.is_servable():
+            return catalog_deadline_error()
+        
+        return self.catalog_cache.get()
+    
+    def invalidate_catalog(self) -> None:
+        """Drop the cached product catalog so the next read refetches it."""
+        self.catalog_cache.invalidate()
+    
+    def list_products_page(
+        self,
+        cursor: Optional[str] = None,
+        limit: int = PRODUCT_PAGE_SIZE,
+        deadline: Optional[Deadline] = None
+    ) -> Dict[str, Any]:
+        """
+        Get one page of the product catalog using Stripe cursor pagination.
+        
+        Args:
+            cursor: ID of the last product of the previous page (None for the first page)
+            limit: Page size, capped at Stripe's maximum of 100
+            deadline: Optional end-to-end deadline of the incoming request
+        
+        Returns:
+            Dictionary with 'data', 'has_more' and 'next_cursor', or an error dictionary
+            (status 400 for a cursor Stripe rejects)
+        """
+        if deadline is not None and deadline.expired():
+            return catalog_deadline_error()
+        
+        try:
+            return self._fetch_product_page(cursor, limit)
+        except (stripe.StripeError, CircuitOpenError) as e:
+            print(f"Product page error: {e}")
+            return build_product_page_error(e, cursor)
+    
+    def _fetch_product_page(self, cursor: Optional[str], limit: int) -> Dict[str, Any]:
+        """
+        Fetch one page of the product catalog from Stripe, sharing concurrent identical requests.
+        
+        Args:
+            cursor: ID of the last product of the previous page (None for the first page)
+            limit: Page size, capped at Stripe's maximum of 100
+        
+        Returns:
+            Dictionary with 'data', 'has_more' and 'next_cursor'
+        
+        Raises:
+            stripe.StripeError: If Stripe rejects the request
+        """
+        params = build_product_page_params(cursor, limit)
+        
+        return self.single_flight.do(
+            ('list_products_page', cursor, params['limit']),
+            lambda: build_product_page(self.stripe.Product.list(**params))
+        )
+    
+    def iter_products(self, page_size: int = PRODUCT_PAGE_SIZE) -> Iterator[Dict[str, Any]]:
+        """
+        Stream the full product catalog, fetching one page at a time.
+        
+        Only the current page is held in memory, so this scales to catalogs of
+        any size and yields the first products as soon as the first page arrives.
+        
+        Args:
+            page_size: Number of products fetched per upstream request
+        
+        Yields:
+            Product dictionaries in catalog order
+        """
+        cursor: Optional[str] = None
+        
+        while True:
+            page = self._fetch_product_page(cursor, page_size)
+            yield from page['data']
+            
+            if not page['has_more']:
+                return
+            cursor = page['next_cursor']
     
     def create_checkout(
         self,
         items: List[Dict[str, Any]],
         buyer: Optional[Dict[str, str]] = None,
-        fulfillment_address: Optional[Dict[str, str]] = None
+        fulfillment_address: Optional[Dict[str, str]] = None,
+        deadline: Optional[Deadline] = None,
+        idempotency_key: Optional[str] = None
     ) -> Dict[str, Any]:
         """
         Create a new checkout session.
@@ -179,31 +489,50 @@ class ACPClient:
             items: List of items with id and quantity
             buyer: Optional buyer information (first_name, last_name, email, phone_number)
             fulfillment_address: Optional shipping address
-            
+            deadline: Optional end-to-end deadline of the incoming request
+            idempotency_key: Optional key making retries of this creation safe
+        
         Returns:
             Dictionary containing checkout session details
         """
-        data: Dict[str, Any] = {'items': items}
+        data = build_create_payload(items, buyer, fulfillment_address)
         
-        if buyer:
-            data['buyer'] = buyer
+        def run(key: str) -> Dict[str, Any]:
+            ticket = self.checkout_state.ticket()
+            result = self._make_request('POST', '/checkout_sessions', data, deadline=deadline, idempotency_key=key)
+            remember_write(self.checkout_state, self.checkout_sessions, result.get('id'), result, ticket)
+            return result
         
-        if fulfillment_address:
-            data['fulfillment_address'] = fulfillment_address
-        
-        return self._make_request('POST', '/checkout_sessions', data)
+        return self._run_idempotent('create_checkout', idempotency_key, data, run)
     
-    def get_checkout(self, checkout_id: str) -> Dict[str, Any]:
+    def get_checkout(self, checkout_id: str, deadline: Optional[Deadline] = None) -> Dict[str, Any]:
         """
         Retrieve an existing checkout session.
         
         Args:
             checkout_id: Unique identifier for the checkout session
-            
+            deadline: Optional end-to-end deadline of the incoming request
+        
         Returns:
             Dictionary containing checkout session details
         """
-        return self._make_request('GET', f'/checkout_sessions/{checkout_id}')
+        return self.single_flight.do(
+            get_checkout_flight_key(self.checkout_state, checkout_id),
+            lambda: self._fetch_checkout(checkout_id, deadline)
+        )
+    
+    def _fetch_checkout(self, checkout_id: str, deadline: Optional[Deadline]) -> Dict[str, Any]:
+        """
+        Fetch a checkout session from the seller backend.
+        
+        Args:
+            checkout_id: Unique identifier for the checkout session
+            deadline: Optional end-to-end deadline of the incoming request
+        
+        Returns:
+            Dictionary containing checkout session details
+        """
+        return self._make_request('GET', f'/checkout_sessions/{checkout_id}', deadline=deadline)
     
     def update_checkout(
         self,
@@ -211,7 +540,8 @@ class ACPClient:
         items: Optional[List[Dict[str, Any]]] = None,
         buyer: Optional[Dict[str, str]] = None,
         fulfillment_address: Optional[Dict[str, str]] = None,
-        fulfillment_option_id: Optional[str] = None
+        fulfillment_option_id: Optional[str] = None,
+        deadline: Optional[Deadline] = None
     ) -> Dict[str, Any]:
         """
         Update an existing checkout session.
@@ -222,32 +552,28 @@ class ACPClient:
             buyer: Optional updated buyer information
             fulfillment_address: Optional updated shipping address
             fulfillment_option_id: Optional selected fulfillment option
-            
+            deadline: Optional end-to-end deadline of the incoming request
+        
         Returns:
             Dictionary containing updated checkout session details
         """
-        data: Dict[str, Any] = {}
-        
-        if items is not None:
-            data['items'] = items
+        data = build_update_payload(items, buyer, fulfillment_address, fulfillment_option_id)
         
-        if buyer:
-            data['buyer'] = buyer
-        
-        if fulfillment_address:
-            data['fulfillment_address'] = fulfillment_address
-        
-        if fulfillment_option_id:
-            data['fulfillment_option_id'] = fulfillment_option_id
-        
-        return self._make_request('POST', f'/checkout_sessions/{checkout_id}', data)
+        # Stop completions from using the old total while the update is in flight
+        ticket = self.checkout_state.invalidate(checkout_id)
+        result = self._make_request('POST', f'/checkout_sessions/{checkout_id}', data, deadline=deadline)
+        remember_write(self.checkout_state, self.checkout_sessions, checkout_id, result, ticket)
+        return result
     
     def complete_checkout(
         self,
         checkout_id: str,
         payment_token: str,
         payment_provider: str = DEFAULT_PAYMENT_PROVIDER,
-        billing_address: Optional[Dict[str, str]] = None
+        billing_address: Optional[Dict[str, str]] = None,
+        deadline: Optional[Deadline] = None,
+        idempotency_key: Optional[str] = None,
+        record_client_errors: bool = True
     ) -> Dict[str, Any]:
         """
         Complete a checkout with payment.
@@ -257,44 +583,76 @@ class ACPClient:
             payment_token: Payment token from payment provider
             payment_provider: Payment provider name (default: stripe)
             billing_address: Optional billing address
-            
+            deadline: Optional end-to-end deadline shared by all calls made here
+            idempotency_key: Optional key making retries of this completion safe
+            record_client_errors: Whether a 4xx result is recorded under idempotency_key (False for
+                keys derived from the arguments, since a 4xx may depend on the checkout's current state)
+        
         Returns:
             Dictionary containing completion result
-            
+        
         Raises:
             ValueError: If total amount cannot be extracted from checkout
         """
-        # Step 1: Get checkout details to extract total amount
-        checkout_response = self.get_checkout(checkout_id)
-        total_amount = _extract_total_amount_from_checkout(checkout_response)
-        
-        # Step 2: Build payment data structure
-        payment_data: Dict[str, Any] = {
-            'token': payment_token,
-            'provider': payment_provider
-        }
+        return self._run_idempotent(
+            'complete_checkout',
+            idempotency_key,
+            build_complete_params(checkout_id, payment_token, payment_provider, billing_address),
+            lambda key: self._complete_checkout(
+                checkout_id, payment_token, payment_provider, billing_address, deadline, key
+            ),
+            record_client_errors
+        )
+    
+    def _complete_checkout(
+        self,
+        checkout_id: str,
+        payment_token: str,
+        payment_provider: str,
+        billing_address: Optional[Dict[str, str]],
+        deadline: Optional[Deadline],
+        idempotency_key: str
+    ) -> Dict[str, Any]:
+        """
+        Complete a checkout with payment; see complete_checkout().
         
-        # Step 3: Exchange payment token for SPT token
-        tomorrow = datetime.now() + timedelta(days=1)
-        expires_at_timestamp = int(tomorrow.timestamp()) 
+        The idempotency key is forwarded to the seller backend, and a key derived
+        from it to the SPT server, so neither issues a second SPT or order on a retry.
         
+        The SPT amount limit comes from the total returned by this process's own
+        latest write, if any. The checkout state cache is per process and cannot
+        see writes made by other workers or totals the seller changed on its own;
+        deployments where either can happen should set CHECKOUT_TOTAL_REVALIDATE.
+        """
+        ticket = self.checkout_state.ticket()
+        
+        # Step 1: Get the total amount; the cached total is only used if this process made the
+        # checkout's latest write, otherwise the checkout is read from the seller
+        total_amount = self.checkout_state.total(checkout_id)
+        if total_amount is None:
+            checkout_response = self.get_checkout(checkout_id, deadline=deadline)
+            if 'error' in checkout_response:
+                return checkout_response
+            total_amount = extract_total_amount_from_checkout(checkout_response)
+        
+        # Step 2: Exchange payment token for SPT token
         # ============================================================
         # DEMO MODE: Mock Stripe SPT Server (for European demo)
         # ============================================================
-        mock_spt_url = os.getenv('MOCK_STRIPE_SPT_URL', 'http://localhost:8001')
-        print(f"🎭 DEMO MODE: Using mock Stripe SPT server: {mock_spt_url}/v1/shared_payment/issued_tokens")
-        
-        get_pst_token_response = requests.post(
-            url=f"{mock_spt_url}/v1/shared_payment/issued_tokens", 
-            data={
-                "payment_method": payment_token,
-                "usage_limits[currency]": "usd",
-                "usage_limits[max_amount]": total_amount,
-                "usage_limits[expires_at]": expires_at_timestamp,
-                "seller_details[network_id]": "internal",
-                "seller_details[external_id]": "stripe_test_merchant",
-            }
-        )
+        spt_url = spt_issue_url()
+        print(f"🎭 DEMO MODE: Using mock Stripe SPT server: {spt_url}")
+        
+        try:
+            get_pst_token_response = self._send(
+                SPT_SERVER,
+                'POST',
+                spt_url,
+                data=build_spt_form_data(payment_token, total_amount),
+                headers=build_spt_headers(idempotency_key),
+                timeout=resolve_timeout(HTTP_CONNECT_TIMEOUT_SECONDS, SPT_READ_TIMEOUT_SECONDS, deadline)
+            )
+        except (requests.exceptions.RequestException, DeadlineExceeded, CircuitOpenError) as e:
+            return _build_error_response(e)
         
         # # ============================================================
         # # PRODUCTION MODE: Real Stripe API (commented out)
@@ -303,43 +661,86 @@ class ACPClient:
         # #
         # # stripe_api_url = "https://api.stripe.com/v1/shared_payment/issued_tokens"
         # # print(f"💳 PRODUCTION MODE: Using real Stripe API: {stripe_api_url}")
-        # # 
-        # # get_pst_token_response = requests.post(
-        # #     url=stripe_api_url, 
-        # #     data={
-        # #         "payment_method": payment_token,
-        # #         "usage_limits[currency]": "usd",
-        # #         "usage_limits[max_amount]": total_amount,
-        # #         "usage_limits[expires_at]": expires_at_timestamp,
-        # #         "seller_details[network_id]": "internal",
-        # #         "seller_details[external_id]": "stripe_test_merchant",
-        # #     },
-        # #     auth=(os.getenv("FACILITATOR_API_KEY"), "")
+        # #
+        # # get_pst_token_response = self._get_session().post(
+        # #     url=stripe_api_url,
+        # #     data=build_spt_form_data(payment_token, total_amount),
+        # #     auth=(os.getenv("FACILITATOR_API_KEY"), ""),
+        # #     timeout=resolve_timeout(HTTP_CONNECT_TIMEOUT_SECONDS, SPT_READ_TIMEOUT_SECONDS, deadline)
         # # )
         
         print(get_pst_token_response.json())
         spt_token_id = get_pst_token_response.json()['id']
         
-        payment_data['token'] = spt_token_id
-        
-        # Step 4: Build request data
-        data: Dict[str, Any] = {'payment_data': payment_data}
-        
-        if billing_address:
-            data['billing_address'] = billing_address
-        
-        # Step 5: Send completion request
-        return self._make_request('POST', f'/checkout_sessions/{checkout_id}/complete', data)
+        # Step 3: Send completion request
+        result = self._make_request(
+            'POST',
+            f'/checkout_sessions/{checkout_id}/complete',
+            build_complete_payload(spt_token_id, payment_provider, billing_address),
+            read_timeout=COMPLETE_READ_TIMEOUT_SECONDS,
+            deadline=deadline,
+            idempotency_key=idempotency_key
+        )
+        remember_write(self.checkout_state, self.checkout_sessions, checkout_id, result, ticket, keep_total=False)
+        return result
     
-    def cancel_checkout(self, checkout_id: str) -> Dict[str, Any]:
+    def cancel_checkout(self, checkout_id: str, deadline: Optional[Deadline] = None) -> Dict[str, Any]:
         """
         Cancel an existing checkout session.
         
         Args:
             checkout_id: ID of the checkout session to cancel
-            
+            deadline: Optional end-to-end deadline of the incoming request
+        
         Returns:
             Dictionary containing cancellation result
         """
-        return self._make_request('POST', f'/checkout_sessions/{checkout_id}/cancel', {})
-  
\ No newline at end of file
+        ticket = self.checkout_state.invalidate(checkout_id)
+        result = self._make_request('POST', f'/checkout_sessions/{checkout_id}/cancel', {}, deadline=deadline)
+        remember_write(self.checkout_state, self.checkout_sessions, checkout_id, result, ticket, keep_total=False)
+        return result
+    
+    def _run_batch_operation(self, operation: Any, deadline: Optional[Deadline]) -> Dict[str, Any]:
+        """
+        Run one operation of a batch, turning an unexpected exception into that item's error.
+        
+        Args:
+            operation: Operation dictionary (see batch())
+            deadline: Optional end-to-end deadline of the batch
+        
+        Returns:
+            Result dictionary of the operation, or an error dictionary if it is invalid or failed
+        """
+        method_name, arguments = resolve_batch_operation(operation)
+        if method_name is None:
+            return arguments
+        
+        try:
+            return getattr(self, method_name)(deadline=deadline, **arguments)
+        except Exception as e:
+            return batch_error(str(e), status_code=500)
+    
+    def batch(self, operations: List[Dict[str, Any]], deadline: Optional[Deadline] = None) -> List[Dict[str, Any]]:
+        """
+        Run many checkout operations concurrently on a bounded pool.
+        
+        Operations are described in acp_common.resolve_batch_operation().
+        
+        Args:
+            operations: Operations to run
+            deadline: Optional end-to-end deadline shared by all operations
+        
+        Returns:
+            One result dictionary per operation, in order; a failed operation's result
+            is an error dictionary and does not affect the others
+        
+        Raises:
+            ValueError: If the batch has more than BATCH_MAX_OPERATIONS operations
+        """
+        check_batch_size(operations)
+        
+        futures = [
+            self._batch_executor.submit(self._run_batch_operation, operation, deadline)
+            for operation in operations
+        ]
+        return [future.result() for future in futures]
@@ -0,0 +1,637 @@
+"""
+Agentic Commerce Protocol Client Common
+
+Transport-independent parts of ACPClient and AsyncACPClient: configuration,
+request headers and payloads, idempotent write bookkeeping, checkout state
+updates, batch operation dispatch and response/error shaping. Each client
+only adds the HTTP I/O of its own transport (requests or httpx).
+"""
+
+from typing import Optional, Dict, List, Any, Tuple
+from datetime import datetime, timedelta
+import os
+import stripe
+from dotenv import load_dotenv
+
+from checkout_session_cache import CheckoutSessionCache
+from checkout_state import CheckoutStateCache
+from circuit_breaker import CircuitOpenError
+from deadline import DeadlineExceeded
+from idempotency import IDEMPOTENCY_HEADER, IdempotencyStore, fingerprint, new_idempotency_key
+
+
+load_dotenv()
+
+# ============================================================================
+# CONSTANTS
+# ============================================================================
+
+SELLER_BACKEND_URL: str = os.getenv('SELLER_BACKEND_URL', 'http://localhost:3000')
+API_VERSION: str = '2025-09-29'
+CONTENT_TYPE_JSON: str = 'application/json'
+FACILITATOR_TOKEN: str = 'Bearer facilitator_token'
+DEFAULT_PAYMENT_PROVIDER: str = 'stripe'
+SPT_EXPIRATION_DAYS: int = 1
+SUPPORTED_HTTP_METHODS = ('GET', 'POST', 'PUT')
+
+# Checkout statuses after which a session can no longer be completed
+TERMINAL_CHECKOUT_STATUSES = {'completed', 'canceled'}
+
+# Product catalog paging
+PRODUCT_LIST_LIMIT: int = int(os.getenv('PRODUCT_LIST_LIMIT', '3'))
+PRODUCT_PAGE_SIZE: int = int(os.getenv('PRODUCT_PAGE_SIZE', '100'))
+MAX_PRODUCT_PAGE_SIZE: int = 100
+
+# Connection pool settings shared by all seller backend and SPT requests
+HTTP_POOL_CONNECTIONS: int = int(os.getenv('HTTP_POOL_CONNECTIONS', '10'))
+HTTP_POOL_MAXSIZE: int = int(os.getenv('HTTP_POOL_MAXSIZE', '20'))
+HTTP_POOL_MAX_IDLE_SECONDS: float = float(os.getenv('HTTP_POOL_MAX_IDLE_SECONDS', '60'))
+HTTP_KEEP_ALIVE: bool = os.getenv('HTTP_KEEP_ALIVE', 'True').lower() == 'true'
+
+# Per-operation timeout budgets in seconds
+HTTP_CONNECT_TIMEOUT_SECONDS: float = float(os.getenv('HTTP_CONNECT_TIMEOUT_SECONDS', '3.05'))
+CHECKOUT_READ_TIMEOUT_SECONDS: float = float(os.getenv('CHECKOUT_READ_TIMEOUT_SECONDS', '10'))
+COMPLETE_READ_TIMEOUT_SECONDS: float = float(os.getenv('COMPLETE_READ_TIMEOUT_SECONDS', '30'))
+SPT_READ_TIMEOUT_SECONDS: float = float(os.getenv('SPT_READ_TIMEOUT_SECONDS', '10'))
+STRIPE_TIMEOUT_SECONDS: float = float(os.getenv('STRIPE_TIMEOUT_SECONDS', '15'))
+
+# Batch checkout operations
+BATCH_MAX_OPERATIONS: int = int(os.getenv('BATCH_MAX_OPERATIONS', '100'))
+BATCH_MAX_CONCURRENCY: int = int(os.getenv('BATCH_MAX_CONCURRENCY', '8'))
+BATCH_OPERATIONS = ('create', 'get', 'update', 'cancel')
+
+
+# ============================================================================
+# REQUEST CONSTRUCTION
+# ============================================================================
+
+def build_headers(idempotency_key: Optional[str] = None) -> Dict[str, str]:
+    """
+    Build HTTP headers required for ACP API requests.
+
+    Args:
+        idempotency_key: Optional Idempotency-Key header value
+
+    Returns:
+        Dictionary containing required headers
+    """
+    headers = {
+        'Content-Type': CONTENT_TYPE_JSON,
+        'Authorization': FACILITATOR_TOKEN,
+        'API-Version': API_VERSION
+    }
+    if idempotency_key is not None:
+        headers[IDEMPOTENCY_HEADER] = idempotency_key
+    return headers
+
+
+def validate_method(method: str) -> None:
+    """
+    Check that an HTTP method is supported by the seller backend.
+
+    Args:
+        method: HTTP method
+
+    Raises:
+        ValueError: If unsupported HTTP method is used
+    """
+    if method not in SUPPORTED_HTTP_METHODS:
+        raise ValueError(f"Unsupported HTTP method: {method}")
+
+
+def build_create_payload(
+    items: List[Dict[str, Any]],
+    buyer: Optional[Dict[str, str]] = None,
+    fulfillment_address: Optional[Dict[str, str]] = None
+) -> Dict[str, Any]:
+    """
+    Build the request body of a checkout creation.
+
+    Args:
+        items: List of items with id and quantity
+        buyer: Optional buyer information
+        fulfillment_address: Optional shipping address
+
+    Returns:
+        Request body dictionary
+    """
+    data: Dict[str, Any] = {'items': items}
+
+    if buyer:
+        data['buyer'] = buyer
+
+    if fulfillment_address:
+        data['fulfillment_address'] = fulfillment_address
+
+    return data
+
+
+def build_update_payload(
+    items: Optional[List[Dict[str, Any]]] = None,
+    buyer: Optional[Dict[str, str]] = None,
+    fulfillment_address: Optional[Dict[str, str]] = None,
+    fulfillment_option_id: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    Build the request body of a checkout update.
+
+    Args:
+        items: Optional updated items list
+        buyer: Optional updated buyer information
+        fulfillment_address: Optional updated shipping address
+        fulfillment_option_id: Optional selected fulfillment option
+
+    Returns:
+        Request body dictionary
+    """
+    data: Dict[str, Any] = {}
+
+    if items is not None:
+        data['items'] = items
+
+    if buyer:
+        data['buyer'] = buyer
+
+    if fulfillment_address:
+        data['fulfillment_address'] = fulfillment_address
+
+    if fulfillment_option_id:
+        data['fulfillment_option_id'] = fulfillment_option_id
+
+    return data
+
+
+def build_complete_params(
+    checkout_id: str,
+    payment_token: str,
+    payment_provider: str,
+    billing_address: Optional[Dict[str, str]]
+) -> Dict[str, Any]:
+    """
+    Build the parameters a completion's idempotency key is bound to.
+
+    Args:
+        checkout_id: ID of the checkout to complete
+        payment_token: Payment token from payment provider
+        payment_provider: Payment provider name
+        billing_address: Optional billing address
+
+    Returns:
+        Parameter dictionary
+    """
+    return {
+        'checkout_id': checkout_id,
+        'payment_token': payment_token,
+        'payment_provider': payment_provider,
+        'billing_address': billing_address
+    }
+
+
+def build_complete_payload(
+    spt_token_id: str,
+    payment_provider: str,
+    billing_address: Optional[Dict[str, str]]
+) -> Dict[str, Any]:
+    """
+    Build the request body of a checkout completion.
+
+    Args:
+        spt_token_id: Shared payment token issued for this completion
+        payment_provider: Payment provider name
+        billing_address: Optional billing address
+
+    Returns:
+        Request body dictionary
+    """
+    data: Dict[str, Any] = {
+        'payment_data': {
+            'token': spt_token_id,
+            'provider': payment_provider
+        }
+    }
+
+    if billing_address:
+        data['billing_address'] = billing_address
+
+    return data
+
+
+def spt_issue_url() -> str:
+    """
+    Get the URL SPTs are issued from.
+
+    DEMO MODE: this is the mock Stripe SPT server; the production endpoint is
+    https://api.stripe.com/v1/shared_payment/issued_tokens.
+
+    Returns:
+        Absolute URL of the issued tokens endpoint
+    """
+    mock_spt_url = os.getenv('MOCK_STRIPE_SPT_URL', 'http://localhost:8001')
+    return f"{mock_spt_url}/v1/shared_payment/issued_tokens"
+
+
+def build_spt_form_data(payment_token: str, total_amount: int) -> Dict[str, Any]:
+    """
+    Build the form body of an SPT issuance limited to a checkout's total.
+
+    Args:
+        payment_token: Payment method the SPT is issued for
+        total_amount: Maximum amount the SPT may charge
+
+    Returns:
+        Form data dictionary
+    """
+    return {
+        "payment_method": payment_token,
+        "usage_limits[currency]": "usd",
+        "usage_limits[max_amount]": total_amount,
+        "usage_limits[expires_at]": calculate_expiration_timestamp(SPT_EXPIRATION_DAYS),
+        "seller_details[network_id]": "internal",
+        "seller_details[external_id]": "stripe_test_merchant",
+    }
+
+
+def build_spt_headers(idempotency_key: str) -> Dict[str, str]:
+    """
+    Build the headers of an SPT issuance.
+
+    The key is derived from the completion's own key, so a retried completion
+    gets the same SPT instead of a second one.
+
+    Args:
+        idempotency_key: Idempotency key of the completion
+
+    Returns:
+        Dictionary containing the SPT request headers
+    """
+    return {IDEMPOTENCY_HEADER: f"{idempotency_key}-spt"}
+
+
+def build_product_page_params(cursor: Optional[str], limit: int) -> Dict[str, Any]:
+    """
+    Build the Stripe list parameters of one product page.
+
+    Args:
+        cursor: ID of the last product of the previous page (None for the first page)
+        limit: Page size, capped at Stripe's maximum of 100
+
+    Returns:
+        Stripe Product.list parameters
+    """
+    params: Dict[str, Any] = {'limit': min(limit, MAX_PRODUCT_PAGE_SIZE)}
+    if cursor:
+        params['starting_after'] = cursor
+    return params
+
+
+# ============================================================================
+# RESPONSE AND ERROR SHAPING
+# ============================================================================
+
+def calculate_expiration_timestamp(days_ahead: int) -> int:
+    """
+    Calculate Unix timestamp for a date in the future.
+
+    Args:
+        days_ahead: Number of days from now
+
+    Returns:
+        Unix timestamp as integer
+    """
+    expiration_date = datetime.now() + timedelta(days=days_ahead)
+    return int(expiration_date.timestamp())
+
+
+def extract_total_amount_from_checkout(checkout_response: Dict[str, Any]) -> int:
+    """
+    Extract the total amount from a checkout response.
+
+    Args:
+        checkout_response: Response dictionary from get_checkout
+
+    Returns:
+        Total amount as integer
+
+    Raises:
+        ValueError: If total amount not found in checkout response
+    """
+    totals = checkout_response.get('totals', [])
+
+    for total_entry in totals:
+        if total_entry.get('type') == 'total':
+            return total_entry['amount']
+
+    raise ValueError('Total amount not found in checkout response')
+
+
+def payable_total(checkout_response: Dict[str, Any]) -> Optional[int]:
+    """
+    Get the total amount of a checkout response that may still be completed.
+
+    Args:
+        checkout_response: Response dictionary from a checkout operation
+
+    Returns:
+        Total amount, or None for errors, finished sessions and responses without a total
+    """
+    if 'error' in checkout_response or checkout_response.get('status') in TERMINAL_CHECKOUT_STATUSES:
+        return None
+
+    try:
+        return extract_total_amount_from_checkout(checkout_response)
+    except (ValueError, KeyError):
+        return None
+
+
+def build_error_response(error: Exception, timeout_errors: Tuple[type, ...] = ()) -> Dict[str, Any]:
+    """
+    Convert an outbound request failure to the client's error dictionary format.
+
+    Timeouts and exhausted deadlines map to 504 so callers can tell a slow
+    upstream apart from a rejected request; an open circuit maps to 503.
+
+    Args:
+        error: Exception raised while calling an upstream service
+        timeout_errors: Timeout exception types of the client's HTTP library
+
+    Returns:
+        Dictionary with 'error' message and 'status_code'
+    """
+    status_code = None
+    if isinstance(error, (DeadlineExceeded,) + timeout_errors):
+        status_code = 504
+    elif isinstance(error, CircuitOpenError):
+        status_code = 503
+    elif getattr(error, 'response', None) is not None:
+        status_code = error.response.status_code
+
+    return {
+        'error': str(error),
+        'status_code': status_code
+    }
+
+
+def catalog_deadline_error() -> Dict[str, Any]:
+    """
+    Build the error dictionary of a catalog read whose deadline ran out before it started.
+
+    Returns:
+        Dictionary with 'error' message and 'status_code' 504
+    """
+    return build_error_response(DeadlineExceeded('Request deadline exceeded before listing products'))
+
+
+def build_product_page(product_list: Any) -> Dict[str, Any]:
+    """
+    Convert a Stripe product list page to a cursor-paged response.
+
+    Args:
+        product_list: Stripe ListObject for one page of products
+
+    Returns:
+        Dictionary with 'data', 'has_more' and 'next_cursor' (None on the last page)
+    """
+    products = list(product_list['data'])
+    has_more = bool(product_list.get('has_more')) and len(products) > 0
+
+    return {
+        'object': 'list',
+        'data': products,
+        'has_more': has_more,
+        'next_cursor': products[-1]['id'] if has_more else None
+    }
+
+
+def build_product_page_error(error: Exception, cursor: Optional[str]) -> Dict[str, Any]:
+    """
+    Convert a failed product page request to the client's error dictionary format.
+
+    A cursor Stripe rejects maps to 400, since it came from the caller.
+
+    Args:
+        error: Stripe error or CircuitOpenError raised while listing products
+        cursor: Cursor the page was requested with
+
+    Returns:
+        Dictionary with 'error' message and 'status_code'
+    """
+    if cursor and isinstance(error, stripe.InvalidRequestError):
+        return {
+            'error': f'Invalid cursor: {cursor}',
+            'status_code': 400
+        }
+    if isinstance(error, stripe.StripeError):
+        return {
+            'error': str(error),
+            'status_code': error.http_status
+        }
+    return build_error_response(error)
+
+
+# ============================================================================
+# IDEMPOTENT WRITES
+# ============================================================================
+
+class IdempotentWrite:
+    """
+    Idempotency store bookkeeping of one write operation.
+
+    A caller-supplied key is checked against the idempotency store first, so a
+    retry gets the recorded result instead of running the operation again.
+    Without a key, a fresh one is generated just for the seller backend and
+    nothing is recorded. The client runs the operation between begin() and
+    finish() with forward_key.
+    """
+
+    def __init__(
+        self,
+        store: IdempotencyStore,
+        operation: str,
+        idempotency_key: Optional[str],
+        params: Dict[str, Any],
+        record_client_errors: bool = True
+    ) -> None:
+        """
+        Initialize the bookkeeping of one write.
+
+        Args:
+            store: Idempotency store of the client
+            operation: Operation name
+            idempotency_key: Key supplied by the caller, or None
+            params: Operation parameters the key is bound to
+            record_client_errors: Whether a 4xx result is recorded (see IdempotencyStore.finish())
+        """
+        self.store = store
+        self.operation = operation
+        self.idempotency_key = idempotency_key
+        self.record_client_errors = record_client_errors
+        self.forward_key = idempotency_key if idempotency_key is not None else new_idempotency_key()
+        self.fingerprint = fingerprint(params) if idempotency_key is not None else None
+
+    def begin(self) -> Optional[Dict[str, Any]]:
+        """
+        Claim the caller's key.
+
+        Returns:
+            The recorded result or an idempotency error, or None if the operation should run
+        """
+        if self.idempotency_key is None:
+            return None
+        return self.store.begin(self.operation, self.idempotency_key, self.fingerprint)
+
+    def failed_result(self) -> Dict[str, Any]:
+        """Result recorded if the operation raises before producing one."""
+        return {'error': f'{self.operation} failed', 'status_code': None}
+
+    def finish(self, result: Dict[str, Any]) -> None:
+        """
+        Record the operation's result under the caller's key.
+
+        Args:
+            result: Result dictionary of the operation
+        """
+        if self.idempotency_key is None:
+            return
+        self.store.finish(self.operation, self.idempotency_key, self.fingerprint, result, self.record_client_errors)
+
+
+# ============================================================================
+# CHECKOUT STATE
+# ============================================================================
+
+def remember_write(
+    checkout_state: CheckoutStateCache,
+    checkout_sessions: Optional[CheckoutSessionCache],
+    checkout_id: Optional[str],
+    result: Dict[str, Any],
+    ticket: int,
+    keep_total: bool = True
+) -> None:
+    """
+    Record the outcome of a checkout write in the checkout state and session caches.
+
+    The session is written through at the version this write produced, read
+    right after its own replace/invalidate, so any write sent after it makes
+    the cached session stale.
+
+    Args:
+        checkout_state: Checkout state cache of the client
+        checkout_sessions: Session cache to write the session through to, if any
+        checkout_id: ID of the written checkout (None if creation failed)
+        result: Response dictionary of the write
+        ticket: Checkout state ticket taken before the write was sent
+        keep_total: Whether the write's total may be used to complete the checkout
+            (False for completions and cancellations)
+    """
+    if checkout_id is None:
+        return
+
+    total_amount = payable_total(result) if keep_total else None
+    if total_amount is None:
+        version = checkout_state.invalidate(checkout_id)
+    else:
+        version = checkout_state.replace(checkout_id, total_amount)
+
+    if checkout_sessions is not None and 'error' not in result:
+        checkout_sessions.write(checkout_id, result, ticket, version)
+
+
+def get_checkout_flight_key(checkout_state: CheckoutStateCache, checkout_id: str) -> Tuple[Any, ...]:
+    """
+    Get the single flight key of a checkout read.
+
+    Concurrent reads share one request, but never one sent before the checkout's latest write.
+
+    Args:
+        checkout_state: Checkout state cache of the client
+        checkout_id: Unique identifier for the checkout session
+
+    Returns:
+        Single flight key
+    """
+    return ('get_checkout', checkout_id, checkout_state.write_version(checkout_id))
+
+
+# ============================================================================
+# BATCH OPERATIONS
+# ============================================================================
+
+def batch_error(message: str, status_code: Optional[int] = 400) -> Dict[str, Any]:
+    """
+    Build the error dictionary of a batch operation that could not run.
+
+    Args:
+        message: Error message
+        status_code: HTTP status code for the operation
+
+    Returns:
+        Dictionary with 'error' message and 'status_code'
+    """
+    return {
+        'error': message,
+        'status_code': status_code
+    }
+
+
+def check_batch_size(operations: List[Dict[str, Any]]) -> None:
+    """
+    Check that a batch is within BATCH_MAX_OPERATIONS.
+
+    Args:
+        operations: Operations of the batch
+
+    Raises:
+        ValueError: If the batch has more than BATCH_MAX_OPERATIONS operations
+    """
+    if len(operations) > BATCH_MAX_OPERATIONS:
+        raise ValueError(f'A batch can have at most {BATCH_MAX_OPERATIONS} operations')
+
+
+def resolve_batch_operation(operation: Any) -> Tuple[Optional[str], Dict[str, Any]]:
+    """
+    Map one batch operation to the client method running it.
+
+    Each operation is a dictionary with 'op' ('create', 'get', 'update' or 'cancel')
+    and the arguments of the matching method: 'checkout_id' (except for create),
+    'items', 'buyer', 'fulfillment_address', 'fulfillment_option_id' (update) and
+    'idempotency_key' (create).
+
+    Args:
+        operation: Operation dictionary
+
+    Returns:
+        Tuple of (method name, keyword arguments), or (None, error dictionary)
+        if the operation is invalid
+    """
+    if not isinstance(operation, dict):
+        return None, batch_error('Operation must be an object')
+
+    op = operation.get('op')
+    checkout_id = operation.get('checkout_id')
+
+    if op == 'create':
+        if 'items' not in operation:
+            return None, batch_error('Items are required')
+        return 'create_checkout', {
+            'items': operation['items'],
+            'buyer': operation.get('buyer'),
+            'fulfillment_address': operation.get('fulfillment_address'),
+            'idempotency_key': operation.get('idempotency_key')
+        }
+
+    if op not in BATCH_OPERATIONS:
+        return None, batch_error(f"Unsupported batch operation: {op}")
+    if not checkout_id:
+        return None, batch_error('checkout_id is required')
+
+    if op == 'get':
+        return 'get_checkout', {'checkout_id': checkout_id}
+    if op == 'update':
+        return 'update_checkout', {
+            'checkout_id': checkout_id,
+            'items': operation.get('items'),
+            'buyer': operation.get('buyer'),
+            'fulfillment_address': operation.get('fulfillment_address'),
+            'fulfillment_option_id': operation.get('fulfillment_option_id')
+        }
+    return 'cancel_checkout', {'checkout_id': checkout_id}
@@ -0,0 +1,485 @@
+"""
+Chat Backend ASGI Server
+
+Production serving mode for the chat backend. Exposes the same endpoints as
+server.py on an ASGI app (Quart) served by uvicorn with multiple worker
+processes. Checkout routes are fully async on AsyncACPClient; chat requests run
+the LLM service on a bounded thread pool so the event loop never blocks.
+
+Request validation and reply shaping shared with server.py live in
+server_common; this module only adds the Quart routing.
+"""
+
+import asyncio
+import os
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from typing import Dict, Any, Tuple, Optional, Generator, AsyncIterator
+from quart import Quart, request, jsonify, Response
+from quart_cors import cors
+from dotenv import load_dotenv
+
+from acp_client import ACPClient
+from async_acp_client import AsyncACPClient
+from checkout_session_cache import CheckoutSessionCache
+from checkout_state import CheckoutStateCache
+from conversation_store import CONVERSATION_STORE, ConversationStore, create_conversation_store
+from deadline import Deadline
+from llm_service import LLMService
+from server_common import (
+    CHAT_REQUEST_DEADLINE_SECONDS,
+    CHECKOUT_COMPLETE_DEADLINE_SECONDS,
+    CHECKOUT_BATCH_DEADLINE_SECONDS,
+    Reply,
+    RequestError,
+    batch_operations,
+    batch_reply,
+    checkout_reply,
+    complete_checkout_arguments,
+    create_checkout_arguments,
+    format_sse,
+    health_reply,
+    idempotency_headers,
+    process_chat,
+    product_page_arguments,
+    products_reply,
+    remember_read,
+    request_idempotency_key,
+    require_json,
+    stream_chat,
+    update_checkout_arguments
+)
+
+load_dotenv()
+
+
+# ============================================================================
+# CONSTANTS
+# ============================================================================
+
+CHAT_BACKEND_HOST: str = os.getenv('CHAT_BACKEND_HOST', '0.0.0.0')
+CHAT_BACKEND_PORT: int = int(os.getenv('CHAT_BACKEND_PORT', '9000'))
+CHAT_BACKEND_WORKERS: int = int(os.getenv('CHAT_BACKEND_WORKERS', str(os.cpu_count() or 1)))
+CHAT_BACKEND_GRACEFUL_SHUTDOWN_SECONDS: int = int(os.getenv('CHAT_BACKEND_GRACEFUL_SHUTDOWN_SECONDS', '30'))
+CHAT_WORKER_THREADS: int = int(os.getenv('CHAT_WORKER_THREADS', '64'))
+# Conversations must be visible to every worker, so several workers share them in SQLite by default
+ASGI_CONVERSATION_STORE: str = (
+    CONVERSATION_STORE if 'CONVERSATION_STORE' in os.environ or CHAT_BACKEND_WORKERS == 1 else 'sqlite'
+)
+
+
+# ============================================================================
+# APPLICATION SETUP
+# ============================================================================
+
+app = cors(Quart(__name__), allow_origin='*')
+
+chat_executor = ThreadPoolExecutor(max_workers=CHAT_WORKER_THREADS, thread_name_prefix='chat')
+
+# Created per worker process once it starts serving, so no connection pools or
+# SQLite handles are opened in the parent process before workers are forked
+llm_service: Optional[LLMService] = None
+conversation_store: Optional[ConversationStore] = None
+checkout_sessions: Optional[CheckoutSessionCache] = None
+acp_client: Optional[AsyncACPClient] = None
+
+
+@app.before_serving
+async def _startup() -> None:
+    """Create the worker's services; the async ACP client shares the chat tools' client state."""
+    global llm_service, conversation_store, checkout_sessions, acp_client
+    # Both ACP clients write their checkout writes through to the session cache
+    checkout_sessions = CheckoutSessionCache(CheckoutStateCache())
+    # LLMService executes its tools synchronously, so it keeps a blocking client
+    llm_service = LLMService(ACPClient(
+        checkout_state=checkout_sessions.checkout_state,
+        checkout_sessions=checkout_sessions
+    ))
+    conversation_store = create_conversation_store(ASGI_CONVERSATION_STORE)
+    acp_client = AsyncACPClient(
+        circuit_breakers=llm_service.acp_client.circuit_breakers,
+        checkout_state=checkout_sessions.checkout_state,
+        idempotency_store=llm_service.acp_client.idempotency_store,
+        checkout_sessions=checkout_sessions
+    )
+
+
+@app.after_serving
+async def _shutdown() -> None:
+    """Drain in-flight chat work and close pooled connections."""
+    # Waiting for the chat threads blocks, so it must not run on the event loop
+    await asyncio.get_running_loop().run_in_executor(None, chat_executor.shutdown)
+    if llm_service is not None:
+        llm_service.acp_client.close()
+    if acp_client is not None:
+        await acp_client.aclose()
+
+
+# ============================================================================
+# HELPER FUNCTIONS
+# ============================================================================
+
+async def _request_json() -> Dict[str, Any]:
+    """
+    Get the request's JSON body.
+
+    Returns:
+        The parsed JSON data from the request.
+
+    Raises:
+        RequestError: If request JSON is missing or invalid.
+    """
+    return require_json(await request.get_json(silent=True))
+
+
+def _json_reply(reply: Reply, headers: Optional[Dict[str, str]] = None) -> Tuple[Response, int, Dict[str, str]]:
+    """
+    Convert a (body, status code) reply to a Quart response.
+
+    Args:
+        reply: A tuple of (body, HTTP status code).
+        headers: Extra response headers (optional).
+
+    Returns:
+        A tuple of (JSON response, HTTP status code, headers).
+    """
+    body, status_code = reply
+    return jsonify(body), status_code, headers or {}
+
+
+@app.errorhandler(RequestError)
+async def _handle_request_error(error: RequestError) -> Tuple[Response, int, Dict[str, str]]:
+    """Reply to a request that cannot be served with its error and status code."""
+    return _json_reply(error.reply())
+
+
+# ============================================================================
+# PRODUCT ENDPOINTS
+# ============================================================================
+
+@app.route('/products', methods=['GET'])
+async def list_products() -> Tuple[Response, int, Dict[str, str]]:
+    """
+    Get list of available products.
+
+    Without query parameters the cached default listing is returned. With
+    'cursor' and/or 'limit' a single page of the full catalog is returned,
+    including 'next_cursor' for fetching the following page.
+
+    Query parameters:
+        - cursor: 'next_cursor' from the previous page (optional)
+        - limit: Page size between 1 and 100 (optional)
+
+    Returns:
+        JSON response containing list of products, or error response if request fails.
+    """
+    page = product_page_arguments(request.args)
+
+    if page is None:
+        result = await acp_client.list_products()
+    else:
+        result = await acp_client.list_products_page(**page)
+
+    return _json_reply(products_reply(result))
+
+
+@app.route('/products/cache/invalidate', methods=['POST'])
+async def invalidate_products_cache() -> Tuple[Response, int]:
+    """
+    Drop the cached product catalog so the next read refetches it from Stripe.
+
+    Returns:
+        JSON response containing the catalog cache statistics after invalidation.
+    """
+    acp_client.invalidate_catalog()
+    llm_service.acp_client.invalidate_catalog()
+    return jsonify(acp_client.catalog_cache.stats()), 200
+
+
+# ============================================================================
+# CHECKOUT ENDPOINTS
+# ============================================================================
+
+@app.route('/checkout/create', methods=['POST'])
+async def create_checkout() -> Tuple[Response, int, Dict[str, str]]:
+    """
+    Create a new checkout session with specified items.
+
+    Returns:
+        JSON response containing checkout session details, or error response.
+    """
+    arguments = create_checkout_arguments(await _request_json())
+
+    idempotency_key = request_idempotency_key(request.headers)
+    result = await acp_client.create_checkout(**arguments, idempotency_key=idempotency_key)
+
+    return _json_reply(
+        checkout_reply('create', result),
+        idempotency_headers(idempotency_key)
+    )
+
+
+@app.route('/checkout/<checkout_id>', methods=['GET'])
+async def get_checkout(checkout_id: str) -> Tuple[Response, int, Dict[str, str]]:
+    """
+    Retrieve an existing checkout session by ID.
+
+    Sessions seen in a recent create/update/complete/cancel response or GET are
+    served from the checkout session cache without calling the seller backend.
+
+    Args:
+        checkout_id: The unique identifier of the checkout session.
+
+    Returns:
+        JSON response containing checkout session details, or error response.
+    """
+    cached = checkout_sessions.get(checkout_id)
+    if cached is not None:
+        return _json_reply((cached, 200))
+
+    ticket = checkout_sessions.ticket()
+    result = await acp_client.get_checkout(checkout_id)
+
+    remember_read(checkout_sessions, checkout_id, result, ticket)
+    return _json_reply(checkout_reply('get', result))
+
+
+@app.route('/checkout/<checkout_id>/update', methods=['PUT'])
+async def update_checkout(checkout_id: str) -> Tuple[Response, int, Dict[str, str]]:
+    """
+    Update an existing checkout session.
+
+    Args:
+        checkout_id: The unique identifier of the checkout session to update.
+
+    Returns:
+        JSON response containing updated checkout session details, or error response.
+    """
+    arguments = update_checkout_arguments(checkout_id, await _request_json())
+
+    result = await acp_client.update_checkout(**arguments)
+
+    return _json_reply(checkout_reply('update', result))
+
+
+@app.route('/checkout/<checkout_id>/complete', methods=['POST'])
+async def complete_checkout(checkout_id: str) -> Tuple[Response, int, Dict[str, str]]:
+    """
+    Complete a checkout session with payment.
+
+    Args:
+        checkout_id: The unique identifier of the checkout session to complete.
+
+    Returns:
+        JSON response containing completion details, or error response.
+    """
+    deadline = Deadline(CHECKOUT_COMPLETE_DEADLINE_SECONDS)
+    arguments = complete_checkout_arguments(checkout_id, await _request_json())
+
+    idempotency_key = request_idempotency_key(request.headers)
+    result = await acp_client.complete_checkout(**arguments, deadline=deadline, idempotency_key=idempotency_key)
+
+    return _json_reply(
+        checkout_reply('complete', result),
+        idempotency_headers(idempotency_key)
+    )
+
+
+@app.route('/checkout/<checkout_id>/cancel', methods=['POST'])
+async def cancel_checkout(checkout_id: str) -> Tuple[Response, int, Dict[str, str]]:
+    """
+    Cancel an existing checkout session.
+
+    Args:
+        checkout_id: The unique identifier of the checkout session to cancel.
+
+    Returns:
+        JSON response containing cancellation details, or error response.
+    """
+    result = await acp_client.cancel_checkout(checkout_id)
+
+    return _json_reply(checkout_reply('cancel', result))
+
+
+@app.route('/checkout/batch', methods=['POST'])
+async def batch_checkout() -> Tuple[Response, int, Dict[str, str]]:
+    """
+    Run many create/get/update/cancel checkout operations concurrently.
+
+    Request body: same as POST /checkout/batch on server.py.
+
+    Returns:
+        JSON response with 'results': one entry per operation, in order, holding the
+        'status_code' and 'body' the matching single-operation endpoint would return.
+    """
+    deadline = Deadline(CHECKOUT_BATCH_DEADLINE_SECONDS)
+    operations = batch_operations(await _request_json())
+
+    ticket = checkout_sessions.ticket()
+    results = await acp_client.batch(operations, deadline=deadline)
+
+    return _json_reply(batch_reply(checkout_sessions, operations, results, ticket))
+
+
+# ============================================================================
+# CHAT ENDPOINTS
+# ============================================================================
+
+@app.route('/chat', methods=['POST'])
+async def chat() -> Tuple[Response, int]:
+    """
+    Process chat messages through the LLM service on the chat thread pool.
+
+    Request body: see server_common.process_chat() (conversation or stateless mode).
+
+    Returns:
+        JSON response containing the LLM's response message (with 'conversation_id' in
+        conversation mode), 400 for a malformed message, or 404 if the conversation is
+        unknown or expired (also when it expires while the turn runs).
+    """
+    deadline = Deadline(CHAT_REQUEST_DEADLINE_SECONDS)
+    request_data = await _request_json()
+
+    response = await asyncio.get_running_loop().run_in_executor(
+        chat_executor, process_chat, llm_service, conversation_store, request_data, deadline
+    )
+    return jsonify(response), 200
+
+
+def _close_events(events: Generator[Dict[str, Any], None, None], pending: Optional[Future]) -> None:
+    """
+    Close a chat event stream once its pending step is done (blocking; runs on the chat thread pool).
+
+    Args:
+        events: Blocking generator of chat events.
+        pending: Step of the generator still running on the pool, if any.
+    """
+    if pending is not None:
+        wait([pending])
+    events.close()
+
+
+async def _format_sse(events: Generator[Dict[str, Any], None, None]) -> AsyncIterator[str]:
+    """
+    Format chat events as Server-Sent Events, pulling each event on the chat thread pool.
+
+    When the response stops early (client disconnect or cancellation), the events
+    are closed on the pool, so the LLM call's rate limiter slot and running tools
+    are released right away rather than whenever the generator is collected.
+
+    Args:
+        events: Blocking generator of events with 'event' name and 'data' payload.
+
+    Yields:
+        SSE frames ready to be written to the response.
+    """
+    end_of_stream = object()
+    pending: Optional[Future] = None
+
+    try:
+        while True:
+            pending = chat_executor.submit(next, events, end_of_stream)
+            event = await asyncio.wrap_future(pending)
+            pending = None
+            if event is end_of_stream:
+                return
+            yield format_sse(event)
+    finally:
+        # A generator cannot be closed while a step runs, so closing waits for that step first
+        await asyncio.wrap_future(chat_executor.submit(_close_events, events, pending))
+
+
+@app.route('/chat/stream', methods=['POST'])
+async def chat_stream() -> Response:
+    """
+    Process chat messages through the LLM service, streaming the response as Server-Sent Events.
+
+    Request body: same as /chat (conversation or stateless mode).
+
+    Returns:
+        A text/event-stream response emitting 'token', 'tool_call', 'tool_result',
+        'message' (the final response, as returned by /chat) and 'done' events; an 'error'
+        event precedes 'message' if the conversation expired while the turn ran.
+    """
+    deadline = Deadline(CHAT_REQUEST_DEADLINE_SECONDS)
+    request_data = await _request_json()
+
+    # Starting a conversation turn reads the conversation store, so it runs off the event loop too
+    events = await asyncio.get_running_loop().run_in_executor(
+        chat_executor, stream_chat, llm_service, conversation_store, request_data, deadline
+    )
+
+    response = Response(_format_sse(events), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    response.timeout = None
+    return response
+
+
+# ============================================================================
+# OPERATIONAL ENDPOINTS
+# ============================================================================
+
+@app.route('/health', methods=['GET'])
+async def health() -> Tuple[Response, int, Dict[str, str]]:
+    """
+    Report the health of the upstreams this backend depends on (see server_common.health_reply()).
+
+    Returns:
+        JSON response containing the overall status and each upstream's circuit breaker state.
+    """
+    return _json_reply(health_reply(llm_service.acp_client.circuit_stats()))
+
+
+@app.route('/stats', methods=['GET'])
+async def stats() -> Tuple[Response, int]:
+    """
+    Get runtime statistics used for capacity planning.
+
+    Returns:
+        JSON response containing connection pool, cache, product index, context window and conversation statistics.
+    """
+    return jsonify({
+        'http_pool': acp_client.pool_stats(),
+        'llm_http_pool': llm_service.acp_client.pool_stats(),
+        'catalog_cache': acp_client.catalog_cache.stats(),
+        'checkout_state': acp_client.checkout_state.stats(),
+        'checkout_sessions': checkout_sessions.stats(),
+        'idempotency': acp_client.idempotency_store.stats(),
+        'single_flight': acp_client.single_flight.stats(),
+        'llm_single_flight': llm_service.acp_client.single_flight.stats(),
+        'llm_catalog_cache': llm_service.acp_client.catalog_cache.stats(),
+        'product_index': llm_service.product_index.stats(),
+        'context_window': llm_service.context_window.stats(),
+        'response_cache': llm_service.response_cache.stats(),
+        'intent_router': llm_service.intent_router.stats(),
+        'llm_backend': llm_service.backend.stats(),
+        'llm_calls': llm_service.llm_caller.stats(),
+        'llm_limiter': llm_service.llm_limiter.stats(),
+        'circuit_breakers': llm_service.acp_client.circuit_stats(),
+        'conversations': conversation_store.stats()
+    }), 200
+
+
+# ============================================================================
+# APPLICATION ENTRY POINT
+# ============================================================================
+
+if __name__ == '__main__':
+    import uvicorn
+
+    print(f"\nChat Backend ASGI Server Starting...")
+    print(f"Port: {CHAT_BACKEND_PORT}")
+    print(f"Workers: {CHAT_BACKEND_WORKERS}")
+    print(f"Conversation store: {ASGI_CONVERSATION_STORE}")
+    if CHAT_BACKEND_WORKERS > 1 and ASGI_CONVERSATION_STORE == 'memory':
+        print("Warning: the memory conversation store is per worker; conversations will lose history "
+              "when a request reaches another worker. Use CONVERSATION_STORE=sqlite.")
+    print(f"\n")
+
+    uvicorn.run(
+        'asgi:app',
+        host=CHAT_BACKEND_HOST,
+        port=CHAT_BACKEND_PORT,
+        workers=CHAT_BACKEND_WORKERS,
+        timeout_graceful_shutdown=CHAT_BACKEND_GRACEFUL_SHUTDOWN_SECONDS
+    )
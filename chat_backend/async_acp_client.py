@@ -0,0 +1,697 @@
+"""
+Async Agentic Commerce Protocol Client
+
+Non-blocking counterpart of ACPClient built on httpx. All checkout operations
+and the SPT issuance call share one async connection pool, so a single event
+loop can keep thousands of checkouts in flight at once.
+
+Configuration, payloads and response shaping shared with ACPClient live in
+acp_common; this module only adds the httpx-based I/O.
+"""
+
+import asyncio
+import httpx
+from typing import Optional, Dict, List, Any, AsyncIterator, Awaitable, Callable
+import os
+import stripe
+from dotenv import load_dotenv
+
+from acp_common import (
+    SELLER_BACKEND_URL,
+    DEFAULT_PAYMENT_PROVIDER,
+    PRODUCT_LIST_LIMIT,
+    PRODUCT_PAGE_SIZE,
+    HTTP_POOL_MAXSIZE,
+    HTTP_POOL_MAX_IDLE_SECONDS,
+    HTTP_CONNECT_TIMEOUT_SECONDS,
+    CHECKOUT_READ_TIMEOUT_SECONDS,
+    COMPLETE_READ_TIMEOUT_SECONDS,
+    SPT_READ_TIMEOUT_SECONDS,
+    STRIPE_TIMEOUT_SECONDS,
+    BATCH_MAX_CONCURRENCY,
+    IdempotentWrite,
+    batch_error,
+    build_complete_params,
+    build_complete_payload,
+    build_create_payload,
+    build_error_response,
+    build_headers,
+    build_product_page,
+    build_product_page_error,
+    build_product_page_params,
+    build_spt_form_data,
+    build_spt_headers,
+    build_update_payload,
+    catalog_deadline_error,
+    check_batch_size,
+    extract_total_amount_from_checkout,
+    get_checkout_flight_key,
+    remember_write,
+    resolve_batch_operation,
+    spt_issue_url,
+    validate_method
+)
+from catalog_cache import CatalogCache
+from checkout_session_cache import CheckoutSessionCache
+from checkout_state import CheckoutStateCache
+from circuit_breaker import CircuitBreaker, CircuitOpenError, SELLER_BACKEND, SPT_SERVER, create_circuit_breakers
+from deadline import Deadline, DeadlineExceeded, resolve_timeout
+from idempotency import IdempotencyStore, create_idempotency_store
+from single_flight import AsyncSingleFlight
+
+
+load_dotenv()
+
+# ============================================================================
+# CONSTANTS
+# ============================================================================
+
+# Total connections across all hosts in the shared async pool
+ASYNC_HTTP_MAX_CONNECTIONS: int = int(os.getenv('ASYNC_HTTP_MAX_CONNECTIONS', '1000'))
+
+# Failures of httpx that map to 504
+HTTPX_TIMEOUT_ERRORS = (httpx.TimeoutException,)
+
+
+# ============================================================================
+# HELPER FUNCTIONS
+# ============================================================================
+
+def _build_async_error_response(error: Exception) -> Dict[str, Any]:
+    """
+    Convert an httpx failure to the client's error dictionary format.
+
+    Args:
+        error: Exception raised while calling an upstream service
+
+    Returns:
+        Dictionary with 'error' message and 'status_code'
+    """
+    return build_error_response(error, HTTPX_TIMEOUT_ERRORS)
+
+
+def _build_httpx_timeout(read_timeout: float, deadline: Optional[Deadline]) -> httpx.Timeout:
+    """
+    Build an httpx timeout for one operation, clipped to the request deadline.
+
+    Args:
+        read_timeout: Read timeout budget for the operation in seconds
+        deadline: Optional end-to-end deadline of the incoming request
+
+    Returns:
+        httpx.Timeout instance
+
+    Raises:
+        DeadlineExceeded: If the deadline has already expired
+    """
+    connect, read = resolve_timeout(HTTP_CONNECT_TIMEOUT_SECONDS, read_timeout, deadline)
+    return httpx.Timeout(read, connect=connect, pool=connect)
+
+
+# ============================================================================
+# ASYNC ACP CLIENT CLASS
+# ============================================================================
+
+class AsyncACPClient:
+    """
+    Async client for interacting with ACP-compliant seller backend.
+
+    Exposes the same operations as ACPClient as coroutines. The underlying
+    httpx.AsyncClient is bound to the event loop it is first used on, so
+    create one AsyncACPClient per event loop and close it with aclose().
+    """
+
+    def __init__(
+        self,
+        base_url: str = SELLER_BACKEND_URL,
+        max_connections: int = ASYNC_HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections: int = HTTP_POOL_MAXSIZE,
+        max_idle_seconds: float = HTTP_POOL_MAX_IDLE_SECONDS,
+        circuit_breakers: Optional[Dict[str, CircuitBreaker]] = None,
+        checkout_state: Optional[CheckoutStateCache] = None,
+        idempotency_store: Optional[IdempotencyStore] = None,
+        checkout_sessions: Optional[CheckoutSessionCache] = None
+    ) -> None:
+        """
+        Initialize async ACP client with seller backend URL.
+
+        Args:
+            base_url: Base URL of the seller backend (defaults to config value)
+            max_connections: Maximum concurrent connections in the shared pool
+            max_keepalive_connections: Maximum idle connections kept for reuse
+            max_idle_seconds: Idle time after which pooled connections are closed
+            circuit_breakers: Circuit breakers per upstream, to share them with another client
+                (defaults to new ones)
+            checkout_state: Checkout state cache, to share it with another client (defaults to a new one)
+            idempotency_store: Idempotency store, to share it with another client (defaults to a new store of the configured backend)
+            checkout_sessions: Session cache that sessions returned by writes are written through to (optional);
+                it must be tied to checkout_state
+        """
+        self.base_url = base_url.rstrip('/')
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=max_idle_seconds
+        )
+        self.stripe = stripe.StripeClient(
+            os.environ["FACILITATOR_API_KEY"],
+            http_client=stripe.HTTPXClient(timeout=STRIPE_TIMEOUT_SECONDS)
+        )
+        self._client: Optional[httpx.AsyncClient] = None
+        self._requests_sent = 0
+        self._in_flight = 0
+        self._background_tasks: set = set()
+
+        self.circuit_breakers = circuit_breakers if circuit_breakers is not None else create_circuit_breakers()
+        self.catalog_cache = CatalogCache()
+        self.checkout_state = checkout_state if checkout_state is not None else CheckoutStateCache()
+        self.idempotency_store = idempotency_store if idempotency_store is not None else create_idempotency_store()
+        self.checkout_sessions = checkout_sessions
+        self.single_flight = AsyncSingleFlight()
+        # Shared by all batches, so concurrent batches together stay within the bound
+        self._batch_slots = asyncio.Semaphore(BATCH_MAX_CONCURRENCY)
+
+    async def __aenter__(self) -> 'AsyncACPClient':
+        return self
+
+    async def __aexit__(self, *exc_info: Any) -> None:
+        await self.aclose()
+
+    def _get_client(self) -> httpx.AsyncClient:
+        """
+        Return the shared async client, creating it on first use.
+
+        Returns:
+            The pooled httpx.AsyncClient
+        """
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(limits=self.limits)
+        return self._client
+
+    def pool_stats(self) -> Dict[str, Any]:
+        """
+        Get connection pool configuration and usage counters.
+
+        Returns:
+            Dictionary with pool limits and request counters
+        """
+        return {
+            'max_connections': self.limits.max_connections,
+            'max_keepalive_connections': self.limits.max_keepalive_connections,
+            'max_idle_seconds': self.limits.keepalive_expiry,
+            'requests_sent': self._requests_sent,
+            'in_flight': self._in_flight
+        }
+
+    def circuit_stats(self) -> Dict[str, Any]:
+        """
+        Get the circuit breaker state of each upstream.
+
+        Returns:
+            Dictionary of upstream name to circuit statistics
+        """
+        return {upstream: breaker.stats() for upstream, breaker in self.circuit_breakers.items()}
+
+    async def aclose(self) -> None:
+        """Close all pooled connections."""
+        for task in list(self._background_tasks):
+            task.cancel()
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def _send(self, upstream: str, method: str, url: str, **kwargs: Any) -> httpx.Response:
+        """
+        Send a request over the shared pool through the upstream's circuit breaker
+        and track in-flight counters.
+
+        Args:
+            upstream: Name of the upstream's circuit breaker
+            method: HTTP method
+            url: Absolute request URL
+            **kwargs: Extra arguments passed to httpx
+
+        Returns:
+            The httpx response
+
+        Raises:
+            CircuitOpenError: If the upstream's circuit is open
+            httpx.HTTPError: If the request fails
+        """
+        breaker = self.circuit_breakers[upstream]
+        breaker.before_call()
+
+        self._in_flight += 1
+        self._requests_sent += 1
+        try:
+            response = await self._get_client().request(method, url, **kwargs)
+        except BaseException:
+            breaker.record_failure()
+            raise
+        finally:
+            self._in_flight -= 1
+
+        if response.status_code >= 500:
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+        return response
+
+    async def _make_request(
+        self,
+        method: str,
+        endpoint: str,
+        data: Optional[Dict[str, Any]] = None,
+        read_timeout: float = CHECKOUT_READ_TIMEOUT_SECONDS,
+        deadline: Optional[Deadline] = None,
+        idempotency_key: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Make HTTP request to seller backend.
+
+        Args:
+            method: HTTP method (GET, POST, PUT)
+            endpoint: API endpoint path
+            data: Optional request body data
+            read_timeout: Read timeout budget for this operation in seconds
+            deadline: Optional end-to-end deadline; the timeout is clipped to what remains
+            idempotency_key: Optional Idempotency-Key header value
+
+        Returns:
+            JSON response as dictionary, or error dictionary if request fails
+
+        Raises:
+            ValueError: If unsupported HTTP method is used
+        """
+        url = f"{self.base_url}{endpoint}"
+        headers = build_headers(idempotency_key)
+
+        # Step 1: Validate HTTP method
+        validate_method(method)
+
+        # Step 2: Execute HTTP request over the shared pool
+        try:
+            response = await self._send(
+                SELLER_BACKEND,
+                method,
+                url,
+                json=data if method != 'GET' else None,
+                headers=headers,
+                timeout=_build_httpx_timeout(read_timeout, deadline)
+            )
+
+            # Step 3: Raise exception for HTTP errors
+            response.raise_for_status()
+
+            # Step 4: Return JSON response
+            return response.json()
+
+        except (httpx.HTTPError, DeadlineExceeded, CircuitOpenError) as e:
+            # Step 5: Convert HTTP exceptions to error dictionary format
+            return _build_async_error_response(e)
+
+    async def _run_idempotent(
+        self,
+        operation: str,
+        idempotency_key: Optional[str],
+        params: Dict[str, Any],
+        run: Callable[[str], Awaitable[Dict[str, Any]]],
+        record_client_errors: bool = True
+    ) -> Dict[str, Any]:
+        """
+        Run a write operation under an idempotency key (see IdempotentWrite).
+
+        Args:
+            operation: Operation name
+            idempotency_key: Key supplied by the caller, or None
+            params: Operation parameters the key is bound to
+            run: Coroutine function running the operation with the key to forward
+            record_client_errors: Whether a 4xx result is recorded (see IdempotencyStore.finish())
+
+        Returns:
+            Result dictionary of the operation, a recorded result, or an idempotency error
+        """
+        write = IdempotentWrite(self.idempotency_store, operation, idempotency_key, params, record_client_errors)
+        recorded = write.begin()
+        if recorded is not None:
+            return recorded
+
+        result = write.failed_result()
+        try:
+            result = await run(write.forward_key)
+        finally:
+            write.finish(result)
+        return result
+
+    async def _fetch_products(self) -> Dict[str, Any]:
+        """
+        Fetch the product catalog from Stripe, bypassing the cache.
+
+        Returns:
+            Dictionary containing products list
+        """
+        return await self.stripe.v1.products.list_async(params={'limit': PRODUCT_LIST_LIMIT})
+
+    async def _refresh_catalog(self) -> None:
+        """Reload a stale catalog in the background."""
+        try:
+            self.catalog_cache.store(await self.single_flight.do(('list_products',), self._fetch_products))
+        except Exception as e:
+            print(f"Catalog refresh failed: {e}")
+            self.catalog_cache.refresh_failed()
+
+    async def list_products(self, deadline: Optional[Deadline] = None) -> Dict[str, Any]:
+        """
+        Get list of available products, served from the catalog cache when possible.
+
+        Args:
+            deadline: Optional end-to-end deadline of the incoming request
+
+        Returns:
+            Dictionary containing products list
+        """
+        entry = self.catalog_cache.lookup()
+        if entry is not None:
+            products, refresh_claimed = entry
+            if refresh_claimed:
+                task = asyncio.create_task(self._refresh_catalog())
+                self._background_tasks.add(task)
+                task.add_done_callback(self._background_tasks.discard)
+            return products
+
+        if deadline is not None and deadline.expired():
+            return catalog_deadline_error()
+
+        products = await self.single_flight.do(('list_products',), self._fetch_products)
+        self.catalog_cache.store(products)
+        return products
+
+    def invalidate_catalog(self) -> None:
+        """Drop the cached product catalog so the next read refetches it."""
+        self.catalog_cache.invalidate()
+
+    async def list_products_page(
+        self,
+        cursor: Optional[str] = None,
+        limit: int = PRODUCT_PAGE_SIZE,
+        deadline: Optional[Deadline] = None
+    ) -> Dict[str, Any]:
+        """
+        Get one page of the product catalog using Stripe cursor pagination.
+
+        Args:
+            cursor: ID of the last product of the previous page (None for the first page)
+            limit: Page size, capped at Stripe's maximum of 100
+            deadline: Optional end-to-end deadline of the incoming request
+
+        Returns:
+            Dictionary with 'data', 'has_more' and 'next_cursor', or an error dictionary
+            (status 400 for a cursor Stripe rejects)
+        """
+        if deadline is not None and deadline.expired():
+            return catalog_deadline_error()
+
+        try:
+            return await self._fetch_product_page(cursor, limit)
+        except (stripe.StripeError, CircuitOpenError) as e:
+            print(f"Product page error: {e}")
+            return build_product_page_error(e, cursor)
+
+    async def _fetch_product_page(self, cursor: Optional[str], limit: int) -> Dict[str, Any]:
+        """
+        Fetch one page of the product catalog from Stripe, sharing concurrent identical requests.
+
+        Args:
+            cursor: ID of the last product of the previous page (None for the first page)
+            limit: Page size, capped at Stripe's maximum of 100
+
+        Returns:
+            Dictionary with 'data', 'has_more' and 'next_cursor'
+
+        Raises:
+            stripe.StripeError: If Stripe rejects the request
+        """
+        params = build_product_page_params(cursor, limit)
+
+        async def fetch_page() -> Dict[str, Any]:
+            return build_product_page(await self.stripe.v1.products.list_async(params=params))
+
+        return await self.single_flight.do(('list_products_page', cursor, params['limit']), fetch_page)
+
+    async def iter_products(self, page_size: int = PRODUCT_PAGE_SIZE) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Stream the full product catalog, fetching one page at a time.
+
+        Args:
+            page_size: Number of products fetched per upstream request
+
+        Yields:
+            Product dictionaries in catalog order
+        """
+        cursor: Optional[str] = None
+
+        while True:
+            page = await self._fetch_product_page(cursor, page_size)
+            for product in page['data']:
+                yield product
+
+            if not page['has_more']:
+                return
+            cursor = page['next_cursor']
+
+    async def create_checkout(
+        self,
+        items: List[Dict[str, Any]],
+        buyer: Optional[Dict[str, str]] = None,
+        fulfillment_address: Optional[Dict[str, str]] = None,
+        deadline: Optional[Deadline] = None,
+        idempotency_key: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Create a new checkout session.
+
+        Args:
+            items: List of items with id and quantity
+            buyer: Optional buyer information (first_name, last_name, email, phone_number)
+            fulfillment_address: Optional shipping address
+            deadline: Optional end-to-end deadline of the incoming request
+            idempotency_key: Optional key making retries of this creation safe
+
+        Returns:
+            Dictionary containing checkout session details
+        """
+        data = build_create_payload(items, buyer, fulfillment_address)
+
+        async def run(key: str) -> Dict[str, Any]:
+            ticket = self.checkout_state.ticket()
+            result = await self._make_request('POST', '/checkout_sessions', data, deadline=deadline, idempotency_key=key)
+            remember_write(self.checkout_state, self.checkout_sessions, result.get('id'), result, ticket)
+            return result
+
+        return await self._run_idempotent('create_checkout', idempotency_key, data, run)
+
+    async def get_checkout(self, checkout_id: str, deadline: Optional[Deadline] = None) -> Dict[str, Any]:
+        """
+        Retrieve an existing checkout session.
+
+        Args:
+            checkout_id: Unique identifier for the checkout session
+            deadline: Optional end-to-end deadline of the incoming request
+
+        Returns:
+            Dictionary containing checkout session details
+        """
+        return await self.single_flight.do(
+            get_checkout_flight_key(self.checkout_state, checkout_id),
+            lambda: self._fetch_checkout(checkout_id, deadline)
+        )
+
+    async def _fetch_checkout(self, checkout_id: str, deadline: Optional[Deadline]) -> Dict[str, Any]:
+        """
+        Fetch a checkout session from the seller backend.
+
+        Args:
+            checkout_id: Unique identifier for the checkout session
+            deadline: Optional end-to-end deadline of the incoming request
+
+        Returns:
+            Dictionary containing checkout session details
+        """
+        return await self._make_request('GET', f'/checkout_sessions/{checkout_id}', deadline=deadline)
+
+    async def update_checkout(
+        self,
+        checkout_id: str,
+        items: Optional[List[Dict[str, Any]]] = None,
+        buyer: Optional[Dict[str, str]] = None,
+        fulfillment_address: Optional[Dict[str, str]] = None,
+        fulfillment_option_id: Optional[str] = None,
+        deadline: Optional[Deadline] = None
+    ) -> Dict[str, Any]:
+        """
+        Update an existing checkout session.
+
+        Args:
+            checkout_id: ID of the checkout to update
+            items: Optional updated items list
+            buyer: Optional updated buyer information
+            fulfillment_address: Optional updated shipping address
+            fulfillment_option_id: Optional selected fulfillment option
+            deadline: Optional end-to-end deadline of the incoming request
+
+        Returns:
+            Dictionary containing updated checkout session details
+        """
+        data = build_update_payload(items, buyer, fulfillment_address, fulfillment_option_id)
+
+        # Stop completions from using the old total while the update is in flight
+        ticket = self.checkout_state.invalidate(checkout_id)
+        result = await self._make_request('POST', f'/checkout_sessions/{checkout_id}', data, deadline=deadline)
+        remember_write(self.checkout_state, self.checkout_sessions, checkout_id, result, ticket)
+        return result
+
+    async def complete_checkout(
+        self,
+        checkout_id: str,
+        payment_token: str,
+        payment_provider: str = DEFAULT_PAYMENT_PROVIDER,
+        billing_address: Optional[Dict[str, str]] = None,
+        deadline: Optional[Deadline] = None,
+        idempotency_key: Optional[str] = None,
+        record_client_errors: bool = True
+    ) -> Dict[str, Any]:
+        """
+        Complete a checkout with payment.
+
+        Args:
+            checkout_id: ID of the checkout to complete
+            payment_token: Payment token from payment provider
+            payment_provider: Payment provider name (default: stripe)
+            billing_address: Optional billing address
+            deadline: Optional end-to-end deadline shared by all calls made here
+            idempotency_key: Optional key making retries of this completion safe
+            record_client_errors: Whether a 4xx result is recorded under idempotency_key (False for
+                keys derived from the arguments, since a 4xx may depend on the checkout's current state)
+
+        Returns:
+            Dictionary containing completion result
+
+        Raises:
+            ValueError: If total amount cannot be extracted from checkout
+        """
+        return await self._run_idempotent(
+            'complete_checkout',
+            idempotency_key,
+            build_complete_params(checkout_id, payment_token, payment_provider, billing_address),
+            lambda key: self._complete_checkout(
+                checkout_id, payment_token, payment_provider, billing_address, deadline, key
+            ),
+            record_client_errors
+        )
+
+    async def _complete_checkout(
+        self,
+        checkout_id: str,
+        payment_token: str,
+        payment_provider: str,
+        billing_address: Optional[Dict[str, str]],
+        deadline: Optional[Deadline],
+        idempotency_key: str
+    ) -> Dict[str, Any]:
+        """Complete a checkout with payment; see complete_checkout() and ACPClient._complete_checkout()."""
+        ticket = self.checkout_state.ticket()
+
+        # Step 1: Get the total amount; the cached total is only used if this process made the
+        # checkout's latest write, otherwise the checkout is read from the seller
+        total_amount = self.checkout_state.total(checkout_id)
+        if total_amount is None:
+            checkout_response = await self.get_checkout(checkout_id, deadline=deadline)
+            if 'error' in checkout_response:
+                return checkout_response
+            total_amount = extract_total_amount_from_checkout(checkout_response)
+
+        # Step 2: Exchange payment token for SPT token (mock SPT server, see ACPClient)
+        try:
+            get_pst_token_response = await self._send(
+                SPT_SERVER,
+                'POST',
+                spt_issue_url(),
+                data=build_spt_form_data(payment_token, total_amount),
+                headers=build_spt_headers(idempotency_key),
+                timeout=_build_httpx_timeout(SPT_READ_TIMEOUT_SECONDS, deadline)
+            )
+        except (httpx.HTTPError, DeadlineExceeded, CircuitOpenError) as e:
+            return _build_async_error_response(e)
+
+        spt_token_id = get_pst_token_response.json()['id']
+
+        # Step 3: Send completion request
+        result = await self._make_request(
+            'POST',
+            f'/checkout_sessions/{checkout_id}/complete',
+            build_complete_payload(spt_token_id, payment_provider, billing_address),
+            read_timeout=COMPLETE_READ_TIMEOUT_SECONDS,
+            deadline=deadline,
+            idempotency_key=idempotency_key
+        )
+        remember_write(self.checkout_state, self.checkout_sessions, checkout_id, result, ticket, keep_total=False)
+        return result
+
+    async def cancel_checkout(self, checkout_id: str, deadline: Optional[Deadline] = None) -> Dict[str, Any]:
+        """
+        Cancel an existing checkout session.
+
+        Args:
+            checkout_id: ID of the checkout session to cancel
+            deadline: Optional end-to-end deadline of the incoming request
+
+        Returns:
+            Dictionary containing cancellation result
+        """
+        ticket = self.checkout_state.invalidate(checkout_id)
+        result = await self._make_request('POST', f'/checkout_sessions/{checkout_id}/cancel', {}, deadline=deadline)
+        remember_write(self.checkout_state, self.checkout_sessions, checkout_id, result, ticket, keep_total=False)
+        return result
+
+    async def _run_batch_operation(self, operation: Any, deadline: Optional[Deadline]) -> Dict[str, Any]:
+        """
+        Run one operation of a batch once a slot is free, turning an unexpected exception into that item's error.
+
+        Args:
+            operation: Operation dictionary (see batch())
+            deadline: Optional end-to-end deadline of the batch
+
+        Returns:
+            Result dictionary of the operation, or an error dictionary if it is invalid or failed
+        """
+        method_name, arguments = resolve_batch_operation(operation)
+        if method_name is None:
+            return arguments
+
+        async with self._batch_slots:
+            try:
+                return await getattr(self, method_name)(deadline=deadline, **arguments)
+            except Exception as e:
+                return batch_error(str(e), status_code=500)
+
+    async def batch(self, operations: List[Dict[str, Any]], deadline: Optional[Deadline] = None) -> List[Dict[str, Any]]:
+        """
+        Run many checkout operations concurrently, at most BATCH_MAX_CONCURRENCY at a time.
+
+        Operations are described in acp_common.resolve_batch_operation().
+
+        Args:
+            operations: Operations to run
+            deadline: Optional end-to-end deadline shared by all operations
+
+        Returns:
+            One result dictionary per operation, in order
+
+        Raises:
+            ValueError: If the batch has more than BATCH_MAX_OPERATIONS operations
+        """
+        check_batch_size(operations)
+
+        return list(await asyncio.gather(
+            *(self._run_batch_operation(operation, deadline) for operation in operations)
+        ))
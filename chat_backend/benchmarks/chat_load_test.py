@@ -0,0 +1,150 @@
+"""
+Chat Load Test
+
+Drives POST /chat on a running chat backend with concurrent clients and
+reports throughput and latency percentiles. Start the backend with the mock
+LLM backend to measure the chat path offline:
+
+    LLM_BACKEND=mock MOCK_LLM_LATENCY=normal:0.3,0.1 python server.py
+    python benchmarks/chat_load_test.py --concurrency 32 --duration 30
+
+The default prompts only trigger frontend-signal tools, so neither the seller
+backend nor Stripe is needed.
+
+With --cancel-streams N it instead opens N POST /chat/stream requests, drops
+each connection after the first event, and checks that the backend releases
+every LLM rate limiter slot (llm_limiter.in_flight in GET /stats drops to 0):
+
+    python benchmarks/chat_load_test.py --cancel-streams 8
+"""
+
+import argparse
+import itertools
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+import requests
+
+
+# ============================================================================
+# CONSTANTS
+# ============================================================================
+
+DEFAULT_PROMPTS: List[str] = [
+    "Please add item_1 to my cart",
+    "Add item_2 to my cart as well",
+    "I think I am done, let's pay",
+    "Hello, what can you help me with?",
+]
+
+# How long cancelled streams may take to release their rate limiter slots
+SLOT_RELEASE_TIMEOUT_SECONDS: float = 10.0
+
+
+# ============================================================================
+# HELPER FUNCTIONS
+# ============================================================================
+
+def percentile(samples: List[float], fraction: float) -> float:
+    """Nearest-rank percentile of sorted samples"""
+    index = min(len(samples) - 1, max(0, round(fraction * len(samples)) - 1))
+    return samples[index]
+
+
+def run_client(url: str, prompts: "itertools.cycle[str]", stop_at: float, results: Dict[str, list], lock: threading.Lock) -> None:
+    """Send chat requests back to back until stop_at, recording latencies and errors"""
+    session = requests.Session()
+    while time.monotonic() < stop_at:
+        with lock:
+            prompt = next(prompts)
+
+        started = time.monotonic()
+        try:
+            response = session.post(url, json={"messages": [{"role": "user", "content": prompt}]}, timeout=120)
+            ok = response.status_code == 200
+        except requests.RequestException:
+            ok = False
+        elapsed = time.monotonic() - started
+
+        with lock:
+            results['latencies' if ok else 'errors'].append(elapsed)
+
+
+def cancel_stream(url: str, prompt: str) -> bool:
+    """Open a chat stream and drop the connection after its first event; True if an event arrived"""
+    with requests.post(url, json={"messages": [{"role": "user", "content": prompt}]}, stream=True, timeout=120) as response:
+        for line in response.iter_lines():
+            if line.startswith(b'event:'):
+                return True
+    return False
+
+
+def llm_slots_in_flight(stats_url: str) -> int:
+    """LLM rate limiter slots the backend currently holds"""
+    return requests.get(stats_url, timeout=10).json()['llm_limiter']['in_flight']
+
+
+def check_cancelled_streams(url: str, prompts: "itertools.cycle[str]", count: int) -> bool:
+    """Cancel count concurrent streams and wait for the backend to release their LLM slots"""
+    stats_url = url.rsplit('/chat', 1)[0] + '/stats'
+    stream_url = url.rsplit('/chat', 1)[0] + '/chat/stream'
+
+    with ThreadPoolExecutor(max_workers=count) as executor:
+        opened = sum(executor.map(lambda prompt: cancel_stream(stream_url, prompt), [next(prompts) for _ in range(count)]))
+    print(f"Cancelled streams: {opened} of {count} sent an event before the disconnect")
+
+    deadline = time.monotonic() + SLOT_RELEASE_TIMEOUT_SECONDS
+    in_flight = llm_slots_in_flight(stats_url)
+    while in_flight and time.monotonic() < deadline:
+        time.sleep(0.1)
+        in_flight = llm_slots_in_flight(stats_url)
+
+    print(f"LLM slots still in flight: {in_flight}")
+    return in_flight == 0
+
+
+# ============================================================================
+# ENTRY POINT
+# ============================================================================
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Load test POST /chat')
+    parser.add_argument('--url', default='http://localhost:9000/chat', help='Chat endpoint URL')
+    parser.add_argument('--concurrency', type=int, default=16, help='Concurrent clients')
+    parser.add_argument('--duration', type=float, default=30.0, help='Test duration in seconds')
+    parser.add_argument('--prompt', action='append', help='Prompt to send (repeatable; defaults to a built-in mix)')
+    parser.add_argument('--cancel-streams', type=int, default=0,
+                        help='Instead of the load test, cancel this many streams and check their LLM slots are released')
+    args = parser.parse_args()
+
+    prompts = itertools.cycle(args.prompt or DEFAULT_PROMPTS)
+    if args.cancel_streams:
+        sys.exit(0 if check_cancelled_streams(args.url, prompts, args.cancel_streams) else 1)
+
+    results: Dict[str, list] = {'latencies': [], 'errors': []}
+    lock = threading.Lock()
+
+    started = time.monotonic()
+    stop_at = started + args.duration
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        for _ in range(args.concurrency):
+            executor.submit(run_client, args.url, prompts, stop_at, results, lock)
+    elapsed = time.monotonic() - started
+
+    latencies = sorted(results['latencies'])
+    print(f"Requests: {len(latencies)} ok, {len(results['errors'])} errors in {elapsed:.1f}s "
+          f"with {args.concurrency} clients")
+    print(f"Throughput: {len(latencies) / elapsed:.1f} req/s")
+    if latencies:
+        print(f"Latency: mean {statistics.mean(latencies) * 1000:.0f} ms, "
+              f"p50 {percentile(latencies, 0.50) * 1000:.0f} ms, "
+              f"p95 {percentile(latencies, 0.95) * 1000:.0f} ms, "
+              f"p99 {percentile(latencies, 0.99) * 1000:.0f} ms")
+
+
+if __name__ == '__main__':
+    main()
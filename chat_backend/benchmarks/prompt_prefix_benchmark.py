@@ -0,0 +1,120 @@
+"""
+Prompt Prefix Benchmark
+
+Compares building chat completions request bodies by re-encoding the whole
+payload on every call (the previous approach) with assembling them from the
+cached PromptPrefix fragments. Reports body size, build time per call and how
+many leading bytes consecutive calls of a growing conversation share.
+
+Usage:
+    python benchmarks/prompt_prefix_benchmark.py [--turns 20] [--iterations 2000]
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from typing import Any, Callable, Dict, List
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+# ACPClient reads the Stripe key at construction; no request is made here
+os.environ.setdefault('FACILITATOR_API_KEY', 'sk_test_benchmark')
+
+from acp_client import ACPClient  # noqa: E402
+from llm_service import LLMService  # noqa: E402
+
+
+# ============================================================================
+# HELPER FUNCTIONS
+# ============================================================================
+
+def build_history(turns: int) -> List[Dict[str, Any]]:
+    """Build a shopping conversation with one search tool call per turn"""
+    messages: List[Dict[str, Any]] = []
+    for turn in range(turns):
+        call_id = f"call_{turn}"
+        messages.extend([
+            {"role": "user", "content": f"Show me some running shoes, option {turn}"},
+            {
+                "role": "assistant",
+                "content": None,
+                "tool_calls": [{
+                    "id": call_id,
+                    "type": "function",
+                    "function": {"name": "search_products", "arguments": json.dumps({"query": "running shoes"})}
+                }]
+            },
+            {
+                "role": "tool",
+                "tool_call_id": call_id,
+                "name": "search_products",
+                "content": json.dumps([
+                    {"id": f"prod_{turn}_{i}", "name": f"Runner {i}", "description": "Lightweight trainer"}
+                    for i in range(3)
+                ])
+            },
+            {"role": "assistant", "content": f"Here are three running shoes for option {turn}."}
+        ])
+    return messages
+
+
+def legacy_body(service: LLMService, messages: List[Dict[str, Any]]) -> bytes:
+    """Encode the full payload per call, as requests does for json=payload"""
+    payload = {
+        "model": service.model,
+        "messages": messages,
+        "tools": service.tools,
+        "temperature": 0.7
+    }
+    return json.dumps(payload).encode('utf-8')
+
+
+def time_per_call(build: Callable[[], bytes], iterations: int) -> float:
+    """Average seconds per call of build"""
+    started = time.perf_counter()
+    for _ in range(iterations):
+        build()
+    return (time.perf_counter() - started) / iterations
+
+
+def shared_prefix(first: bytes, second: bytes) -> int:
+    """Number of leading bytes two bodies have in common"""
+    length = min(len(first), len(second))
+    for index in range(length):
+        if first[index] != second[index]:
+            return index
+    return length
+
+
+# ============================================================================
+# ENTRY POINT
+# ============================================================================
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--turns', type=int, default=20, help='Conversation turns in the history')
+    parser.add_argument('--iterations', type=int, default=2000, help='Bodies built per measurement')
+    args = parser.parse_args()
+
+    service = LLMService(ACPClient())
+    history = build_history(args.turns)
+    previous = history[:-4]
+
+    variants = {
+        'legacy': lambda messages: legacy_body(service, messages),
+        'prefix': lambda messages: service.prompt_prefix.build_body(messages)
+    }
+
+    print(f"History: {args.turns} turns, {len(history)} messages, {args.iterations} iterations")
+    print(f"{'variant':<8} {'bytes':>8} {'us/call':>9} {'shared prefix with previous turn':>34}")
+    for name, build in variants.items():
+        body = build(history)
+        seconds = time_per_call(lambda: build(history), args.iterations)
+        prefix = shared_prefix(build(previous), body)
+        print(f"{name:<8} {len(body):>8} {seconds * 1e6:>9.1f} {prefix:>26} bytes")
+
+
+if __name__ == '__main__':
+    main()
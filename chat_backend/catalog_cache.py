@@ -0,0 +1,231 @@
+"""
+Product Catalog Cache
+
+In-process cache for the product catalog with a TTL and stale-while-revalidate
+refresh: fresh entries are served from memory, stale entries are served while
+a single background refresh reloads them, and expired entries are reloaded
+synchronously.
+"""
+
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Optional, Tuple
+from dotenv import load_dotenv
+
+
+load_dotenv()
+
+# ============================================================================
+# CONSTANTS
+# ============================================================================
+
+CATALOG_CACHE_TTL_SECONDS: float = float(os.getenv('CATALOG_CACHE_TTL_SECONDS', '60'))
+CATALOG_CACHE_STALE_SECONDS: float = float(os.getenv('CATALOG_CACHE_STALE_SECONDS', '300'))
+
+
+# ============================================================================
+# CATALOG CACHE CLASS
+# ============================================================================
+
+class CatalogCache:
+    """
+    Thread-safe single-entry cache for the product catalog.
+
+    Entry ages are split into three windows:
+        - fresh (age < ttl): served from memory
+        - stale (age < ttl + stale window): served from memory, refreshed in the background
+        - expired: reloaded before returning
+
+    Sync callers use get(), which drives the loader itself. Async callers use
+    lookup() and store() and schedule the refresh on their own event loop.
+    """
+
+    def __init__(
+        self,
+        loader: Optional[Callable[[], Any]] = None,
+        ttl_seconds: float = CATALOG_CACHE_TTL_SECONDS,
+        stale_seconds: float = CATALOG_CACHE_STALE_SECONDS
+    ) -> None:
+        """
+        Initialize an empty catalog cache.
+
+        Args:
+            loader: Function that fetches the catalog (required for get())
+            ttl_seconds: Age up to which an entry counts as fresh
+            stale_seconds: Extra age during which a stale entry is still served
+        """
+        self.loader = loader
+        self.ttl_seconds = ttl_seconds
+        self.stale_seconds = stale_seconds
+        self.version = 0
+
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._value: Any = None
+        self._loaded_at: Optional[float] = None
+        self._refreshing = False
+
+        self._hits = 0
+        self._stale_hits = 0
+        self._misses = 0
+        self._refreshes = 0
+        self._refresh_failures = 0
+        self._invalidations = 0
+
+    def lookup(self) -> Optional[Tuple[Any, bool]]:
+        """
+        Look up the cached catalog and record a hit or miss.
+
+        Returns:
+            None on a miss, otherwise a tuple of (catalog, refresh_claimed).
+            refresh_claimed is True when the entry is stale and the caller is
+            now responsible for refreshing it (and calling store() or
+            refresh_failed() when done).
+        """
+        with self._lock:
+            if self._loaded_at is None:
+                self._misses += 1
+                return None
+
+            age = time.monotonic() - self._loaded_at
+            if age < self.ttl_seconds:
+                self._hits += 1
+                return self._value, False
+
+            if age < self.ttl_seconds + self.stale_seconds:
+                self._stale_hits += 1
+                refresh_claimed = not self._refreshing
+                self._refreshing = True
+                return self._value, refresh_claimed
+
+            self._misses += 1
+            return None
+
+    def is_servable(self) -> bool:
+        """
+        Check, without counting a lookup, whether a read would be served from memory.
+
+        Returns:
+            True if a fresh or stale entry is cached
+        """
+        with self._lock:
+            if self._loaded_at is None:
+                return False
+            return time.monotonic() - self._loaded_at < self.ttl_seconds + self.stale_seconds
+
+    def store(self, value: Any) -> None:
+        """
+        Store a freshly loaded catalog.
+
+        Args:
+            value: The catalog returned by the upstream
+        """
+        with self._lock:
+            # The version only moves when the catalog content changes, so results derived
+            # from it (e.g. cached chat answers) survive refreshes that return the same data
+            if value != self._value:
+                self.version += 1
+            self._value = value
+            self._loaded_at = time.monotonic()
+            self._refreshing = False
+            self._refreshes += 1
+
+    def refresh_failed(self) -> None:
+        """Release a claimed refresh after the loader failed."""
+        with self._lock:
+            self._refreshing = False
+            self._refresh_failures += 1
+
+    def invalidate(self) -> None:
+        """Drop the cached catalog so the next read reloads it."""
+        with self._lock:
+            self._value = None
+            self._loaded_at = None
+            self._invalidations += 1
+            self.version += 1
+
+    def get(self) -> Any:
+        """
+        Get the catalog, loading or refreshing it through the loader as needed.
+
+        Returns:
+            The cached or freshly loaded catalog
+
+        Raises:
+            ValueError: If no loader was configured
+        """
+        if self.loader is None:
+            raise ValueError('CatalogCache.get() requires a loader')
+
+        entry = self.lookup()
+        if entry is not None:
+            value, refresh_claimed = entry
+            if refresh_claimed:
+                threading.Thread(target=self._refresh_in_background, daemon=True).start()
+            return value
+
+        # Only one caller loads on a miss; the others wait and reuse its result
+        with self._load_lock:
+            with self._lock:
+                if self._loaded_at is not None and time.monotonic() - self._loaded_at < self.ttl_seconds:
+                    return self._value
+            value = self.loader()
+            if not _is_error(value):
+                self.store(value)
+            return value
+
+    def _refresh_in_background(self) -> None:
+        """Reload a stale catalog without blocking readers."""
+        try:
+            value = self.loader()
+        except Exception as e:
+            print(f"Catalog refresh failed: {e}")
+            self.refresh_failed()
+            return
+
+        if _is_error(value):
+            self.refresh_failed()
+        else:
+            self.store(value)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get cache counters.
+
+        Returns:
+            Dictionary with hit/miss counters, entry age and catalog version
+        """
+        with self._lock:
+            lookups = self._hits + self._stale_hits + self._misses
+            age = None if self._loaded_at is None else time.monotonic() - self._loaded_at
+            return {
+                'hits': self._hits,
+                'stale_hits': self._stale_hits,
+                'misses': self._misses,
+                'hit_rate': (self._hits + self._stale_hits) / lookups if lookups else 0.0,
+                'refreshes': self._refreshes,
+                'refresh_failures': self._refresh_failures,
+                'invalidations': self._invalidations,
+                'age_seconds': age,
+                'version': self.version,
+                'ttl_seconds': self.ttl_seconds,
+                'stale_seconds': self.stale_seconds
+            }
+
+
+# ============================================================================
+# HELPER FUNCTIONS
+# ============================================================================
+
+def _is_error(value: Any) -> bool:
+    """
+    Check whether a loader result is an ACP client error dictionary.
+
+    Args:
+        value: Loader result
+
+    Returns:
+        True if the result must not be cached
+    """
+    return isinstance(value, dict) and 'error' in value
@@ -0,0 +1,160 @@
+"""
+Checkout Session Cache
+
+Write-through cache of checkout sessions for the chat backend's
+GET /checkout/<id> route. The ACP clients write the sessions returned by
+create/update/complete/cancel through to it, so a read shortly after a write
+is served without a seller backend round trip. Entries are tied to the ACP
+client's checkout versions: a written session is stored at the version its
+own write produced, so any later write made through the client, including
+ones made by chat tools, makes it stale immediately. Every session is also
+stored with a ticket taken before its request was sent, so the response to
+an older request never replaces the response to a newer one.
+"""
+
+import os
+import threading
+from typing import Any, Dict, Optional
+from dotenv import load_dotenv
+
+from checkout_state import CheckoutStateCache
+from ttl_cache import TTLCache
+
+
+load_dotenv()
+
+# ============================================================================
+# CONSTANTS
+# ============================================================================
+
+CHECKOUT_SESSION_CACHE_TTL_SECONDS: float = float(os.getenv('CHECKOUT_SESSION_CACHE_TTL_SECONDS', '5'))
+CHECKOUT_SESSION_CACHE_MAX_ENTRIES: int = int(os.getenv('CHECKOUT_SESSION_CACHE_MAX_ENTRIES', '1000'))
+
+
+# ============================================================================
+# CHECKOUT SESSION CACHE CLASS
+# ============================================================================
+
+class CheckoutSessionCache:
+    """
+    LRU of checkout sessions keyed by ID, fresh for a short window.
+
+    Each entry keeps the checkout state version it was stored at and is only
+    served while the ACP client has not written the checkout since. It also
+    keeps the ticket its request was sent under; a session from a request sent
+    earlier does not replace it.
+    """
+
+    def __init__(
+        self,
+        checkout_state: CheckoutStateCache,
+        ttl_seconds: float = CHECKOUT_SESSION_CACHE_TTL_SECONDS,
+        max_entries: int = CHECKOUT_SESSION_CACHE_MAX_ENTRIES
+    ) -> None:
+        """
+        Initialize an empty cache.
+
+        Args:
+            checkout_state: The ACP client's checkout state cache, which versions checkout writes
+            ttl_seconds: Freshness window of a cached session
+            max_entries: Maximum number of sessions kept
+        """
+        self.checkout_state = checkout_state
+        # checkout ID -> (version stored at, ticket the request was sent under, session)
+        self.entries = TTLCache(max_entries=max_entries, ttl_seconds=ttl_seconds)
+
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._stale = 0
+        self._writes = 0
+        self._superseded = 0
+
+    def ticket(self) -> int:
+        """
+        Take a ticket before sending a request whose session will be stored with put() or write().
+
+        Returns:
+            The current checkout state version
+        """
+        return self.checkout_state.ticket()
+
+    def get(self, checkout_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Look up a fresh session.
+
+        Args:
+            checkout_id: Checkout session ID
+
+        Returns:
+            The cached session, or None if absent, expired or written since it was cached
+        """
+        entry = self.entries.get(checkout_id)
+        stale = entry is not None and self.checkout_state.changed_since(checkout_id, entry[0])
+        if stale:
+            self.entries.pop(checkout_id)
+
+        with self._lock:
+            if stale:
+                self._stale += 1
+            if entry is None or stale:
+                self._misses += 1
+                return None
+            self._hits += 1
+            return entry[2]
+
+    def _store(self, checkout_id: str, version: int, ticket: int, session: Dict[str, Any]) -> bool:
+        """Store a session unless the cached one came from a request sent later."""
+        with self._lock:
+            entry = self.entries.get(checkout_id)
+            if entry is not None and entry[1] > ticket:
+                self._superseded += 1
+                return False
+            self.entries.set(checkout_id, (version, ticket, session))
+            return True
+
+    def put(self, checkout_id: str, session: Dict[str, Any], ticket: int) -> None:
+        """
+        Store a session fetched from the seller backend.
+
+        Args:
+            checkout_id: Checkout session ID
+            session: Session returned by get_checkout
+            ticket: Ticket taken before the session was fetched
+        """
+        self._store(checkout_id, ticket, ticket, session)
+
+    def write(self, checkout_id: str, session: Dict[str, Any], ticket: int, version: int) -> None:
+        """
+        Write through a session returned by a create/update/complete/cancel call.
+
+        Args:
+            checkout_id: Checkout session ID
+            session: Session returned by the write
+            ticket: Ticket taken before the write was sent
+            version: Checkout state version the write itself produced once its response arrived;
+                the session is stale as soon as any later write is sent
+        """
+        if self._store(checkout_id, version, ticket, session):
+            with self._lock:
+                self._writes += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get session cache statistics.
+
+        Returns:
+            Dictionary with size, hit/miss, stale, write-through, superseded and eviction counters
+        """
+        counters = self.entries.stats()
+        with self._lock:
+            lookups = self._hits + self._misses
+            counters.update({
+                'hits': self._hits,
+                'misses': self._misses,
+                'hit_rate': self._hits / lookups if lookups else 0.0,
+                'stale': self._stale,
+                'writes': self._writes,
+                'superseded': self._superseded
+            })
+        return counters
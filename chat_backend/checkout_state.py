@@ -0,0 +1,189 @@
+"""
+Checkout State Cache
+
+Remembers the total amount of checkout sessions this process just created
+or updated, so completing a checkout does not need a get_checkout round trip
+first. A total is only used while the write it came from is still the
+latest one this process made to the checkout; entries are dropped when a
+session is updated, completed or canceled.
+
+The cache is per process: it cannot see writes made by other workers or
+totals the seller changes on its own. Set CHECKOUT_TOTAL_REVALIDATE=True to
+always read the checkout before completing it.
+"""
+
+import itertools
+import os
+import threading
+from typing import Any, Dict, Optional
+from dotenv import load_dotenv
+
+from ttl_cache import TTLCache
+
+
+load_dotenv()
+
+# ============================================================================
+# CONSTANTS
+# ============================================================================
+
+CHECKOUT_STATE_TTL_SECONDS: float = float(os.getenv('CHECKOUT_STATE_TTL_SECONDS', '60'))
+CHECKOUT_STATE_MAX_ENTRIES: int = int(os.getenv('CHECKOUT_STATE_MAX_ENTRIES', '10000'))
+CHECKOUT_TOTAL_REVALIDATE: bool = os.getenv('CHECKOUT_TOTAL_REVALIDATE', 'False').lower() == 'true'
+
+
+# ============================================================================
+# CHECKOUT STATE CACHE CLASS
+# ============================================================================
+
+class CheckoutStateCache:
+    """
+    TTL + LRU cache of checkout totals from write responses, keyed by checkout ID.
+
+    Every write advances a shared version counter and leaves a marker with
+    the new version for the checkout. A total is stored with the version of
+    the write that returned it, and only served while that version is still
+    the checkout's latest write.
+    """
+
+    def __init__(
+        self,
+        ttl_seconds: float = CHECKOUT_STATE_TTL_SECONDS,
+        max_entries: int = CHECKOUT_STATE_MAX_ENTRIES,
+        revalidate: bool = CHECKOUT_TOTAL_REVALIDATE
+    ) -> None:
+        """
+        Initialize an empty cache.
+
+        Args:
+            ttl_seconds: Time a cached total counts as fresh
+            max_entries: Maximum number of checkouts remembered
+            revalidate: Never serve cached totals, so completion always reads the checkout first
+        """
+        self.revalidate = revalidate
+        # checkout ID -> (version of the write that returned the total, total)
+        self.entries = TTLCache(max_entries=max_entries, ttl_seconds=ttl_seconds)
+        # checkout ID -> version of its latest write; outlives any request in flight
+        self._invalidations = TTLCache(max_entries=max_entries, ttl_seconds=ttl_seconds)
+
+        self._lock = threading.Lock()
+        self._versions = itertools.count(1)
+        self._version = 0
+        self._stores = 0
+        self._invalidated = 0
+
+    def ticket(self) -> int:
+        """
+        Take a ticket before sending a request whose response may be cached.
+
+        Returns:
+            The current version
+        """
+        with self._lock:
+            return self._version
+
+    def _changed_since(self, checkout_id: str, ticket: int) -> bool:
+        """Check for a write after the ticket was taken. Caller must hold the lock."""
+        written_at = self._invalidations.get(checkout_id)
+        return written_at is not None and written_at > ticket
+
+    def changed_since(self, checkout_id: str, ticket: int) -> bool:
+        """
+        Check whether a checkout was written through this cache after a ticket was taken.
+
+        Args:
+            checkout_id: Checkout session ID
+            ticket: Ticket taken earlier
+
+        Returns:
+            True if the checkout was created, updated, completed or canceled since
+        """
+        with self._lock:
+            return self._changed_since(checkout_id, ticket)
+
+    def write_version(self, checkout_id: str) -> int:
+        """
+        Get the version of a checkout's latest write, e.g. to tell reads sent before and after it apart.
+
+        Args:
+            checkout_id: Checkout session ID
+
+        Returns:
+            The version, or 0 if the checkout was not written recently
+        """
+        with self._lock:
+            return self._invalidations.get(checkout_id) or 0
+
+    def _advance(self, checkout_id: str) -> None:
+        """Mark the checkout as changed now. Caller must hold the lock."""
+        self._version = next(self._versions)
+        self._invalidations.set(checkout_id, self._version)
+
+    def replace(self, checkout_id: str, total_amount: int) -> int:
+        """
+        Store the total from a write response, superseding reads still in flight.
+
+        Args:
+            checkout_id: Checkout session ID
+            total_amount: Total amount from the create/update response
+
+        Returns:
+            The version of this write
+        """
+        with self._lock:
+            self._advance(checkout_id)
+            self.entries.set(checkout_id, (self._version, total_amount))
+            self._stores += 1
+            return self._version
+
+    def invalidate(self, checkout_id: str) -> int:
+        """
+        Forget a checkout's total, and reject responses to reads sent before now.
+
+        Args:
+            checkout_id: Checkout session ID
+
+        Returns:
+            The version of this write
+        """
+        with self._lock:
+            self._advance(checkout_id)
+            self.entries.pop(checkout_id)
+            self._invalidated += 1
+            return self._version
+
+    def total(self, checkout_id: str) -> Optional[int]:
+        """
+        Look up the total returned by this process's latest write to a checkout.
+
+        Args:
+            checkout_id: Checkout session ID
+
+        Returns:
+            The cached total amount, or None if unknown, expired, superseded by a later write
+            or revalidation is on
+        """
+        if self.revalidate:
+            return None
+
+        with self._lock:
+            entry = self.entries.get(checkout_id)
+            if entry is None or entry[0] != self._invalidations.get(checkout_id):
+                return None
+            return entry[1]
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get checkout state cache statistics.
+
+        Returns:
+            Dictionary with cache counters, stores and invalidations
+        """
+        with self._lock:
+            counters: Dict[str, Any] = {
+                'revalidate': self.revalidate,
+                'stores': self._stores,
+                'invalidations': self._invalidated
+            }
+        counters.update(self.entries.stats())
+        return counters
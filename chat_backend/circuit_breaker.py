@@ -0,0 +1,229 @@
+"""
+Circuit Breaker
+
+Per-upstream circuit breakers for the seller backend and the SPT server.
+While an upstream keeps failing, calls to it fail fast instead of each one
+waiting for a connect timeout; after a cool-down a few probe calls are let
+through and the circuit closes again once a probe succeeds.
+"""
+
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Optional, Tuple
+from dotenv import load_dotenv
+
+
+load_dotenv()
+
+# ============================================================================
+# CONSTANTS
+# ============================================================================
+
+CIRCUIT_BREAKER_ENABLED: bool = os.getenv('CIRCUIT_BREAKER_ENABLED', 'True').lower() == 'true'
+CIRCUIT_FAILURE_RATE_THRESHOLD: float = float(os.getenv('CIRCUIT_FAILURE_RATE_THRESHOLD', '0.5'))
+CIRCUIT_WINDOW_SECONDS: float = float(os.getenv('CIRCUIT_WINDOW_SECONDS', '30'))
+CIRCUIT_MINIMUM_CALLS: int = int(os.getenv('CIRCUIT_MINIMUM_CALLS', '5'))
+CIRCUIT_OPEN_SECONDS: float = float(os.getenv('CIRCUIT_OPEN_SECONDS', '15'))
+CIRCUIT_HALF_OPEN_MAX_CALLS: int = int(os.getenv('CIRCUIT_HALF_OPEN_MAX_CALLS', '1'))
+
+STATE_CLOSED: str = 'closed'
+STATE_OPEN: str = 'open'
+STATE_HALF_OPEN: str = 'half_open'
+
+# Upstreams guarded by the ACP clients
+SELLER_BACKEND: str = 'seller_backend'
+SPT_SERVER: str = 'spt_server'
+UPSTREAMS: Tuple[str, ...] = (SELLER_BACKEND, SPT_SERVER)
+
+
+# ============================================================================
+# EXCEPTIONS
+# ============================================================================
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling an upstream whose circuit is open."""
+
+
+# ============================================================================
+# CIRCUIT BREAKER CLASS
+# ============================================================================
+
+class CircuitBreaker:
+    """
+    Closed / open / half-open circuit breaker over a sliding time window.
+
+    Closed: calls pass and their outcomes are recorded. Once the window holds
+    at least minimum_calls outcomes and the failure rate reaches the
+    threshold, the circuit opens. Open: calls are rejected for open_seconds.
+    Half-open: up to half_open_max_calls probes pass; a successful probe
+    closes the circuit, a failed one opens it again.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        enabled: bool = CIRCUIT_BREAKER_ENABLED,
+        failure_rate_threshold: float = CIRCUIT_FAILURE_RATE_THRESHOLD,
+        window_seconds: float = CIRCUIT_WINDOW_SECONDS,
+        minimum_calls: int = CIRCUIT_MINIMUM_CALLS,
+        open_seconds: float = CIRCUIT_OPEN_SECONDS,
+        half_open_max_calls: int = CIRCUIT_HALF_OPEN_MAX_CALLS
+    ) -> None:
+        """
+        Initialize a closed circuit.
+
+        Args:
+            name: Upstream name, used in errors and logs
+            enabled: Whether the breaker ever rejects calls
+            failure_rate_threshold: Failure rate (0-1) at which the circuit opens
+            window_seconds: How far back call outcomes count towards the failure rate
+            minimum_calls: Outcomes needed in the window before the circuit can open
+            open_seconds: How long the circuit stays open before probing
+            half_open_max_calls: Probe calls allowed at once while half-open
+        """
+        self.name = name
+        self.enabled = enabled
+        self.failure_rate_threshold = failure_rate_threshold
+        self.window_seconds = window_seconds
+        self.minimum_calls = minimum_calls
+        self.open_seconds = open_seconds
+        self.half_open_max_calls = half_open_max_calls
+
+        self._lock = threading.Lock()
+        self._state = STATE_CLOSED
+        self._opened_at = 0.0
+        self._probes_in_flight = 0
+        # (monotonic time, succeeded) of recent calls, oldest first
+        self._outcomes: Deque[Tuple[float, bool]] = deque()
+
+        self._opens = 0
+        self._rejected = 0
+
+    def _prune(self, now: float) -> None:
+        """Drop outcomes that fell out of the window. Caller must hold the lock."""
+        while self._outcomes and self._outcomes[0][0] <= now - self.window_seconds:
+            self._outcomes.popleft()
+
+    def _failure_rate(self) -> float:
+        """Failure rate of the outcomes in the window. Caller must hold the lock."""
+        if not self._outcomes:
+            return 0.0
+        return sum(1 for _, succeeded in self._outcomes if not succeeded) / len(self._outcomes)
+
+    def _transition(self, state: str, now: float) -> None:
+        """Move to a new state. Caller must hold the lock."""
+        if state == STATE_OPEN:
+            self._opened_at = now
+            self._opens += 1
+        if state == STATE_CLOSED:
+            self._outcomes.clear()
+        self._probes_in_flight = 0
+        print(f"Circuit {self.name}: {self._state} -> {state}")
+        self._state = state
+
+    def before_call(self) -> None:
+        """
+        Admit a call to the upstream. Every admitted call must be followed by
+        record_success() or record_failure().
+
+        Raises:
+            CircuitOpenError: If the circuit is open, or half-open with all probes in flight
+        """
+        if not self.enabled:
+            return
+
+        with self._lock:
+            now = time.monotonic()
+            if self._state == STATE_OPEN and now - self._opened_at >= self.open_seconds:
+                self._transition(STATE_HALF_OPEN, now)
+
+            if self._state == STATE_CLOSED:
+                return
+            if self._state == STATE_HALF_OPEN and self._probes_in_flight < self.half_open_max_calls:
+                self._probes_in_flight += 1
+                return
+
+            self._rejected += 1
+            retry_in = max(0.0, self.open_seconds - (now - self._opened_at))
+
+        raise CircuitOpenError(f"Circuit open for {self.name}; retry in {retry_in:.1f}s")
+
+    def record_success(self) -> None:
+        """Record that an admitted call reached a healthy upstream."""
+        if not self.enabled:
+            return
+
+        with self._lock:
+            now = time.monotonic()
+            if self._state == STATE_HALF_OPEN:
+                self._transition(STATE_CLOSED, now)
+                return
+            self._outcomes.append((now, True))
+            self._prune(now)
+
+    def record_failure(self) -> None:
+        """Record that an admitted call failed because of the upstream (connection error, timeout, 5xx)."""
+        if not self.enabled:
+            return
+
+        with self._lock:
+            now = time.monotonic()
+            if self._state == STATE_HALF_OPEN:
+                self._transition(STATE_OPEN, now)
+                return
+            if self._state == STATE_OPEN:
+                return
+
+            self._outcomes.append((now, False))
+            self._prune(now)
+            if len(self._outcomes) >= self.minimum_calls and self._failure_rate() >= self.failure_rate_threshold:
+                self._transition(STATE_OPEN, now)
+
+    @property
+    def state(self) -> str:
+        """Current state; an open circuit whose cool-down has passed reports half_open."""
+        with self._lock:
+            if self._state == STATE_OPEN and time.monotonic() - self._opened_at >= self.open_seconds:
+                return STATE_HALF_OPEN
+            return self._state
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get circuit statistics.
+
+        Returns:
+            Dictionary with state, window failure rate, open and rejection counters
+        """
+        state = self.state
+        with self._lock:
+            now = time.monotonic()
+            self._prune(now)
+            open_remaining: Optional[float] = None
+            if state == STATE_OPEN:
+                open_remaining = round(self.open_seconds - (now - self._opened_at), 3)
+
+            return {
+                'enabled': self.enabled,
+                'state': state,
+                'window_calls': len(self._outcomes),
+                'failure_rate': self._failure_rate(),
+                'opens': self._opens,
+                'rejected': self._rejected,
+                'open_remaining_seconds': open_remaining
+            }
+
+
+# ============================================================================
+# FACTORY
+# ============================================================================
+
+def create_circuit_breakers() -> Dict[str, CircuitBreaker]:
+    """
+    Create one circuit breaker per upstream of the ACP clients.
+
+    Returns:
+        Dictionary of upstream name to circuit breaker
+    """
+    return {upstream: CircuitBreaker(upstream) for upstream in UPSTREAMS}
@@ -0,0 +1,273 @@
+"""
+Context Window Management
+
+Keeps the prompt sent to the LLM within a token budget as conversations grow.
+System messages and tool definitions stay pinned; once the budget is exceeded,
+old tool results are cut down to short excerpts first, then the oldest turns
+are folded into a compact extractive summary. The turn being answered is never
+touched, so per-call prompt size (and latency) stays roughly constant.
+"""
+
+import json
+import os
+import threading
+from typing import Any, Dict, List, Optional
+from dotenv import load_dotenv
+
+from projection import estimate_tokens
+
+
+load_dotenv()
+
+# ============================================================================
+# CONSTANTS
+# ============================================================================
+
+CONTEXT_MAX_TOKENS: int = int(os.getenv('CONTEXT_MAX_TOKENS', '12000'))
+CONTEXT_TOOL_RESULT_MAX_CHARS: int = int(os.getenv('CONTEXT_TOOL_RESULT_MAX_CHARS', '200'))
+CONTEXT_SUMMARY_MAX_TURNS: int = int(os.getenv('CONTEXT_SUMMARY_MAX_TURNS', '20'))
+
+# Characters of each user/assistant message kept in a summary line
+SUMMARY_EXCERPT_CHARS: int = 120
+
+SUMMARY_HEADER = "Summary of earlier conversation (older turns were condensed):"
+
+
+# ============================================================================
+# HELPER FUNCTIONS
+# ============================================================================
+
+def message_tokens(message: Dict[str, Any]) -> int:
+    """
+    Estimate the prompt tokens of one chat message, including role and tool call overhead.
+
+    Args:
+        message: Chat message
+
+    Returns:
+        Approximate token count
+    """
+    return estimate_tokens(json.dumps(message, separators=(',', ':')))
+
+
+def _excerpt(text: Optional[str], max_chars: int) -> str:
+    """
+    Shorten text to at most max_chars characters on a single line.
+
+    Args:
+        text: Text to shorten (None is treated as empty)
+        max_chars: Maximum length of the result
+
+    Returns:
+        The excerpt, ending in '...' if it was cut
+    """
+    text = ' '.join(str(text or '').split())
+    if len(text) <= max_chars:
+        return text
+    return text[:max_chars - 3] + '...'
+
+
+def _split_turns(messages: List[Dict[str, Any]]) -> List[List[Dict[str, Any]]]:
+    """
+    Group messages into turns, each starting at a user message.
+
+    A turn holds the user message, the assistant tool calls, the tool results and
+    the assistant answer that followed it, so dropping a whole turn never leaves a
+    tool result without its tool call. Messages before the first user message form
+    their own turn.
+
+    Args:
+        messages: Chat messages without the pinned system prefix
+
+    Returns:
+        List of turns in order
+    """
+    turns: List[List[Dict[str, Any]]] = []
+    for message in messages:
+        if message.get('role') == 'user' or not turns:
+            turns.append([])
+        turns[-1].append(message)
+    return turns
+
+
+def _summarize_turn(turn: List[Dict[str, Any]]) -> str:
+    """
+    Condense one turn into a single summary line.
+
+    Args:
+        turn: Messages of the turn
+
+    Returns:
+        Summary line naming the user request, the tools used and the final answer
+    """
+    user = next((m.get('content') for m in turn if m.get('role') == 'user'), None)
+    tools = [m.get('name') for m in turn if m.get('role') == 'tool' and m.get('name')]
+    answer = next(
+        (m.get('content') for m in reversed(turn) if m.get('role') == 'assistant' and m.get('content')),
+        None
+    )
+
+    parts = []
+    if user:
+        parts.append(f"User: {_excerpt(user, SUMMARY_EXCERPT_CHARS)}")
+    if tools:
+        parts.append(f"Tools: {', '.join(dict.fromkeys(tools))}")
+    if answer:
+        parts.append(f"Assistant: {_excerpt(answer, SUMMARY_EXCERPT_CHARS)}")
+    return '- ' + ' | '.join(parts)
+
+
+# ============================================================================
+# CONTEXT WINDOW CLASS
+# ============================================================================
+
+class ContextWindow:
+    """
+    Fits a message history into a prompt token budget.
+
+    Compaction happens per LLM call on a copy of the history; the caller's
+    messages (and any stored conversation) keep the full, uncompacted log.
+    """
+
+    def __init__(
+        self,
+        max_tokens: int = CONTEXT_MAX_TOKENS,
+        reserved_tokens: int = 0,
+        tool_result_max_chars: int = CONTEXT_TOOL_RESULT_MAX_CHARS,
+        summary_max_turns: int = CONTEXT_SUMMARY_MAX_TURNS
+    ) -> None:
+        """
+        Initialize the context window.
+
+        Args:
+            max_tokens: Prompt token budget, including reserved_tokens
+            reserved_tokens: Tokens used by pinned request parts outside the messages (tool definitions)
+            tool_result_max_chars: Length old tool results are cut down to
+            summary_max_turns: Maximum number of condensed turns kept in the summary
+        """
+        self.max_tokens = max_tokens
+        self.reserved_tokens = reserved_tokens
+        self.tool_result_max_chars = tool_result_max_chars
+        self.summary_max_turns = summary_max_turns
+
+        self._lock = threading.Lock()
+        self._calls = 0
+        self._compacted_calls = 0
+        self._tool_results_truncated = 0
+        self._turns_summarized = 0
+        self._tokens_saved = 0
+        self._last_tokens = 0
+
+    def _truncate_tool_result(self, message: Dict[str, Any]) -> Dict[str, Any]:
+        """Replace a tool result with a short excerpt"""
+        truncated = dict(message)
+        truncated['content'] = json.dumps({
+            "truncated": True,
+            "excerpt": _excerpt(message.get('content'), self.tool_result_max_chars)
+        })
+        return truncated
+
+    def _build_summary(self, summary_lines: List[str]) -> Dict[str, Any]:
+        """Build the system message that stands in for condensed turns"""
+        omitted = len(summary_lines) - self.summary_max_turns
+        lines = [SUMMARY_HEADER]
+        if omitted > 0:
+            lines.append(f"- ({omitted} earlier turns omitted)")
+        lines.extend(summary_lines[-self.summary_max_turns:])
+        return {"role": "system", "content": '\n'.join(lines)}
+
+    def fit(self, messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Return the messages to send so that the prompt fits the token budget.
+
+        Leading system messages are always kept. Older turns are compacted
+        oldest first, in two passes, stopping as soon as the prompt fits:
+        first their tool results are truncated, then whole turns are replaced
+        by a summary line. The latest turn is always sent in full.
+
+        Args:
+            messages: Full message history
+
+        Returns:
+            The history itself if it fits, otherwise a compacted copy
+        """
+        pinned_count = 0
+        while pinned_count < len(messages) and messages[pinned_count].get('role') == 'system':
+            pinned_count += 1
+        pinned = messages[:pinned_count]
+        turns = _split_turns(messages[pinned_count:])
+
+        turn_tokens = [sum(message_tokens(m) for m in turn) for turn in turns]
+        fixed_tokens = self.reserved_tokens + sum(message_tokens(m) for m in pinned)
+        original_tokens = fixed_tokens + sum(turn_tokens)
+        total_tokens = original_tokens
+
+        truncated_count = 0
+        summary_lines: List[str] = []
+        summary_tokens = 0
+
+        if total_tokens > self.max_tokens:
+            # Pass 1: truncate tool results of every turn but the latest
+            for index in range(len(turns) - 1):
+                if total_tokens <= self.max_tokens:
+                    break
+                compacted = []
+                for message in turns[index]:
+                    if message.get('role') == 'tool' and len(message.get('content') or '') > self.tool_result_max_chars:
+                        message = self._truncate_tool_result(message)
+                        truncated_count += 1
+                    compacted.append(message)
+                tokens = sum(message_tokens(m) for m in compacted)
+                total_tokens += tokens - turn_tokens[index]
+                turns[index], turn_tokens[index] = compacted, tokens
+
+            # Pass 2: fold the oldest turns into the summary
+            while total_tokens > self.max_tokens and len(turns) > 1:
+                summary_lines.append(_summarize_turn(turns.pop(0)))
+                total_tokens -= turn_tokens.pop(0)
+                new_summary_tokens = message_tokens(self._build_summary(summary_lines))
+                total_tokens += new_summary_tokens - summary_tokens
+                summary_tokens = new_summary_tokens
+
+        compacted = bool(truncated_count or summary_lines)
+
+        with self._lock:
+            self._calls += 1
+            self._last_tokens = total_tokens
+            if compacted:
+                self._compacted_calls += 1
+                self._tool_results_truncated += truncated_count
+                self._turns_summarized += len(summary_lines)
+                self._tokens_saved += original_tokens - total_tokens
+
+        if not compacted:
+            return messages
+
+        if total_tokens > self.max_tokens:
+            print(f"Context still over budget after compaction: ~{total_tokens} tokens")
+
+        fitted = list(pinned)
+        if summary_lines:
+            fitted.append(self._build_summary(summary_lines))
+        for turn in turns:
+            fitted.extend(turn)
+        return fitted
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get context window statistics.
+
+        Returns:
+            Dictionary with the budget and compaction counters
+        """
+        with self._lock:
+            return {
+                'max_tokens': self.max_tokens,
+                'reserved_tokens': self.reserved_tokens,
+                'calls': self._calls,
+                'compacted_calls': self._compacted_calls,
+                'tool_results_truncated': self._tool_results_truncated,
+                'turns_summarized': self._turns_summarized,
+                'tokens_saved': self._tokens_saved,
+                'last_prompt_tokens': self._last_tokens
+            }
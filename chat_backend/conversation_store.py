@@ -0,0 +1,394 @@
+"""
+Conversation Store
+
+Server-side chat sessions: an append-only message log per conversation id,
+so clients only send the newest message and the backend rebuilds the context.
+Backends are pluggable (in-memory or SQLite) and evict idle conversations.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple, Union
+from dotenv import load_dotenv
+
+
+load_dotenv()
+
+# ============================================================================
+# CONSTANTS
+# ============================================================================
+
+CONVERSATION_STORE: str = os.getenv('CONVERSATION_STORE', 'memory')
+CONVERSATION_DB_PATH: str = os.getenv('CONVERSATION_DB_PATH', 'conversations.db')
+CONVERSATION_MAX_COUNT: int = int(os.getenv('CONVERSATION_MAX_COUNT', '10000'))
+CONVERSATION_TTL_SECONDS: float = float(os.getenv('CONVERSATION_TTL_SECONDS', '86400'))
+
+# Message keys the LLM understands; everything else (traces, frontend hints) is dropped
+HISTORY_MESSAGE_KEYS = ('role', 'content', 'tool_calls', 'tool_call_id', 'name')
+
+
+# ============================================================================
+# HELPER FUNCTIONS
+# ============================================================================
+
+def to_history_message(message: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Strip a message down to the keys that belong in the LLM history.
+
+    Args:
+        message: Chat message, possibly carrying response-only keys
+
+    Returns:
+        Message containing only history keys
+    """
+    return {key: message[key] for key in HISTORY_MESSAGE_KEYS if key in message}
+
+
+def _generate_conversation_id() -> str:
+    """
+    Generate a new conversation identifier.
+
+    Returns:
+        A string identifier in the format 'conv_<hex_string>'
+    """
+    return f"conv_{uuid.uuid4().hex}"
+
+
+# ============================================================================
+# CONVERSATION STORE CLASSES
+# ============================================================================
+
+class ConversationStore(ABC):
+    """
+    Interface for conversation backends.
+
+    A conversation is an append-only list of messages. Conversations idle
+    longer than the TTL, or beyond the maximum count (least recently used
+    first), are evicted.
+    """
+
+    @abstractmethod
+    def create(self) -> str:
+        """
+        Start a new, empty conversation.
+
+        Returns:
+            The new conversation id
+        """
+
+    @abstractmethod
+    def get(self, conversation_id: str) -> Optional[List[Dict[str, Any]]]:
+        """
+        Load the message log of a conversation.
+
+        Args:
+            conversation_id: Conversation to load
+
+        Returns:
+            List of messages, or None if the conversation is unknown or evicted
+        """
+
+    @abstractmethod
+    def append(self, conversation_id: str, messages: List[Dict[str, Any]]) -> bool:
+        """
+        Append messages to a conversation's log.
+
+        Args:
+            conversation_id: Conversation to extend
+            messages: Messages to append, in order
+
+        Returns:
+            False if the conversation is unknown or was evicted (nothing is appended)
+        """
+
+    @abstractmethod
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get store statistics.
+
+        Returns:
+            Dictionary with conversation counts and eviction counters
+        """
+
+    def start_turn(
+        self,
+        conversation_id: Optional[str],
+        message: Union[str, Dict[str, Any]]
+    ) -> Tuple[str, List[Dict[str, Any]], int]:
+        """
+        Rebuild the context for a new message in a conversation.
+
+        Args:
+            conversation_id: Existing conversation, or None to start a new one
+            message: The new user message (a string is treated as user content)
+
+        Returns:
+            Tuple of (conversation id, full message list for the LLM, index of the new message)
+
+        Raises:
+            KeyError: If the conversation is unknown or was evicted
+            ValueError: If the message is not a string or a user message with string content
+        """
+        if isinstance(message, str):
+            message = {'role': 'user', 'content': message}
+        if not isinstance(message, dict) or message.get('role') != 'user' or not isinstance(message.get('content'), str):
+            raise ValueError('Message must be a string or a user message with string content')
+
+        if conversation_id is None:
+            conversation_id = self.create()
+            history: List[Dict[str, Any]] = []
+        else:
+            history = self.get(conversation_id)
+            if history is None:
+                raise KeyError(conversation_id)
+
+        return conversation_id, history + [message], len(history)
+
+    def finish_turn(
+        self,
+        conversation_id: str,
+        messages: List[Dict[str, Any]],
+        turn_start: int,
+        response: Dict[str, Any]
+    ) -> bool:
+        """
+        Persist a completed turn: the user message, tool traffic and the final response.
+
+        Args:
+            conversation_id: Conversation the turn belongs to
+            messages: Message list the LLM service worked on (extended in place with tool traffic)
+            turn_start: Index of the turn's user message, as returned by start_turn
+            response: Final assistant response
+
+        Returns:
+            False if the conversation was evicted during the turn (the turn is not stored)
+        """
+        return self.append(conversation_id, messages[turn_start:] + [response])
+
+
+class InMemoryConversationStore(ConversationStore):
+    """Process-local conversation store backed by an LRU ordered dictionary."""
+
+    def __init__(
+        self,
+        max_conversations: int = CONVERSATION_MAX_COUNT,
+        ttl_seconds: float = CONVERSATION_TTL_SECONDS
+    ) -> None:
+        """
+        Initialize an empty in-memory store.
+
+        Args:
+            max_conversations: Maximum number of conversations kept
+            ttl_seconds: Idle time after which a conversation is evicted
+        """
+        self.max_conversations = max_conversations
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        # conversation_id -> (last_access, messages), least recently used first
+        self._conversations: "OrderedDict[str, tuple]" = OrderedDict()
+        self._evictions = 0
+
+    def _evict(self, now: float) -> None:
+        """Drop expired and excess conversations. Caller must hold the lock."""
+        while self._conversations:
+            conversation_id, (last_access, _) = next(iter(self._conversations.items()))
+            expired = now - last_access > self.ttl_seconds
+            if not expired and len(self._conversations) <= self.max_conversations:
+                break
+            del self._conversations[conversation_id]
+            self._evictions += 1
+
+    def create(self) -> str:
+        conversation_id = _generate_conversation_id()
+        with self._lock:
+            now = time.monotonic()
+            self._conversations[conversation_id] = (now, [])
+            self._evict(now)
+        return conversation_id
+
+    def get(self, conversation_id: str) -> Optional[List[Dict[str, Any]]]:
+        with self._lock:
+            now = time.monotonic()
+            self._evict(now)
+            entry = self._conversations.get(conversation_id)
+            if entry is None:
+                return None
+            self._conversations[conversation_id] = (now, entry[1])
+            self._conversations.move_to_end(conversation_id)
+            return list(entry[1])
+
+    def append(self, conversation_id: str, messages: List[Dict[str, Any]]) -> bool:
+        with self._lock:
+            now = time.monotonic()
+            self._evict(now)
+            entry = self._conversations.get(conversation_id)
+            if entry is None:
+                return False
+            log = entry[1]
+            log.extend(to_history_message(message) for message in messages)
+            self._conversations[conversation_id] = (now, log)
+            self._conversations.move_to_end(conversation_id)
+            return True
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'backend': 'memory',
+                'conversations': len(self._conversations),
+                'evictions': self._evictions,
+                'max_conversations': self.max_conversations,
+                'ttl_seconds': self.ttl_seconds
+            }
+
+
+class SQLiteConversationStore(ConversationStore):
+    """Conversation store persisted in SQLite, shareable between worker processes on one host."""
+
+    def __init__(
+        self,
+        path: str = CONVERSATION_DB_PATH,
+        max_conversations: int = CONVERSATION_MAX_COUNT,
+        ttl_seconds: float = CONVERSATION_TTL_SECONDS
+    ) -> None:
+        """
+        Open (and if needed create) the SQLite store.
+
+        Args:
+            path: Database file path
+            max_conversations: Maximum number of conversations kept
+            ttl_seconds: Idle time after which a conversation is evicted
+        """
+        self.path = path
+        self.max_conversations = max_conversations
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._evictions = 0
+
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.execute('PRAGMA foreign_keys=ON')
+        self._connection.execute(
+            'CREATE TABLE IF NOT EXISTS conversations ('
+            'id TEXT PRIMARY KEY, updated_at REAL NOT NULL)'
+        )
+        self._connection.execute(
+            'CREATE TABLE IF NOT EXISTS messages ('
+            'conversation_id TEXT NOT NULL REFERENCES conversations(id) ON DELETE CASCADE, '
+            'seq INTEGER NOT NULL, body TEXT NOT NULL, '
+            'PRIMARY KEY (conversation_id, seq))'
+        )
+        self._connection.execute(
+            'CREATE INDEX IF NOT EXISTS conversations_updated_at ON conversations(updated_at)'
+        )
+
+    def _evict(self, now: float) -> None:
+        """Drop expired and excess conversations. Caller must hold the lock."""
+        cursor = self._connection.execute(
+            'DELETE FROM conversations WHERE updated_at < ?', (now - self.ttl_seconds,)
+        )
+        self._evictions += cursor.rowcount
+
+        cursor = self._connection.execute(
+            'DELETE FROM conversations WHERE id IN ('
+            'SELECT id FROM conversations ORDER BY updated_at DESC LIMIT -1 OFFSET ?)',
+            (self.max_conversations,)
+        )
+        self._evictions += cursor.rowcount
+
+    def create(self) -> str:
+        conversation_id = _generate_conversation_id()
+        with self._lock:
+            now = time.time()
+            self._connection.execute(
+                'INSERT INTO conversations (id, updated_at) VALUES (?, ?)', (conversation_id, now)
+            )
+            self._evict(now)
+        return conversation_id
+
+    def get(self, conversation_id: str) -> Optional[List[Dict[str, Any]]]:
+        with self._lock:
+            now = time.time()
+            cursor = self._connection.execute(
+                'UPDATE conversations SET updated_at = ? WHERE id = ? AND updated_at >= ?',
+                (now, conversation_id, now - self.ttl_seconds)
+            )
+            if cursor.rowcount == 0:
+                return None
+
+            rows = self._connection.execute(
+                'SELECT body FROM messages WHERE conversation_id = ? ORDER BY seq', (conversation_id,)
+            ).fetchall()
+            return [json.loads(body) for (body,) in rows]
+
+    def append(self, conversation_id: str, messages: List[Dict[str, Any]]) -> bool:
+        with self._lock:
+            now = time.time()
+            self._connection.execute('BEGIN IMMEDIATE')
+            try:
+                cursor = self._connection.execute(
+                    'UPDATE conversations SET updated_at = ? WHERE id = ? AND updated_at >= ?',
+                    (now, conversation_id, now - self.ttl_seconds)
+                )
+                if cursor.rowcount == 0:
+                    self._connection.execute('ROLLBACK')
+                    return False
+
+                (next_seq,) = self._connection.execute(
+                    'SELECT COALESCE(MAX(seq) + 1, 0) FROM messages WHERE conversation_id = ?',
+                    (conversation_id,)
+                ).fetchone()
+                self._connection.executemany(
+                    'INSERT INTO messages (conversation_id, seq, body) VALUES (?, ?, ?)',
+                    [
+                        (conversation_id, next_seq + offset, json.dumps(to_history_message(message)))
+                        for offset, message in enumerate(messages)
+                    ]
+                )
+                self._evict(now)
+                self._connection.execute('COMMIT')
+                return True
+            except Exception:
+                self._connection.execute('ROLLBACK')
+                raise
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            (conversations,) = self._connection.execute('SELECT COUNT(*) FROM conversations').fetchone()
+            return {
+                'backend': 'sqlite',
+                'path': self.path,
+                'conversations': conversations,
+                'evictions': self._evictions,
+                'max_conversations': self.max_conversations,
+                'ttl_seconds': self.ttl_seconds
+            }
+
+
+# ============================================================================
+# FACTORY
+# ============================================================================
+
+def create_conversation_store(backend: str = CONVERSATION_STORE) -> ConversationStore:
+    """
+    Create the configured conversation store.
+
+    Args:
+        backend: 'memory' or 'sqlite'
+
+    Returns:
+        A conversation store instance
+
+    Raises:
+        ValueError: If the backend name is unknown
+    """
+    if backend == 'memory':
+        return InMemoryConversationStore()
+    if backend == 'sqlite':
+        return SQLiteConversationStore()
+    raise ValueError(f"Unknown conversation store backend: {backend}")
@@ -0,0 +1,105 @@
+"""
+Request Deadlines
+
+Tracks the end-to-end time budget of an incoming request so that downstream
+calls (seller backend, SPT server, LLM provider) only get the time that is left.
+"""
+
+import time
+from typing import Optional, Tuple
+
+
+# ============================================================================
+# EXCEPTIONS
+# ============================================================================
+
+class DeadlineExceeded(Exception):
+    """Raised when a request deadline has no budget left for another call."""
+
+
+# ============================================================================
+# DEADLINE CLASS
+# ============================================================================
+
+class Deadline:
+    """
+    End-to-end time budget for a single incoming request.
+
+    Created when a request is received and passed down to every outbound
+    call, which clips its own timeout to the remaining budget.
+    """
+
+    def __init__(self, budget_seconds: float) -> None:
+        """
+        Start a new deadline.
+
+        Args:
+            budget_seconds: Total time allowed for the request, in seconds
+        """
+        self.budget_seconds = budget_seconds
+        self.expires_at = time.monotonic() + budget_seconds
+
+    def remaining(self) -> float:
+        """
+        Get the remaining budget.
+
+        Returns:
+            Seconds left before the deadline, never negative
+        """
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self) -> bool:
+        """
+        Check whether the budget is used up.
+
+        Returns:
+            True if no time is left
+        """
+        return self.remaining() <= 0
+
+    def timeout(self, connect_timeout: float, read_timeout: float) -> Tuple[float, float]:
+        """
+        Clip a (connect, read) timeout pair to the remaining budget.
+
+        Args:
+            connect_timeout: Operation's own connect timeout in seconds
+            read_timeout: Operation's own read timeout in seconds
+
+        Returns:
+            Tuple of (connect timeout, read timeout) suitable for requests
+
+        Raises:
+            DeadlineExceeded: If the deadline has already expired
+        """
+        remaining = self.remaining()
+        if remaining <= 0:
+            raise DeadlineExceeded(f"Request deadline of {self.budget_seconds}s exceeded")
+        return min(connect_timeout, remaining), min(read_timeout, remaining)
+
+
+# ============================================================================
+# HELPER FUNCTIONS
+# ============================================================================
+
+def resolve_timeout(
+    connect_timeout: float,
+    read_timeout: float,
+    deadline: Optional[Deadline] = None
+) -> Tuple[float, float]:
+    """
+    Resolve the timeout for an outbound call, honoring an optional deadline.
+
+    Args:
+        connect_timeout: Operation's own connect timeout in seconds
+        read_timeout: Operation's own read timeout in seconds
+        deadline: Optional end-to-end deadline of the incoming request
+
+    Returns:
+        Tuple of (connect timeout, read timeout)
+
+    Raises:
+        DeadlineExceeded: If the deadline has already expired
+    """
+    if deadline is None:
+        return connect_timeout, read_timeout
+    return deadline.timeout(connect_timeout, read_timeout)
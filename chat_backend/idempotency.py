@@ -0,0 +1,441 @@
+"""
+Idempotency Store
+
+Local record of checkout create/complete results keyed by Idempotency-Key.
+A retried request with the same key gets the recorded result back instead of
+running the operation again. A request that arrives while the first one is
+still running is rejected, and so is a key reused with different parameters.
+Only definite outcomes (successes and 4xx errors) are recorded. After a
+timeout or 5xx the retry runs again, and the seller backend deduplicates it
+by the same forwarded key. The in-memory store is per process; the SQLite
+store is shared by all worker processes on one host.
+"""
+
+import copy
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from typing import Any, Dict, Optional, Set, Tuple
+from dotenv import load_dotenv
+
+from ttl_cache import TTLCache
+
+
+load_dotenv()
+
+# ============================================================================
+# CONSTANTS
+# ============================================================================
+
+IDEMPOTENCY_TTL_SECONDS: float = float(os.getenv('IDEMPOTENCY_TTL_SECONDS', '86400'))
+IDEMPOTENCY_MAX_ENTRIES: int = int(os.getenv('IDEMPOTENCY_MAX_ENTRIES', '10000'))
+IDEMPOTENCY_STORE: str = os.getenv('IDEMPOTENCY_STORE', 'memory')
+IDEMPOTENCY_DB_PATH: str = os.getenv('IDEMPOTENCY_DB_PATH', 'idempotency.db')
+# A claimed key whose process died is released after this long (SQLite store only)
+IDEMPOTENCY_LEASE_SECONDS: float = float(os.getenv('IDEMPOTENCY_LEASE_SECONDS', '300'))
+
+IDEMPOTENCY_HEADER: str = 'Idempotency-Key'
+MAX_IDEMPOTENCY_KEY_LENGTH: int = 255
+
+# Outcomes of claiming a key, other than being allowed to run the operation
+REPLAY: str = 'replay'
+MISMATCH: str = 'mismatch'
+CONFLICT: str = 'conflict'
+
+
+# ============================================================================
+# HELPER FUNCTIONS
+# ============================================================================
+
+def new_idempotency_key() -> str:
+    """Generate a key for an operation whose caller did not send one."""
+    return str(uuid.uuid4())
+
+
+def fingerprint(params: Dict[str, Any]) -> str:
+    """
+    Hash the parameters of an operation, so a reused key can be checked against them.
+
+    Args:
+        params: JSON-serializable operation parameters
+
+    Returns:
+        Hex digest of the canonical JSON encoding
+    """
+    encoded = json.dumps(params, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(encoded.encode('utf-8')).hexdigest()
+
+
+def _is_final(result: Dict[str, Any], record_client_errors: bool = True) -> bool:
+    """
+    Check whether a result is a definite outcome that a retry must not change.
+
+    Args:
+        result: Result dictionary of the operation
+        record_client_errors: Whether 4xx errors are final
+
+    Returns:
+        True for successes and (if record_client_errors) 4xx errors; False for timeouts,
+        connection errors and 5xx
+    """
+    if 'error' not in result:
+        return True
+    status_code = result.get('status_code')
+    return record_client_errors and status_code is not None and 400 <= status_code < 500
+
+
+# ============================================================================
+# IDEMPOTENCY STORE CLASSES
+# ============================================================================
+
+class IdempotencyStore(ABC):
+    """
+    Store of operation results, keyed by operation and Idempotency-Key.
+
+    Callers run an operation between begin() and finish(). While an operation
+    runs, its key is held, so a concurrent duplicate is rejected instead of
+    running a second time. Backends implement _claim() and _release().
+    """
+
+    def __init__(self) -> None:
+        """Initialize the counters shared by all backends."""
+        # Guards the counters and the backend state
+        self._lock = threading.Lock()
+        self._replays = 0
+        self._conflicts = 0
+        self._mismatches = 0
+        self._stores = 0
+
+    @abstractmethod
+    def _claim(
+        self,
+        operation: str,
+        key: str,
+        request_fingerprint: str
+    ) -> Optional[Tuple[str, Optional[Dict[str, Any]]]]:
+        """
+        Claim a key unless it is in use or has a recorded result. Caller must hold the lock.
+
+        Returns:
+            None if the key was claimed, otherwise (REPLAY, recorded result),
+            (MISMATCH, None) or (CONFLICT, None)
+        """
+
+    @abstractmethod
+    def _release(
+        self,
+        operation: str,
+        key: str,
+        request_fingerprint: str,
+        result: Optional[Dict[str, Any]]
+    ) -> None:
+        """Release a claimed key, recording the result unless it is None. Caller must hold the lock."""
+
+    @abstractmethod
+    def _backend_stats(self) -> Dict[str, Any]:
+        """Backend-specific statistics. Caller must hold the lock."""
+
+    def begin(self, operation: str, key: str, request_fingerprint: str) -> Optional[Dict[str, Any]]:
+        """
+        Claim a key before running an operation.
+
+        Args:
+            operation: Operation name (e.g. 'create_checkout')
+            key: Idempotency key of the request
+            request_fingerprint: fingerprint() of the operation parameters
+
+        Returns:
+            None if the caller should run the operation (and call finish() afterwards),
+            otherwise the result to return instead: the recorded result of an earlier
+            request, or an error if the key is in use or was used with other parameters
+        """
+        if len(key) > MAX_IDEMPOTENCY_KEY_LENGTH:
+            return {
+                'error': f'{IDEMPOTENCY_HEADER} must be at most {MAX_IDEMPOTENCY_KEY_LENGTH} characters',
+                'status_code': 400
+            }
+
+        with self._lock:
+            claim = self._claim(operation, key, request_fingerprint)
+            if claim is None:
+                return None
+
+            outcome, recorded = claim
+            if outcome == MISMATCH:
+                self._mismatches += 1
+                return {
+                    'error': f'{IDEMPOTENCY_HEADER} was already used with different parameters',
+                    'status_code': 422
+                }
+            if outcome == CONFLICT:
+                self._conflicts += 1
+                return {
+                    'error': f'A request with this {IDEMPOTENCY_HEADER} is still in progress',
+                    'status_code': 409
+                }
+            self._replays += 1
+            return recorded
+
+    def finish(
+        self,
+        operation: str,
+        key: str,
+        request_fingerprint: str,
+        result: Dict[str, Any],
+        record_client_errors: bool = True
+    ) -> None:
+        """
+        Release a key claimed by begin(), recording the result if it is final.
+
+        Args:
+            operation: Operation name passed to begin()
+            key: Idempotency key passed to begin()
+            request_fingerprint: Fingerprint passed to begin()
+            result: Result dictionary of the operation
+            record_client_errors: Whether a 4xx result is recorded; False for keys derived
+                from the operation's arguments, whose 4xx may depend on state that changes later
+        """
+        final = _is_final(result, record_client_errors)
+        with self._lock:
+            self._release(operation, key, request_fingerprint, result if final else None)
+            if final:
+                self._stores += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get idempotency store statistics.
+
+        Returns:
+            Dictionary with store counters, replays, in-progress conflicts and parameter mismatches
+        """
+        with self._lock:
+            counters: Dict[str, Any] = {
+                'stores': self._stores,
+                'replays': self._replays,
+                'conflicts': self._conflicts,
+                'mismatches': self._mismatches
+            }
+            counters.update(self._backend_stats())
+        return counters
+
+
+class InMemoryIdempotencyStore(IdempotencyStore):
+    """Process-local idempotency store backed by a TTL + LRU cache."""
+
+    def __init__(
+        self,
+        ttl_seconds: float = IDEMPOTENCY_TTL_SECONDS,
+        max_entries: int = IDEMPOTENCY_MAX_ENTRIES
+    ) -> None:
+        """
+        Initialize an empty store.
+
+        Args:
+            ttl_seconds: How long a result is replayed for
+            max_entries: Maximum number of results kept
+        """
+        super().__init__()
+        # (operation, key) -> (fingerprint, result)
+        self.entries = TTLCache(max_entries=max_entries, ttl_seconds=ttl_seconds)
+        self._in_progress: Set[Tuple[str, str]] = set()
+
+    def _claim(
+        self,
+        operation: str,
+        key: str,
+        request_fingerprint: str
+    ) -> Optional[Tuple[str, Optional[Dict[str, Any]]]]:
+        entry = self.entries.get((operation, key))
+        if entry is not None:
+            if entry[0] != request_fingerprint:
+                return MISMATCH, None
+            return REPLAY, copy.deepcopy(entry[1])
+
+        if (operation, key) in self._in_progress:
+            return CONFLICT, None
+
+        self._in_progress.add((operation, key))
+        return None
+
+    def _release(
+        self,
+        operation: str,
+        key: str,
+        request_fingerprint: str,
+        result: Optional[Dict[str, Any]]
+    ) -> None:
+        self._in_progress.discard((operation, key))
+        if result is not None:
+            self.entries.set((operation, key), (request_fingerprint, copy.deepcopy(result)))
+
+    def _backend_stats(self) -> Dict[str, Any]:
+        counters: Dict[str, Any] = {
+            'backend': 'memory',
+            'in_progress': len(self._in_progress)
+        }
+        counters.update(self.entries.stats())
+        return counters
+
+
+class SQLiteIdempotencyStore(IdempotencyStore):
+    """
+    Idempotency store persisted in SQLite, shared by all processes that open the same file.
+    A claimed key is held for IDEMPOTENCY_LEASE_SECONDS at most, so a crashed process does not block it forever.
+    """
+
+    def __init__(
+        self,
+        path: str = IDEMPOTENCY_DB_PATH,
+        ttl_seconds: float = IDEMPOTENCY_TTL_SECONDS,
+        max_entries: int = IDEMPOTENCY_MAX_ENTRIES,
+        lease_seconds: float = IDEMPOTENCY_LEASE_SECONDS
+    ) -> None:
+        """
+        Open (and if needed create) the SQLite store.
+
+        Args:
+            path: Database file path
+            ttl_seconds: How long a result is replayed for
+            max_entries: Maximum number of results kept
+            lease_seconds: How long a claimed key is held without a result
+        """
+        super().__init__()
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.lease_seconds = lease_seconds
+        self._evictions = 0
+
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=10)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        # result is NULL while the operation runs
+        self._connection.execute(
+            'CREATE TABLE IF NOT EXISTS idempotency_keys ('
+            'operation TEXT NOT NULL, key TEXT NOT NULL, fingerprint TEXT NOT NULL, '
+            'result TEXT, expires_at REAL NOT NULL, '
+            'PRIMARY KEY (operation, key))'
+        )
+        self._connection.execute(
+            'CREATE INDEX IF NOT EXISTS idempotency_keys_expires_at ON idempotency_keys(expires_at)'
+        )
+
+    def _claim(
+        self,
+        operation: str,
+        key: str,
+        request_fingerprint: str
+    ) -> Optional[Tuple[str, Optional[Dict[str, Any]]]]:
+        self._connection.execute('BEGIN IMMEDIATE')
+        try:
+            now = time.time()
+            row = self._connection.execute(
+                'SELECT fingerprint, result FROM idempotency_keys '
+                'WHERE operation = ? AND key = ? AND expires_at >= ?',
+                (operation, key, now)
+            ).fetchone()
+
+            claim: Optional[Tuple[str, Optional[Dict[str, Any]]]] = None
+            if row is None:
+                self._connection.execute(
+                    'INSERT OR REPLACE INTO idempotency_keys (operation, key, fingerprint, result, expires_at) '
+                    'VALUES (?, ?, ?, NULL, ?)',
+                    (operation, key, request_fingerprint, now + self.lease_seconds)
+                )
+            elif row[1] is None:
+                claim = (CONFLICT, None)
+            elif row[0] != request_fingerprint:
+                claim = (MISMATCH, None)
+            else:
+                claim = (REPLAY, json.loads(row[1]))
+
+            self._connection.execute('COMMIT')
+            return claim
+        except Exception:
+            self._connection.execute('ROLLBACK')
+            raise
+
+    def _evict(self, now: float) -> None:
+        """Drop expired and excess results. Caller must hold the lock."""
+        cursor = self._connection.execute('DELETE FROM idempotency_keys WHERE expires_at < ?', (now,))
+        self._evictions += cursor.rowcount
+
+        cursor = self._connection.execute(
+            'DELETE FROM idempotency_keys WHERE rowid IN ('
+            'SELECT rowid FROM idempotency_keys WHERE result IS NOT NULL '
+            'ORDER BY expires_at DESC LIMIT -1 OFFSET ?)',
+            (self.max_entries,)
+        )
+        self._evictions += cursor.rowcount
+
+    def _release(
+        self,
+        operation: str,
+        key: str,
+        request_fingerprint: str,
+        result: Optional[Dict[str, Any]]
+    ) -> None:
+        if result is None:
+            self._connection.execute(
+                'DELETE FROM idempotency_keys WHERE operation = ? AND key = ? AND result IS NULL',
+                (operation, key)
+            )
+            return
+
+        self._connection.execute('BEGIN IMMEDIATE')
+        try:
+            now = time.time()
+            self._connection.execute(
+                'INSERT OR REPLACE INTO idempotency_keys (operation, key, fingerprint, result, expires_at) '
+                'VALUES (?, ?, ?, ?, ?)',
+                (operation, key, request_fingerprint, json.dumps(result, default=str), now + self.ttl_seconds)
+            )
+            self._evict(now)
+            self._connection.execute('COMMIT')
+        except Exception:
+            self._connection.execute('ROLLBACK')
+            raise
+
+    def _backend_stats(self) -> Dict[str, Any]:
+        in_progress, entries = self._connection.execute(
+            'SELECT COALESCE(SUM(result IS NULL), 0), COALESCE(SUM(result IS NOT NULL), 0) '
+            'FROM idempotency_keys WHERE expires_at >= ?',
+            (time.time(),)
+        ).fetchone()
+        return {
+            'backend': 'sqlite',
+            'path': self.path,
+            'in_progress': in_progress,
+            'entries': entries,
+            'max_entries': self.max_entries,
+            'ttl_seconds': self.ttl_seconds,
+            'evictions': self._evictions
+        }
+
+
+# ============================================================================
+# FACTORY
+# ============================================================================
+
+def create_idempotency_store(backend: str = IDEMPOTENCY_STORE) -> IdempotencyStore:
+    """
+    Create the configured idempotency store.
+
+    Args:
+        backend: 'memory' (this process) or 'sqlite' (all processes on the host)
+
+    Returns:
+        An idempotency store instance
+
+    Raises:
+        ValueError: If the backend name is unknown
+    """
+    if backend == 'memory':
+        return InMemoryIdempotencyStore()
+    if backend == 'sqlite':
+        return SQLiteIdempotencyStore()
+    raise ValueError(f"Unknown idempotency store backend: {backend}")
@@ -0,0 +1,140 @@
+"""
+Intent Router
+
+Recognizes short, unambiguous chat commands ("show products", "checkout")
+so the LLM service can run the matching tool directly and answer from a
+template instead of spending two LLM round trips. Anything that does not
+match a pattern exactly falls through to the LLM.
+"""
+
+import os
+import re
+import threading
+from typing import Any, Dict, List, Optional
+from dotenv import load_dotenv
+
+
+load_dotenv()
+
+# ============================================================================
+# CONSTANTS
+# ============================================================================
+
+INTENT_ROUTER_ENABLED: bool = os.getenv('INTENT_ROUTER_ENABLED', 'True').lower() == 'true'
+
+# Whole-message patterns (after normalization) for each routed tool
+INTENT_PATTERNS: Dict[str, "re.Pattern[str]"] = {
+    "list_products": re.compile(
+        r'(?:(?:show|list|see|view|browse|display)(?: me)?(?: (?:all|the|your|some|available))* '
+        r'(?:products|items|catalog|catalogue)'
+        r'|products|catalog|what do you sell|what are you selling|what is for sale)'
+    ),
+    "start_checkout": re.compile(
+        r'(?:checkout|check out|(?:go|proceed) to checkout'
+        r'|(?:i am|im) ready to (?:checkout|check out|pay))'
+    ),
+}
+
+# Courtesy words stripped from both ends of a command
+COURTESY_WORDS = {'please', 'pls', 'now', 'thanks', 'ok', 'okay'}
+
+WORD_PATTERN = re.compile(r'[a-z0-9]+')
+
+
+# ============================================================================
+# HELPER FUNCTIONS
+# ============================================================================
+
+def normalize_command(text: Optional[str]) -> str:
+    """
+    Normalize a user message for intent matching.
+
+    Lowercases, removes punctuation (so "I'm" becomes "im") and strips
+    courtesy words from the start and end.
+
+    Args:
+        text: User message content
+
+    Returns:
+        Space-separated words
+    """
+    words = WORD_PATTERN.findall(str(text or '').lower().replace("'", ''))
+    while words and words[0] in COURTESY_WORDS:
+        words.pop(0)
+    while words and words[-1] in COURTESY_WORDS:
+        words.pop()
+    return ' '.join(words)
+
+
+# ============================================================================
+# INTENT ROUTER CLASS
+# ============================================================================
+
+class IntentRouter:
+    """
+    Maps the latest user message to a tool when it is an exact, known command,
+    and keeps hit-rate counters.
+    """
+
+    def __init__(self, enabled: bool = INTENT_ROUTER_ENABLED) -> None:
+        """
+        Initialize the router.
+
+        Args:
+            enabled: Whether messages are routed at all
+        """
+        self.enabled = enabled
+
+        self._lock = threading.Lock()
+        self._requests = 0
+        self._hits: Dict[str, int] = {intent: 0 for intent in INTENT_PATTERNS}
+        self._fallbacks = 0
+
+    def match(self, messages: List[Dict[str, Any]]) -> Optional[str]:
+        """
+        Find the intent of the latest user message.
+
+        Args:
+            messages: Message history
+
+        Returns:
+            Name of the tool to run, or None to let the LLM handle the message
+        """
+        if not self.enabled:
+            return None
+
+        message = messages[-1] if messages else {}
+        command = normalize_command(message.get('content')) if message.get('role') == 'user' else ''
+        intent = next(
+            (intent for intent, pattern in INTENT_PATTERNS.items() if command and pattern.fullmatch(command)),
+            None
+        )
+
+        with self._lock:
+            self._requests += 1
+            if intent is not None:
+                self._hits[intent] += 1
+
+        return intent
+
+    def record_fallback(self) -> None:
+        """Count a routed message that had to be handed to the LLM after all (e.g. the tool failed)."""
+        with self._lock:
+            self._fallbacks += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get router statistics.
+
+        Returns:
+            Dictionary with request, per-intent hit and fallback counters
+        """
+        with self._lock:
+            hits = sum(self._hits.values()) - self._fallbacks
+            return {
+                'enabled': self.enabled,
+                'requests': self._requests,
+                'hits': dict(self._hits),
+                'fallbacks': self._fallbacks,
+                'hit_rate': hits / self._requests if self._requests else 0.0
+            }
@@ -0,0 +1,333 @@
+"""
+LLM Backends
+
+Transport layer behind LLMService. The HTTP backend talks to any
+OpenAI-compatible chat completions endpoint (dat1 by default); the mock
+backend answers locally from a script of tool calls with configurable
+latency, so the chat path can be load-tested offline without cost or
+provider rate limits.
+"""
+
+import json
+import os
+import random
+import re
+import time
+import uuid
+from abc import ABC, abstractmethod
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+import requests
+from dotenv import load_dotenv
+
+from projection import estimate_tokens
+
+
+load_dotenv()
+
+# ============================================================================
+# CONSTANTS
+# ============================================================================
+
+LLM_BACKEND: str = os.getenv('LLM_BACKEND', 'http')
+LLM_API_URL: str = os.getenv('LLM_API_URL', 'https://api.dat1.co/api/v1/collection/open-ai/chat/completions')
+LLM_MODEL: str = os.getenv('LLM_MODEL', 'gpt-120-oss')
+DAT1_API_KEY: Optional[str] = os.getenv('DAT1_API_KEY')
+
+# Mock backend: latency of each call, e.g. 'fixed:0.2', 'uniform:0.1,0.5', 'normal:0.3,0.05', 'lognormal:-1.2,0.4'
+MOCK_LLM_LATENCY: str = os.getenv('MOCK_LLM_LATENCY', 'normal:0.3,0.1')
+# Mock backend: delay between streamed chunks
+MOCK_LLM_CHUNK_DELAY_SECONDS: float = float(os.getenv('MOCK_LLM_CHUNK_DELAY_SECONDS', '0.01'))
+# Mock backend: optional JSON file with a list of {"pattern", "tool", "arguments"} rules
+MOCK_LLM_SCRIPT: Optional[str] = os.getenv('MOCK_LLM_SCRIPT')
+
+# Default mock script: first rule whose pattern matches the latest user message wins.
+# Only frontend-signal tools are used, so a load test needs no seller backend or Stripe.
+DEFAULT_MOCK_SCRIPT: List[Dict[str, Any]] = [
+    {"pattern": r"check ?out|pay", "tool": "start_checkout", "arguments": {}},
+    {"pattern": r"item_\w+", "tool": "add_to_cart", "arguments": {"item_id": "{match}"}},
+]
+
+TimeoutType = Tuple[float, float]
+
+
+# ============================================================================
+# HELPER FUNCTIONS
+# ============================================================================
+
+def parse_latency(spec: str) -> Callable[[], float]:
+    """
+    Build a latency sampler from a distribution spec.
+
+    Args:
+        spec: '<distribution>:<param>[,<param>]' with distribution one of
+            fixed (seconds), uniform (low, high), normal (mean, stddev) or
+            lognormal (mu, sigma of the underlying normal)
+
+    Returns:
+        Function returning a non-negative latency in seconds
+
+    Raises:
+        ValueError: If the spec cannot be parsed
+    """
+    name, _, raw_params = spec.partition(':')
+    params = [float(param) for param in raw_params.split(',') if param.strip()]
+
+    samplers: Dict[str, Tuple[int, Callable[..., float]]] = {
+        'fixed': (1, lambda seconds: seconds),
+        'uniform': (2, random.uniform),
+        'normal': (2, random.gauss),
+        'lognormal': (2, random.lognormvariate),
+    }
+    if name not in samplers or len(params) != samplers[name][0]:
+        raise ValueError(f"Invalid latency distribution: {spec}")
+
+    sample = samplers[name][1]
+    return lambda: max(0.0, sample(*params))
+
+
+def _load_mock_script(path: Optional[str]) -> List[Dict[str, Any]]:
+    """
+    Load the mock tool-call script.
+
+    Args:
+        path: JSON file with a list of rules, or None for the default script
+
+    Returns:
+        List of rules
+    """
+    if not path:
+        return DEFAULT_MOCK_SCRIPT
+    with open(path) as script_file:
+        return json.load(script_file)
+
+
+# ============================================================================
+# LLM BACKEND CLASSES
+# ============================================================================
+
+class LLMBackend(ABC):
+    """
+    Interface for chat completions transports.
+
+    Request bodies are complete JSON chat completions payloads (see PromptPrefix).
+    """
+
+    model: str
+
+    @property
+    def configured(self) -> bool:
+        """Whether the backend has what it needs (e.g. credentials) to serve requests."""
+        return True
+
+    @abstractmethod
+    def complete(self, body: bytes, timeout: TimeoutType) -> Dict[str, Any]:
+        """
+        Run a non-streaming chat completion.
+
+        Args:
+            body: JSON request body
+            timeout: Tuple of (connect timeout, read timeout)
+
+        Returns:
+            Chat completions response dictionary
+
+        Raises:
+            Exception: On transport or provider errors
+        """
+
+    @abstractmethod
+    def stream(self, body: bytes, timeout: TimeoutType) -> Iterator[Dict[str, Any]]:
+        """
+        Run a streaming chat completion.
+
+        Args:
+            body: JSON request body (with "stream": true)
+            timeout: Tuple of (connect timeout, read timeout)
+
+        Yields:
+            Chat completions chunk dictionaries
+
+        Raises:
+            Exception: On transport or provider errors
+        """
+
+    @abstractmethod
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get backend details.
+
+        Returns:
+            Dictionary describing the backend
+        """
+
+
+class HTTPBackend(LLMBackend):
+    """OpenAI-compatible chat completions over HTTP, on a keep-alive session."""
+
+    def __init__(self, api_url: str = LLM_API_URL, api_key: Optional[str] = DAT1_API_KEY, model: str = LLM_MODEL) -> None:
+        """
+        Initialize the HTTP backend.
+
+        Args:
+            api_url: Chat completions endpoint
+            api_key: Bearer token for the provider
+            model: Model name sent with each request
+        """
+        self.api_url = api_url
+        self.api_key = api_key
+        self.model = model
+        self.session = requests.Session()
+        self.session.headers.update({
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {api_key}"
+        })
+
+    @property
+    def configured(self) -> bool:
+        return bool(self.api_key)
+
+    def complete(self, body: bytes, timeout: TimeoutType) -> Dict[str, Any]:
+        response = self.session.post(self.api_url, data=body, timeout=timeout)
+        response.raise_for_status()
+        return response.json()
+
+    def stream(self, body: bytes, timeout: TimeoutType) -> Iterator[Dict[str, Any]]:
+        with self.session.post(self.api_url, data=body, timeout=timeout, stream=True) as response:
+            response.raise_for_status()
+
+            for line in response.iter_lines(decode_unicode=True):
+                # Server-sent events: only 'data:' lines carry chunks
+                if not line or not line.startswith('data:'):
+                    continue
+                data = line[len('data:'):].strip()
+                if data == '[DONE]':
+                    return
+                yield json.loads(data)
+
+    def stats(self) -> Dict[str, Any]:
+        return {'backend': 'http', 'model': self.model, 'api_url': self.api_url}
+
+
+class MockBackend(LLMBackend):
+    """
+    Local stand-in for the LLM provider.
+
+    For a new user message, the first script rule whose pattern matches
+    requests its tool (the rule's arguments may use '{match}' for the matched
+    text); otherwise, or once tool results are in, it answers in plain text.
+    Every call sleeps for a latency sampled from the configured distribution.
+    """
+
+    def __init__(
+        self,
+        latency: str = MOCK_LLM_LATENCY,
+        script: Optional[List[Dict[str, Any]]] = None,
+        chunk_delay_seconds: float = MOCK_LLM_CHUNK_DELAY_SECONDS,
+        model: str = 'mock'
+    ) -> None:
+        """
+        Initialize the mock backend.
+
+        Args:
+            latency: Latency distribution spec (see parse_latency)
+            script: Tool-call rules; defaults to MOCK_LLM_SCRIPT or the built-in script
+            chunk_delay_seconds: Delay between streamed chunks
+            model: Model name reported by the backend
+        """
+        self.latency = latency
+        self.sample_latency = parse_latency(latency)
+        self.script = script if script is not None else _load_mock_script(MOCK_LLM_SCRIPT)
+        self.chunk_delay_seconds = chunk_delay_seconds
+        self.model = model
+
+    def _respond(self, body: bytes, timeout: TimeoutType) -> Dict[str, Any]:
+        """Sleep for a sampled latency (bounded by the read timeout) and build the scripted message"""
+        latency = self.sample_latency()
+        if latency > timeout[1]:
+            time.sleep(timeout[1])
+            raise requests.exceptions.ReadTimeout(f"Mock LLM latency {latency:.3f}s exceeded read timeout")
+        time.sleep(latency)
+
+        payload = json.loads(body)
+        messages = payload['messages']
+        last = messages[-1] if messages else {}
+        tools_allowed = payload.get('tool_choice') != 'none'
+
+        if last.get('role') == 'user' and tools_allowed:
+            text = str(last.get('content') or '')
+            for rule in self.script:
+                match = re.search(rule['pattern'], text, re.IGNORECASE)
+                if match:
+                    arguments = {
+                        key: value.replace('{match}', match.group(0)) if isinstance(value, str) else value
+                        for key, value in rule.get('arguments', {}).items()
+                    }
+                    return {
+                        "role": "assistant",
+                        "content": None,
+                        "tool_calls": [{
+                            "id": f"call_{uuid.uuid4().hex[:24]}",
+                            "type": "function",
+                            "function": {"name": rule['tool'], "arguments": json.dumps(arguments)}
+                        }]
+                    }
+
+        tools_used = [message.get('name') for message in messages if message.get('role') == 'tool']
+        if last.get('role') == 'tool':
+            content = f"Mock answer after running {', '.join(dict.fromkeys(tools_used))}."
+        else:
+            content = "Mock answer: how can I help you with your shopping today?"
+        return {"role": "assistant", "content": content}
+
+    def complete(self, body: bytes, timeout: TimeoutType) -> Dict[str, Any]:
+        message = self._respond(body, timeout)
+        prompt_tokens = estimate_tokens(body.decode('utf-8'))
+        completion_tokens = estimate_tokens(json.dumps(message))
+        return {
+            "choices": [{"index": 0, "message": message, "finish_reason": "tool_calls" if message.get('tool_calls') else "stop"}],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens
+            }
+        }
+
+    def stream(self, body: bytes, timeout: TimeoutType) -> Iterator[Dict[str, Any]]:
+        message = self._respond(body, timeout)
+
+        if message.get('tool_calls'):
+            for index, tool_call in enumerate(message['tool_calls']):
+                yield {"choices": [{"index": 0, "delta": {"tool_calls": [dict(tool_call, index=index)]}}]}
+            return
+
+        for word in re.findall(r'\S+\s*', message['content']):
+            yield {"choices": [{"index": 0, "delta": {"content": word}}]}
+            time.sleep(self.chunk_delay_seconds)
+
+    def stats(self) -> Dict[str, Any]:
+        return {'backend': 'mock', 'model': self.model, 'latency': self.latency, 'script_rules': len(self.script)}
+
+
+# ============================================================================
+# FACTORY
+# ============================================================================
+
+def create_llm_backend(backend: str = LLM_BACKEND) -> LLMBackend:
+    """
+    Create the configured LLM backend.
+
+    Args:
+        backend: 'http' or 'mock'
+
+    Returns:
+        An LLM backend instance
+
+    Raises:
+        ValueError: If the backend name is unknown
+    """
+    if backend == 'http':
+        return HTTPBackend()
+    if backend == 'mock':
+        return MockBackend()
+    raise ValueError(f"Unknown LLM backend: {backend}")
@@ -1,10 +1,24 @@
 import os
-import requests
+import itertools
 import json
-from typing import List, Dict, Any, Optional
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import List, Dict, Any, Optional, Tuple, Iterator, Generator
 from dotenv import load_dotenv
 
 from acp_client import ACPClient
+from context_window import ContextWindow
+from intent_router import IntentRouter
+from llm_backends import LLMBackend, create_llm_backend
+from deadline import Deadline, resolve_timeout
+from idempotency import fingerprint
+from prompt_prefix import PromptPrefix
+from response_cache import ResponseCache
+from rate_limiter import get_llm_limiter
+from retry import ResilientCaller
+from product_index import ProductIndex, DEFAULT_SEARCH_LIMIT, MAX_SEARCH_LIMIT
+from projection import serialize_tool_result, estimate_tokens
 
 load_dotenv()
 
@@ -13,7 +27,120 @@ load_dotenv()
 # CONSTANTS
 # ============================================================================
 
-DAT1_API_KEY: Optional[str] = os.getenv('DAT1_API_KEY')
+LLM_CONNECT_TIMEOUT_SECONDS: float = float(os.getenv('LLM_CONNECT_TIMEOUT_SECONDS', '3.05'))
+LLM_READ_TIMEOUT_SECONDS: float = float(os.getenv('LLM_READ_TIMEOUT_SECONDS', '60'))
+
+# Tool calls returned in one turn run concurrently on a shared pool
+TOOL_EXECUTOR_WORKERS: int = int(os.getenv('TOOL_EXECUTOR_WORKERS', '16'))
+TOOL_TIMEOUT_SECONDS: float = float(os.getenv('TOOL_TIMEOUT_SECONDS', '20'))
+TOOL_TIMEOUTS: Dict[str, float] = {
+    "complete_checkout": float(os.getenv('COMPLETE_CHECKOUT_TOOL_TIMEOUT_SECONDS', '45'))
+}
+
+# Agent loop budgets: the loop stops at whichever is hit first
+AGENT_MAX_ITERATIONS: int = int(os.getenv('AGENT_MAX_ITERATIONS', '5'))
+AGENT_MAX_TOKENS: int = int(os.getenv('AGENT_MAX_TOKENS', '32000'))
+AGENT_MAX_SECONDS: float = float(os.getenv('AGENT_MAX_SECONDS', '60'))
+
+MISSING_API_KEY_MESSAGE: Dict[str, Any] = {
+    "role": "assistant",
+    "content": "Error: DAT1_API_KEY is not configured in the backend."
+}
+LLM_UNAVAILABLE_MESSAGE: Dict[str, Any] = {
+    "role": "assistant",
+    "content": "I apologize, but I'm having trouble connecting to my brain right now."
+}
+# Returned in place of an LLM answer; never cached as one
+FALLBACK_MESSAGES: Tuple[Dict[str, Any], ...] = (MISSING_API_KEY_MESSAGE, LLM_UNAVAILABLE_MESSAGE)
+
+# Templated answers for commands handled by the intent router
+PRODUCTS_TEMPLATE = "Here are our available products: {names}. Click on any product to view details and purchase!"
+CHECKOUT_TEMPLATE = "Sure! Let's check out the items in your cart."
+
+
+# ============================================================================
+# AGENT RUN CLASS
+# ============================================================================
+
+class AgentRun:
+    """
+    Budget and timing bookkeeping for one multi-step agent loop.
+    Tracks LLM iterations, tokens and elapsed time against the configured budgets
+    and records per-iteration timings for the response trace.
+    """
+
+    def __init__(
+        self,
+        max_iterations: int = AGENT_MAX_ITERATIONS,
+        max_tokens: int = AGENT_MAX_TOKENS,
+        max_seconds: float = AGENT_MAX_SECONDS
+    ) -> None:
+        self.max_iterations = max_iterations
+        self.max_tokens = max_tokens
+        self.max_seconds = max_seconds
+        self.started_at = time.monotonic()
+        self.total_tokens = 0
+        self.iterations: List[Dict[str, Any]] = []
+        self.tool_calls: List[Dict[str, Any]] = []
+
+    def record(self, llm_seconds: float, tokens: int, tool_calls: List[Dict[str, Any]], tool_seconds: float) -> None:
+        """Record one completed iteration (an LLM call plus the tools it requested)"""
+        self.total_tokens += tokens
+        self.tool_calls.extend(tool_calls)
+        self.iterations.append({
+            "iteration": len(self.iterations) + 1,
+            "llm_seconds": round(llm_seconds, 3),
+            "tool_seconds": round(tool_seconds, 3),
+            "tokens": tokens,
+            "tools": [tool_call['function']['name'] for tool_call in tool_calls]
+        })
+
+    def exhausted(self, deadline: Optional[Deadline] = None) -> Optional[str]:
+        """Return the name of the first exhausted budget, or None if another iteration may run"""
+        if len(self.iterations) >= self.max_iterations:
+            return "max_iterations"
+        if self.total_tokens >= self.max_tokens:
+            return "token_budget"
+        if time.monotonic() - self.started_at >= self.max_seconds or (deadline is not None and deadline.expired()):
+            return "time_budget"
+        return None
+
+    def finish(self, message: Dict[str, Any], stop_reason: str) -> Dict[str, Any]:
+        """Attach executed tool calls and the loop trace to the final assistant message"""
+        if self.tool_calls:
+            message['original_tool_calls'] = self.tool_calls
+        message['agent_trace'] = {
+            "stop_reason": stop_reason,
+            "total_seconds": round(time.monotonic() - self.started_at, 3),
+            "total_tokens": self.total_tokens,
+            "iterations": self.iterations
+        }
+        return message
+
+
+def _is_fallback(message: Dict[str, Any]) -> bool:
+    """Check whether a message is a fallback returned instead of a real LLM answer"""
+    return any(message.get('content') == fallback['content'] for fallback in FALLBACK_MESSAGES)
+
+
+def _tool_idempotency_key(checkout_id: str, payment_token: str) -> str:
+    """
+    Derive the Idempotency-Key of a complete_checkout tool call from its arguments.
+    A repeated call for the same checkout and payment token (e.g. the LLM retrying after
+    the tool timed out) gets the same key, so it cannot mint a second SPT or order.
+    Only successes are recorded under it: a 4xx may depend on the checkout's state at the
+    time, so a later call after the checkout was fixed runs again.
+    """
+    digest = fingerprint({'checkout_id': checkout_id, 'payment_token': payment_token})
+    return f"chat-complete-{digest[:32]}"
+
+
+def _count_tokens(messages: List[Dict[str, Any]], response: Dict[str, Any], message: Dict[str, Any]) -> int:
+    """Total tokens of an LLM call, from provider usage when reported, otherwise estimated"""
+    usage = response.get('usage') or {}
+    if usage.get('total_tokens'):
+        return usage['total_tokens']
+    return estimate_tokens(json.dumps(messages)) + estimate_tokens(json.dumps(message))
 
 
 # ============================================================================
@@ -21,10 +148,12 @@ DAT1_API_KEY: Optional[str] = os.getenv('DAT1_API_KEY')
 # ============================================================================
 
 class LLMService:
-    def __init__(self, acp_client: ACPClient):
+    def __init__(self, acp_client: ACPClient, backend: Optional[LLMBackend] = None):
         self.acp_client = acp_client
-        self.api_url = 'https://api.dat1.co/api/v1/collection/open-ai/chat/completions'
-        self.model = 'gpt-120-oss'
+        self.backend = backend or create_llm_backend()
+        self.model = self.backend.model
+        self.product_index = ProductIndex(acp_client.iter_products)
+        self.tool_executor = ThreadPoolExecutor(max_workers=TOOL_EXECUTOR_WORKERS, thread_name_prefix='tool')
         
         # Define tools available to the LLM
         self.tools = [
@@ -40,6 +169,32 @@ class LLMService:
                     }
                 }
             },
+            {
+                "type": "function",
+                "function": {
+                    "name": "search_products",
+                    "description": "Search the full product catalog by keywords and attributes. Use this when the user looks for a specific kind of product, instead of listing everything.",
+                    "parameters": {
+                        "type": "object",
+                        "properties": {
+                            "query": {
+                                "type": "string",
+                                "description": "Keywords describing the product (e.g., 'red running shoes')"
+                            },
+                            "filters": {
+                                "type": "object",
+                                "description": "Optional exact-match attribute filters on product fields or metadata (e.g., {\"color\": \"red\"})",
+                                "additionalProperties": {"type": "string"}
+                            },
+                            "limit": {
+                                "type": "integer",
+                                "description": f"Maximum number of products to return (default {DEFAULT_SEARCH_LIMIT}, max {MAX_SEARCH_LIMIT})"
+                            }
+                        },
+                        "required": ["query"]
+                    }
+                }
+            },
             {
                 "type": "function",
                 "function": {
@@ -92,101 +247,383 @@ class LLMService:
             }
         ]
 
-    def _call_llm(self, messages: List[Dict[str, Any]]) -> Dict[str, Any]:
-        """Call the LLM API"""
-        if not DAT1_API_KEY:
-            return {
-                "role": "assistant",
-                "content": "Error: DAT1_API_KEY is not configured in the backend."
-            }
+        # Static request parts are serialized once and reused as the body prefix of every call
+        self.prompt_prefix = PromptPrefix(self.model, self.tools)
+        self.context_window = ContextWindow(reserved_tokens=self.prompt_prefix.tokens)
+        self.response_cache = ResponseCache()
+        self.intent_router = IntentRouter()
+        self.llm_caller = ResilientCaller()
+        # Shared by every LLMService in the process, so the limits hold across services and threads
+        self.llm_limiter = get_llm_limiter()
+
+    def _build_llm_request(
+        self,
+        messages: List[Dict[str, Any]],
+        stream: bool = False,
+        allow_tools: bool = True
+    ) -> bytes:
+        """Build the JSON body for a chat completions request, fitting the history to the context window"""
+        return self.prompt_prefix.build_body(
+            self.context_window.fit(messages),
+            stream=stream,
+            allow_tools=allow_tools
+        )
+
+    def _call_llm(
+        self,
+        messages: List[Dict[str, Any]],
+        deadline: Optional[Deadline] = None,
+        allow_tools: bool = True
+    ) -> Tuple[Dict[str, Any], int]:
+        """
+        Call the LLM API, bounded by the per-call timeout and the optional request deadline.
+        Each attempt first waits for admission by the shared rate limiter. Transient failures
+        (connection errors, timeouts, 429/5xx) are retried with backoff, and slow calls may be
+        hedged (see ResilientCaller).
+        Returns the assistant message and the number of tokens the call used.
+        """
+        if not self.backend.configured:
+            return dict(MISSING_API_KEY_MESSAGE), 0
+
+        body = self._build_llm_request(messages, allow_tools=allow_tools)
+
+        def attempt() -> Dict[str, Any]:
+            with self.llm_limiter.slot(deadline):
+                timeout = resolve_timeout(LLM_CONNECT_TIMEOUT_SECONDS, LLM_READ_TIMEOUT_SECONDS, deadline)
+                return self.backend.complete(body, timeout)
+
+        try:
+            response_data = self.llm_caller.call(attempt, deadline=deadline)
+            message = response_data['choices'][0]['message']
+            return message, _count_tokens(messages, response_data, message)
+        except Exception as e:
+            print(f"LLM API Error: {e}")
+            return dict(LLM_UNAVAILABLE_MESSAGE), 0
+
+    def _stream_llm(
+        self,
+        messages: List[Dict[str, Any]],
+        deadline: Optional[Deadline] = None,
+        allow_tools: bool = True
+    ) -> Generator[str, None, Dict[str, Any]]:
+        """
+        Call the LLM API in streaming mode.
+        Yields content tokens as they arrive and returns the assembled assistant message,
+        including any tool calls whose name and arguments were streamed in fragments.
+        Opening the stream is retried like _call_llm; once a chunk has arrived it is not.
+        One rate limiter admission is held for the whole stream.
+        """
+        if not self.backend.configured:
+            return dict(MISSING_API_KEY_MESSAGE)
+
+        body = self._build_llm_request(messages, stream=True, allow_tools=allow_tools)
+        content_parts: List[str] = []
+        tool_calls: Dict[int, Dict[str, Any]] = {}
+
+        def open_stream() -> Tuple[List[Dict[str, Any]], Iterator[Dict[str, Any]]]:
+            timeout = resolve_timeout(LLM_CONNECT_TIMEOUT_SECONDS, LLM_READ_TIMEOUT_SECONDS, deadline)
+            chunks = iter(self.backend.stream(body, timeout))
+            first_chunk = next(chunks, None)
+            return ([first_chunk] if first_chunk is not None else []), chunks
+
+        try:
+            with self.llm_limiter.slot(deadline):
+                first_chunks, chunks = self.llm_caller.call(open_stream, deadline=deadline, hedge=False)
+                for chunk in itertools.chain(first_chunks, chunks):
+                    choices = chunk.get('choices') or []
+                    if not choices:
+                        continue
+                    delta = choices[0].get('delta') or {}
 
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {DAT1_API_KEY}"
+                    if delta.get('content'):
+                        content_parts.append(delta['content'])
+                        yield delta['content']
+
+                    for fragment in delta.get('tool_calls') or []:
+                        tool_call = tool_calls.setdefault(fragment.get('index', 0), {
+                            "id": None,
+                            "type": "function",
+                            "function": {"name": "", "arguments": ""}
+                        })
+                        if fragment.get('id'):
+                            tool_call['id'] = fragment['id']
+                        function = fragment.get('function') or {}
+                        tool_call['function']['name'] += function.get('name') or ''
+                        tool_call['function']['arguments'] += function.get('arguments') or ''
+        except Exception as e:
+            print(f"LLM API Error: {e}")
+            return dict(LLM_UNAVAILABLE_MESSAGE)
+
+        message: Dict[str, Any] = {"role": "assistant", "content": ''.join(content_parts) or None}
+        if tool_calls:
+            message['tool_calls'] = [tool_calls[index] for index in sorted(tool_calls)]
+        return message
+
+    def _stream_tokens(
+        self,
+        messages: List[Dict[str, Any]],
+        deadline: Optional[Deadline],
+        allow_tools: bool = True
+    ) -> Generator[Dict[str, Any], None, Dict[str, Any]]:
+        """Wrap streamed LLM content fragments as 'token' events and return the assembled message"""
+        stream = self._stream_llm(messages, deadline=deadline, allow_tools=allow_tools)
+        while True:
+            try:
+                token = next(stream)
+            except StopIteration as stop:
+                return stop.value
+            yield {"event": "token", "data": {"content": token}}
+
+    def _execute_tool(self, function_name: str, function_args: Dict[str, Any], deadline: Optional[Deadline] = None) -> str:
+        """Execute a single tool call and return its result as the tool message content"""
+        # Handle tools that need backend execution
+        if function_name == "list_products":
+            products = self.acp_client.list_products(deadline=deadline)
+            return serialize_tool_result(function_name, products)
+
+        if function_name == "search_products":
+            products = self.product_index.search(
+                query=function_args.get('query', ''),
+                filters=function_args.get('filters'),
+                limit=function_args.get('limit', DEFAULT_SEARCH_LIMIT)
+            )
+            return serialize_tool_result(function_name, products)
+
+        if function_name == "complete_checkout":
+            result = self.acp_client.complete_checkout(
+                checkout_id=function_args['checkout_id'],
+                payment_token=function_args['payment_token'],
+                deadline=deadline,
+                idempotency_key=_tool_idempotency_key(function_args['checkout_id'], function_args['payment_token']),
+                record_client_errors=False
+            )
+            return serialize_tool_result(function_name, result)
+
+        # Handle tools that are just signals for the frontend
+        # For these, we still need to provide a result to the LLM so it knows what happened
+        if function_name == "add_to_cart":
+            return json.dumps({"status": "success", "message": f"Added {function_args.get('item_id')} to cart"})
+
+        if function_name == "start_checkout":
+            return json.dumps({"status": "success", "message": "Checkout started"})
+
+        return json.dumps({"error": "Unknown tool"})
+
+    def _run_tool_call(self, tool_call: Dict[str, Any], deadline: Optional[Deadline] = None) -> Dict[str, Any]:
+        """Execute a tool call requested by the LLM and build the tool message for the history"""
+        function_name = tool_call['function']['name']
+        function_args = json.loads(tool_call['function']['arguments'] or '{}')
+
+        return {
+            "role": "tool",
+            "tool_call_id": tool_call['id'],
+            "name": function_name,
+            "content": self._execute_tool(function_name, function_args, deadline=deadline)
         }
 
-        payload = {
-            "model": self.model,
-            "messages": messages,
-            "tools": self.tools,
-            "temperature": 0.7
+    def _run_tool_calls(self, tool_calls: List[Dict[str, Any]], deadline: Optional[Deadline] = None) -> List[Dict[str, Any]]:
+        """
+        Execute all tool calls of one LLM turn concurrently.
+        Returns the tool messages in the same order as tool_calls. A call that exceeds its
+        timeout (or the request deadline) gets an error result; its worker thread is left to finish.
+        """
+        futures = [
+            self.tool_executor.submit(self._run_tool_call, tool_call, deadline)
+            for tool_call in tool_calls
+        ]
+
+        tool_messages = []
+        for tool_call, future in zip(tool_calls, futures):
+            function_name = tool_call['function']['name']
+            timeout = TOOL_TIMEOUTS.get(function_name, TOOL_TIMEOUT_SECONDS)
+            if deadline is not None:
+                timeout = min(timeout, deadline.remaining())
+
+            try:
+                tool_messages.append(future.result(timeout=timeout))
+            except FutureTimeoutError:
+                print(f"Tool {function_name} timed out after {timeout:.1f}s")
+                tool_messages.append(self._build_tool_error(tool_call, "Tool timed out"))
+            except Exception as e:
+                print(f"Tool {function_name} failed: {e}")
+                tool_messages.append(self._build_tool_error(tool_call, "Tool failed"))
+
+        return tool_messages
+
+    def _build_tool_error(self, tool_call: Dict[str, Any], error: str) -> Dict[str, Any]:
+        """Build a tool message reporting that a tool call did not produce a result"""
+        return {
+            "role": "tool",
+            "tool_call_id": tool_call['id'],
+            "name": tool_call['function']['name'],
+            "content": json.dumps({"error": error})
         }
 
+    def _route_intent(
+        self,
+        messages: List[Dict[str, Any]],
+        run: AgentRun,
+        deadline: Optional[Deadline] = None
+    ) -> Optional[Tuple[Dict[str, Any], Dict[str, Any], Dict[str, Any]]]:
+        """
+        Answer an obvious command by running its tool directly, without calling the LLM.
+        On a match, appends the tool call and result to the history and returns
+        (tool_call, tool_message, final response). Returns None if nothing matched or
+        the tool failed, in which case the LLM handles the message as usual.
+        """
+        intent = self.intent_router.match(messages)
+        if intent is None:
+            return None
+
+        tool_call = {
+            "id": f"call_{uuid.uuid4().hex[:24]}",
+            "type": "function",
+            "function": {"name": intent, "arguments": "{}"}
+        }
+        tools_started = time.monotonic()
         try:
-            response = requests.post(self.api_url, headers=headers, json=payload)
-            response.raise_for_status()
-            return response.json()['choices'][0]['message']
+            tool_message = self._run_tool_call(tool_call, deadline=deadline)
         except Exception as e:
-            print(f"LLM API Error: {e}")
-            return {
-                "role": "assistant",
-                "content": "I apologize, but I'm having trouble connecting to my brain right now."
-            }
+            print(f"Routed tool {intent} failed: {e}")
+            self.intent_router.record_fallback()
+            return None
+        tool_seconds = time.monotonic() - tools_started
 
-    def process_message(self, messages: List[Dict[str, Any]]) -> Dict[str, Any]:
+        result = json.loads(tool_message['content'])
+        if isinstance(result, dict) and 'error' in result:
+            content = None
+        elif intent == "list_products":
+            names = [product['name'] for product in result if product.get('name')] if isinstance(result, list) else []
+            content = PRODUCTS_TEMPLATE.format(names=', '.join(names)) if names else None
+        else:
+            content = CHECKOUT_TEMPLATE
+
+        if content is None:
+            self.intent_router.record_fallback()
+            return None
+
+        messages.append({"role": "assistant", "content": None, "tool_calls": [tool_call]})
+        messages.append(tool_message)
+        run.record(0.0, 0, [tool_call], tool_seconds)
+        response_message = run.finish({"role": "assistant", "content": content}, "intent_router")
+        return tool_call, tool_message, response_message
+
+    def _catalog_version(self) -> Tuple[int, int]:
+        """Version of the catalog data that list_products and search_products answers depend on"""
+        return self.acp_client.catalog_cache.version, self.product_index.version
+
+    def process_message(self, messages: List[Dict[str, Any]], deadline: Optional[Deadline] = None) -> Dict[str, Any]:
         """
         Process a chat message history, execute tools if needed, and return the final response.
         Returns a dict with 'role' and 'content', and optionally 'tool_calls' if the frontend needs to act.
+        The optional deadline bounds all LLM and ACP calls made while handling the message.
+
+        Runs an agent loop: as long as the model asks for tools, they are executed and the model
+        is called again, until it answers in plain text or the iteration/token/time budget runs
+        out, in which case one last call asks the model to answer without tools.
+
+        Obvious commands ("show products", "checkout") are answered by the intent router,
+        and when the response cache is enabled, answers to stateless catalog questions are
+        served from it; neither calls the LLM.
         """
-        
-        # First call to LLM
-        response_message = self._call_llm(messages)
-        
-        # Check for tool calls
-        if response_message.get('tool_calls'):
-            # Append the assistant's message with tool calls to history
+        run = AgentRun()
+
+        routed = self._route_intent(messages, run, deadline=deadline)
+        if routed is not None:
+            return routed[2]
+
+        cache_key = self.response_cache.key(messages, self._catalog_version())
+        if cache_key is not None:
+            cached = self.response_cache.get(cache_key)
+            if cached is not None:
+                return run.finish(cached, "response_cache")
+
+        while True:
+            llm_started = time.monotonic()
+            response_message, tokens = self._call_llm(messages, deadline=deadline)
+            llm_seconds = time.monotonic() - llm_started
+
+            tool_calls = response_message.get('tool_calls')
+            if not tool_calls:
+                run.record(llm_seconds, tokens, [], 0.0)
+                response_message = run.finish(response_message, "answer")
+                if cache_key is not None and not _is_fallback(response_message):
+                    self.response_cache.store(cache_key, response_message)
+                return response_message
+
+            # Append the assistant's message with tool calls, then the tool results, to history
+            messages.append(response_message)
+            tools_started = time.monotonic()
+            messages.extend(self._run_tool_calls(tool_calls, deadline=deadline))
+            run.record(llm_seconds, tokens, tool_calls, time.monotonic() - tools_started)
+
+            stop_reason = run.exhausted(deadline)
+            if stop_reason:
+                # The frontend inspects original_tool_calls (attached by finish) to act on
+                # frontend-only tools such as add_to_cart and start_checkout.
+                final_response, _ = self._call_llm(messages, deadline=deadline, allow_tools=False)
+                return run.finish(final_response, stop_reason)
+
+    def stream_message(
+        self,
+        messages: List[Dict[str, Any]],
+        deadline: Optional[Deadline] = None
+    ) -> Generator[Dict[str, Any], None, None]:
+        """
+        Streaming variant of process_message, running the same agent loop.
+        Yields events as they happen: 'token' for each content fragment, 'tool_call' and
+        'tool_result' around each tool execution, then 'message' with the final response
+        (same shape as process_message returns) and finally 'done'.
+        """
+        run = AgentRun()
+
+        routed = self._route_intent(messages, run, deadline=deadline)
+        if routed is not None:
+            tool_call, tool_message, response_message = routed
+            yield {"event": "tool_call", "data": tool_call}
+            yield {"event": "tool_result", "data": tool_message}
+            yield {"event": "token", "data": {"content": response_message['content']}}
+            yield {"event": "message", "data": response_message}
+            yield {"event": "done", "data": {}}
+            return
+
+        cache_key = self.response_cache.key(messages, self._catalog_version())
+        cached = self.response_cache.get(cache_key) if cache_key is not None else None
+        if cached is not None:
+            yield {"event": "token", "data": {"content": cached['content']}}
+            yield {"event": "message", "data": run.finish(cached, "response_cache")}
+            yield {"event": "done", "data": {}}
+            return
+
+        while True:
+            llm_started = time.monotonic()
+            response_message = yield from self._stream_tokens(messages, deadline)
+            llm_seconds = time.monotonic() - llm_started
+            tokens = _count_tokens(messages, {}, response_message)
+
+            tool_calls = response_message.get('tool_calls')
+            if not tool_calls:
+                run.record(llm_seconds, tokens, [], 0.0)
+                response_message = run.finish(response_message, "answer")
+                if cache_key is not None and not _is_fallback(response_message):
+                    self.response_cache.store(cache_key, response_message)
+                break
+
             messages.append(response_message)
-            
-            tool_calls = response_message['tool_calls']
-            
             for tool_call in tool_calls:
-                function_name = tool_call['function']['name']
-                function_args = json.loads(tool_call['function']['arguments'])
-                tool_call_id = tool_call['id']
-                
-                tool_result = None
-                
-                # Handle tools that need backend execution
-                if function_name == "list_products":
-                    products = self.acp_client.list_products()
-                    tool_result = json.dumps(products)
-                
-                elif function_name == "complete_checkout":
-                    result = self.acp_client.complete_checkout(
-                        checkout_id=function_args['checkout_id'],
-                        payment_token=function_args['payment_token']
-                    )
-                    tool_result = json.dumps(result)
-                
-                # Handle tools that are just signals for the frontend
-                # For these, we still need to provide a result to the LLM so it knows what happened
-                elif function_name == "add_to_cart":
-                    tool_result = json.dumps({"status": "success", "message": f"Added {function_args.get('item_id')} to cart"})
-                    
-                elif function_name == "start_checkout":
-                    tool_result = json.dumps({"status": "success", "message": "Checkout started"})
-                
-                else:
-                    tool_result = json.dumps({"error": "Unknown tool"})
-
-                # Append tool result to history
-                messages.append({
-                    "role": "tool",
-                    "tool_call_id": tool_call_id,
-                    "name": function_name,
-                    "content": tool_result
-                })
-
-            # Call LLM again with tool results
-            final_response = self._call_llm(messages)
-            
-            # If the tool was a frontend action (add_to_cart, start_checkout), 
-            # we might want to include that info in the response so the frontend knows what to do.
-            # However, the standard way is that the LLM describes what it did.
-            # But for the frontend to actually update the UI, it needs to know.
-            # We can attach the original tool calls to the final response for the frontend to inspect.
-            final_response['original_tool_calls'] = tool_calls
-            
-            return final_response
-            
-        return response_message
+                yield {"event": "tool_call", "data": tool_call}
+
+            tools_started = time.monotonic()
+            for tool_message in self._run_tool_calls(tool_calls, deadline=deadline):
+                messages.append(tool_message)
+                yield {"event": "tool_result", "data": tool_message}
+            run.record(llm_seconds, tokens, tool_calls, time.monotonic() - tools_started)
+
+            stop_reason = run.exhausted(deadline)
+            if stop_reason:
+                response_message = yield from self._stream_tokens(messages, deadline, allow_tools=False)
+                response_message = run.finish(response_message, stop_reason)
+                break
+
+        yield {"event": "message", "data": response_message}
+        yield {"event": "done", "data": {}}
@@ -0,0 +1,320 @@
+"""
+Local Product Index
+
+In-memory keyword index over the product catalog, used by the LLM's
+search_products tool so that only the top matching products are sent to
+the model instead of the whole catalog.
+"""
+
+import os
+import re
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set
+from dotenv import load_dotenv
+
+
+load_dotenv()
+
+# ============================================================================
+# CONSTANTS
+# ============================================================================
+
+PRODUCT_INDEX_REFRESH_SECONDS: float = float(os.getenv('PRODUCT_INDEX_REFRESH_SECONDS', '300'))
+DEFAULT_SEARCH_LIMIT: int = 5
+MAX_SEARCH_LIMIT: int = 20
+
+# Relative weight of a query token matching each product field
+NAME_WEIGHT: float = 3.0
+DESCRIPTION_WEIGHT: float = 1.0
+METADATA_WEIGHT: float = 1.0
+
+TOKEN_PATTERN = re.compile(r'[a-z0-9]+')
+
+
+# ============================================================================
+# HELPER FUNCTIONS
+# ============================================================================
+
+def _tokenize(text: Optional[str]) -> List[str]:
+    """
+    Split text into lowercase alphanumeric tokens.
+
+    Args:
+        text: Text to tokenize (None is treated as empty)
+
+    Returns:
+        List of tokens
+    """
+    if not text:
+        return []
+    return TOKEN_PATTERN.findall(str(text).lower())
+
+
+def _weigh_product_tokens(product: Dict[str, Any]) -> Dict[str, float]:
+    """
+    Compute the weight of every token that appears in a product's searchable fields.
+
+    Args:
+        product: Stripe product dictionary
+
+    Returns:
+        Dictionary mapping token to accumulated weight
+    """
+    weights: Dict[str, float] = {}
+
+    fields = [
+        (product.get('name'), NAME_WEIGHT),
+        (product.get('description'), DESCRIPTION_WEIGHT),
+    ]
+    for key, value in (product.get('metadata') or {}).items():
+        fields.append((f"{key} {value}", METADATA_WEIGHT))
+
+    for text, weight in fields:
+        for token in _tokenize(text):
+            weights[token] = weights.get(token, 0.0) + weight
+
+    return weights
+
+
+def _matches_filters(product: Dict[str, Any], filters: Dict[str, Any]) -> bool:
+    """
+    Check whether a product satisfies attribute filters.
+
+    A filter key matches a top-level product field (e.g. 'active') or a
+    metadata key. Values are compared case-insensitively as strings.
+
+    Args:
+        product: Stripe product dictionary
+        filters: Attribute name to expected value
+
+    Returns:
+        True if every filter matches
+    """
+    metadata = product.get('metadata') or {}
+
+    for key, expected in filters.items():
+        actual = product.get(key, metadata.get(key))
+        if actual is None or str(actual).lower() != str(expected).lower():
+            return False
+
+    return True
+
+
+# ============================================================================
+# PRODUCT INDEX CLASS
+# ============================================================================
+
+class ProductIndex:
+    """
+    Thread-safe inverted index over the product catalog.
+
+    Built from a streaming product source and refreshed incrementally: a
+    refresh walks the catalog once and only re-indexes products that are new
+    or whose 'updated' timestamp changed, dropping products no longer listed.
+    """
+
+    def __init__(
+        self,
+        source: Callable[[], Iterable[Dict[str, Any]]],
+        refresh_seconds: float = PRODUCT_INDEX_REFRESH_SECONDS
+    ) -> None:
+        """
+        Initialize an empty product index.
+
+        Args:
+            source: Function returning an iterable over the full catalog
+            refresh_seconds: Age after which searches trigger a background refresh
+        """
+        self.source = source
+        self.refresh_seconds = refresh_seconds
+
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._build_lock = threading.Lock()
+        self._products: Dict[str, Dict[str, Any]] = {}
+        self._product_tokens: Dict[str, Dict[str, float]] = {}
+        self._postings: Dict[str, Dict[str, float]] = {}
+        self._built_at: Optional[float] = None
+        self._refreshing = False
+        # Incremented whenever a refresh changes the indexed products
+        self.version = 0
+
+        self._searches = 0
+        self._refreshes = 0
+        self._refresh_failures = 0
+        self._last_refresh: Dict[str, int] = {}
+
+    def _add(self, product: Dict[str, Any]) -> None:
+        """Index a product. Caller must hold the lock."""
+        product_id = product['id']
+        token_weights = _weigh_product_tokens(product)
+
+        self._products[product_id] = product
+        self._product_tokens[product_id] = token_weights
+        for token, weight in token_weights.items():
+            self._postings.setdefault(token, {})[product_id] = weight
+
+    def _remove(self, product_id: str) -> None:
+        """Remove a product from the index. Caller must hold the lock."""
+        for token in self._product_tokens.pop(product_id, {}):
+            postings = self._postings.get(token)
+            if postings is None:
+                continue
+            postings.pop(product_id, None)
+            if not postings:
+                del self._postings[token]
+
+        self._products.pop(product_id, None)
+
+    def refresh(self) -> Dict[str, int]:
+        """
+        Synchronize the index with the catalog.
+
+        Returns:
+            Counts of added, updated, removed and unchanged products
+        """
+        with self._refresh_lock:
+            counts = {'added': 0, 'updated': 0, 'removed': 0, 'unchanged': 0}
+            seen: Set[str] = set()
+
+            for product in self.source():
+                product_id = product['id']
+                seen.add(product_id)
+
+                with self._lock:
+                    existing = self._products.get(product_id)
+                    if existing is None:
+                        self._add(product)
+                        counts['added'] += 1
+                    elif existing.get('updated') != product.get('updated'):
+                        self._remove(product_id)
+                        self._add(product)
+                        counts['updated'] += 1
+                    else:
+                        counts['unchanged'] += 1
+
+            with self._lock:
+                for product_id in set(self._products) - seen:
+                    self._remove(product_id)
+                    counts['removed'] += 1
+
+                if counts['added'] or counts['updated'] or counts['removed']:
+                    self.version += 1
+                self._built_at = time.monotonic()
+                self._refreshes += 1
+                self._last_refresh = counts
+
+            return counts
+
+    def _refresh_in_background(self) -> None:
+        """Refresh the index without blocking searches."""
+        try:
+            self.refresh()
+        except Exception as e:
+            print(f"Product index refresh failed: {e}")
+            with self._lock:
+                self._refresh_failures += 1
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+    def _build(self) -> None:
+        """
+        Build the index on first use. Concurrent first searches wait for one build and reuse it;
+        a build outliving its caller's timeout still completes for the next search.
+        """
+        with self._build_lock:
+            with self._lock:
+                if self._built_at is not None:
+                    return
+            self.refresh()
+
+    def _ensure_fresh(self) -> None:
+        """Build the index on first use and schedule refreshes once it ages out."""
+        with self._lock:
+            built_at = self._built_at
+            needs_refresh = (
+                built_at is not None
+                and time.monotonic() - built_at > self.refresh_seconds
+                and not self._refreshing
+            )
+            if needs_refresh:
+                self._refreshing = True
+
+        if built_at is None:
+            self._build()
+        elif needs_refresh:
+            threading.Thread(target=self._refresh_in_background, daemon=True).start()
+
+    def search(
+        self,
+        query: str = '',
+        filters: Optional[Dict[str, Any]] = None,
+        limit: int = DEFAULT_SEARCH_LIMIT
+    ) -> List[Dict[str, Any]]:
+        """
+        Find the products that best match a keyword query and attribute filters.
+
+        Products are ranked by the summed weight of matching query tokens
+        (name matches count more than description or metadata matches). An
+        empty query returns filtered products in name order.
+
+        Args:
+            query: Free-text keywords
+            filters: Optional attribute filters (product fields or metadata keys)
+            limit: Maximum number of products to return (capped at MAX_SEARCH_LIMIT; values
+                that are not integers, e.g. from LLM tool arguments, fall back to the default)
+
+        Returns:
+            List of matching product dictionaries, best match first
+        """
+        self._ensure_fresh()
+        try:
+            limit = int(limit)
+        except (TypeError, ValueError):
+            limit = DEFAULT_SEARCH_LIMIT
+        limit = max(1, min(limit, MAX_SEARCH_LIMIT))
+        filters = filters or {}
+        query_tokens = set(_tokenize(query))
+
+        with self._lock:
+            self._searches += 1
+
+            if query_tokens:
+                scores: Dict[str, float] = {}
+                for token in query_tokens:
+                    for product_id, weight in self._postings.get(token, {}).items():
+                        scores[product_id] = scores.get(product_id, 0.0) + weight
+                ranked = sorted(scores, key=lambda product_id: (-scores[product_id], product_id))
+            else:
+                ranked = sorted(self._products, key=lambda product_id: str(self._products[product_id].get('name', '')))
+
+            results: List[Dict[str, Any]] = []
+            for product_id in ranked:
+                product = self._products[product_id]
+                if _matches_filters(product, filters):
+                    results.append(product)
+                    if len(results) >= limit:
+                        break
+
+            return results
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get index statistics.
+
+        Returns:
+            Dictionary with index size, age and refresh counters
+        """
+        with self._lock:
+            return {
+                'products': len(self._products),
+                'tokens': len(self._postings),
+                'age_seconds': None if self._built_at is None else time.monotonic() - self._built_at,
+                'searches': self._searches,
+                'refreshes': self._refreshes,
+                'refresh_failures': self._refresh_failures,
+                'last_refresh': self._last_refresh,
+                'version': self.version
+            }
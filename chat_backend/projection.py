@@ -0,0 +1,139 @@
+"""
+Tool Result Projection
+
+Reduces product and checkout tool results to the fields the LLM actually
+needs before they are injected into the prompt, and estimates their token
+cost so prompt growth can be tracked per tool result.
+"""
+
+import json
+import math
+import os
+from typing import Any, Dict, List
+from dotenv import load_dotenv
+
+
+load_dotenv()
+
+# ============================================================================
+# CONSTANTS
+# ============================================================================
+
+PRODUCT_PROJECTION_FIELDS: List[str] = [
+    field.strip()
+    for field in os.getenv('PRODUCT_PROJECTION_FIELDS', 'id,name,description,default_price').split(',')
+    if field.strip()
+]
+CHECKOUT_PROJECTION_FIELDS: List[str] = [
+    field.strip()
+    for field in os.getenv(
+        'CHECKOUT_PROJECTION_FIELDS',
+        'id,status,currency,line_items.item,line_items.total,totals.type,totals.amount,'
+        'fulfillment_option_id,order,messages'
+    ).split(',')
+    if field.strip()
+]
+
+# Rough characters-per-token ratio for English text and JSON
+CHARS_PER_TOKEN: int = 4
+
+# Tools whose results are product lists or checkout sessions
+PRODUCT_TOOLS = {'list_products', 'search_products'}
+CHECKOUT_TOOLS = {'complete_checkout'}
+
+
+# ============================================================================
+# HELPER FUNCTIONS
+# ============================================================================
+
+def project(value: Any, fields: List[str]) -> Any:
+    """
+    Keep only the listed fields of a dictionary (or of each dictionary in a list).
+
+    Field paths use dots for nested fields, e.g. 'line_items.total'. Lists are
+    projected element-wise. Missing and null fields are dropped.
+
+    Args:
+        value: Dictionary, list or scalar to project
+        fields: Field paths to keep
+
+    Returns:
+        The projected value
+    """
+    if isinstance(value, list):
+        return [project(element, fields) for element in value]
+    if not isinstance(value, dict):
+        return value
+
+    nested_fields: Dict[str, List[str]] = {}
+    for field in fields:
+        head, _, rest = field.partition('.')
+        nested_fields.setdefault(head, []).append(rest)
+
+    projected: Dict[str, Any] = {}
+    for head, rests in nested_fields.items():
+        field_value = value.get(head)
+        if field_value is None:
+            continue
+        if '' in rests:
+            projected[head] = field_value
+        else:
+            projected[head] = project(field_value, rests)
+
+    return projected
+
+
+def project_tool_result(function_name: str, result: Any) -> Any:
+    """
+    Reduce a tool result to the fields configured for its tool type.
+
+    Product tools accept either a Stripe list object or a plain list of
+    products. Results of other tools are returned unchanged.
+
+    Args:
+        function_name: Name of the tool that produced the result
+        result: Raw tool result
+
+    Returns:
+        The projected tool result
+    """
+    if isinstance(result, dict) and 'error' in result:
+        return result
+
+    if function_name in PRODUCT_TOOLS:
+        products = result.get('data', []) if isinstance(result, dict) else result
+        return project(list(products), PRODUCT_PROJECTION_FIELDS)
+
+    if function_name in CHECKOUT_TOOLS:
+        return project(result, CHECKOUT_PROJECTION_FIELDS)
+
+    return result
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Estimate the number of prompt tokens a piece of text will use.
+
+    Args:
+        text: Text to be sent to the LLM
+
+    Returns:
+        Approximate token count
+    """
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def serialize_tool_result(function_name: str, result: Any) -> str:
+    """
+    Project a tool result, serialize it compactly and log its token estimate.
+
+    Args:
+        function_name: Name of the tool that produced the result
+        result: Raw tool result
+
+    Returns:
+        JSON string to use as the tool message content
+    """
+    content = json.dumps(project_tool_result(function_name, result), separators=(',', ':'))
+    print(f"Tool result {function_name}: ~{estimate_tokens(content)} tokens ({len(content)} chars)")
+    return content
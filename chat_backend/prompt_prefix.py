@@ -0,0 +1,134 @@
+"""
+Prompt Prefix
+
+Pre-serializes the static part of every chat completions request (model,
+sampling settings, tool schema and system prompt) once, and assembles request
+bodies from cached byte fragments. The static fragments always come first and
+are byte-identical between calls, and history messages are serialized the same
+way every time, so provider-side prompt caching can reuse the shared prefix.
+"""
+
+import json
+import os
+from typing import Any, Dict, List, Optional
+from dotenv import load_dotenv
+
+from conversation_store import HISTORY_MESSAGE_KEYS, to_history_message
+from projection import estimate_tokens
+
+
+load_dotenv()
+
+# ============================================================================
+# CONSTANTS
+# ============================================================================
+
+# Optional system prompt pinned in front of every conversation
+LLM_SYSTEM_PROMPT: str = os.getenv('LLM_SYSTEM_PROMPT', '')
+
+# Compact, deterministic JSON encoding shared by all fragments
+JSON_SEPARATORS = (',', ':')
+
+STREAM_FRAGMENT: bytes = b',"stream":true'
+NO_TOOLS_FRAGMENT: bytes = b',"tool_choice":"none"'
+
+HISTORY_KEY_SET = frozenset(HISTORY_MESSAGE_KEYS)
+
+
+# ============================================================================
+# HELPER FUNCTIONS
+# ============================================================================
+
+def encode_json(value: Any, sort_keys: bool = True) -> bytes:
+    """
+    Serialize a value to compact JSON bytes.
+
+    Args:
+        value: JSON-serializable value
+        sort_keys: Sort dictionary keys for a byte-stable encoding
+
+    Returns:
+        UTF-8 encoded JSON
+    """
+    return json.dumps(value, separators=JSON_SEPARATORS, sort_keys=sort_keys).encode('utf-8')
+
+
+# ============================================================================
+# PROMPT PREFIX CLASS
+# ============================================================================
+
+class PromptPrefix:
+    """
+    Cached byte fragments for the static head of chat completions requests.
+
+    Bodies are laid out as model, temperature, tools, then messages starting
+    with the system prompt, followed by the per-call history and flags.
+    """
+
+    def __init__(
+        self,
+        model: str,
+        tools: List[Dict[str, Any]],
+        system_prompt: Optional[str] = LLM_SYSTEM_PROMPT,
+        temperature: float = 0.7
+    ) -> None:
+        """
+        Serialize the static request fragments.
+
+        Args:
+            model: Model name
+            tools: Tool definitions sent with every call
+            system_prompt: System prompt pinned before the history (None or empty for none)
+            temperature: Sampling temperature
+        """
+        self.system_message: Optional[Dict[str, Any]] = (
+            {"role": "system", "content": system_prompt} if system_prompt else None
+        )
+
+        head = (
+            b'{"model":' + encode_json(model)
+            + b',"temperature":' + encode_json(temperature)
+            + b',"tools":' + encode_json(tools)
+            + b',"messages":['
+        )
+        if self.system_message is not None:
+            head += encode_json(self.system_message)
+        self.head: bytes = head
+        self._has_system_message = self.system_message is not None
+
+        # Tools and system prompt are sent with every call, so they count against the prompt budget
+        self.tokens: int = estimate_tokens(self.head.decode('utf-8'))
+
+    def build_body(
+        self,
+        messages: List[Dict[str, Any]],
+        stream: bool = False,
+        allow_tools: bool = True
+    ) -> bytes:
+        """
+        Assemble a request body from the cached head and the history.
+
+        Args:
+            messages: History to send after the system prompt (keys the LLM does not use are dropped)
+            stream: Request a streamed response
+            allow_tools: If False, keep the tool schema (and so the prefix) but force a plain answer
+
+        Returns:
+            Complete JSON request body
+        """
+        if messages:
+            # One encoder pass over the whole history; messages keep their own key order,
+            # which is stable because history messages are only ever appended
+            history = encode_json([
+                message if message.keys() <= HISTORY_KEY_SET else to_history_message(message)
+                for message in messages
+            ], sort_keys=False)
+            body = self.head + (b',' if self._has_system_message else b'') + history[1:]
+        else:
+            body = self.head + b']'
+
+        if stream:
+            body += STREAM_FRAGMENT
+        if not allow_tools:
+            body += NO_TOOLS_FRAGMENT
+        return body + b'}'
@@ -0,0 +1,402 @@
+"""
+LLM Rate Limiter
+
+Client-side admission control for LLM calls: a token bucket caps the request
+rate and a semaphore caps requests in flight. Callers over the limit queue
+(up to a maximum wait or their request deadline) instead of being throttled
+by the provider. One limiter is shared by all LLMService instances in a
+process; with the SQLite store it is shared by all worker processes on a host.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional
+
+from dotenv import load_dotenv
+
+from deadline import Deadline
+
+
+load_dotenv()
+
+# ============================================================================
+# CONSTANTS
+# ============================================================================
+
+LLM_RATE_LIMIT_PER_SECOND: float = float(os.getenv('LLM_RATE_LIMIT_PER_SECOND', '10'))
+LLM_RATE_LIMIT_BURST: int = int(os.getenv('LLM_RATE_LIMIT_BURST', '20'))
+LLM_MAX_IN_FLIGHT: int = int(os.getenv('LLM_MAX_IN_FLIGHT', '32'))
+LLM_QUEUE_MAX_WAIT_SECONDS: float = float(os.getenv('LLM_QUEUE_MAX_WAIT_SECONDS', '30'))
+LLM_LIMITER_STORE: str = os.getenv('LLM_LIMITER_STORE', 'memory')
+LLM_LIMITER_DB_PATH: str = os.getenv('LLM_LIMITER_DB_PATH', 'llm_limiter.db')
+# In-flight slots held by a crashed process are reclaimed after this long (SQLite store)
+LLM_SLOT_LEASE_SECONDS: float = float(os.getenv('LLM_SLOT_LEASE_SECONDS', '300'))
+
+# How often a queued caller re-checks for a free in-flight slot (SQLite store)
+SLOT_POLL_SECONDS: float = 0.05
+
+
+# ============================================================================
+# EXCEPTIONS
+# ============================================================================
+
+class RateLimitTimeout(Exception):
+    """Raised when a call waited in the limiter queue for longer than allowed."""
+
+
+# ============================================================================
+# LIMITER STORE CLASSES
+# ============================================================================
+
+class LimiterStore(ABC):
+    """Interface for the state behind a rate limiter: a token bucket and in-flight slots."""
+
+    @abstractmethod
+    def take_token(self) -> float:
+        """
+        Take a token if one is available.
+
+        Returns:
+            0 if a token was taken, otherwise seconds until the next token
+        """
+
+    @abstractmethod
+    def acquire_slot(self, timeout: float) -> Optional[str]:
+        """
+        Wait for a free in-flight slot.
+
+        Args:
+            timeout: Maximum seconds to wait
+
+        Returns:
+            A slot handle, or None if none freed up in time
+        """
+
+    @abstractmethod
+    def release_slot(self, slot: str) -> None:
+        """
+        Release an in-flight slot.
+
+        Args:
+            slot: Handle returned by acquire_slot
+        """
+
+    @abstractmethod
+    def in_flight(self) -> int:
+        """
+        Count the calls currently in flight.
+
+        Returns:
+            Number of held slots
+        """
+
+
+class MemoryLimiterStore(LimiterStore):
+    """Token bucket and in-flight counter for a single process."""
+
+    def __init__(self, rate: float, burst: int, max_in_flight: int) -> None:
+        """
+        Initialize a full bucket.
+
+        Args:
+            rate: Tokens added per second
+            burst: Bucket capacity
+            max_in_flight: Maximum concurrent calls
+        """
+        self.rate = rate
+        self.burst = burst
+        self.max_in_flight = max_in_flight
+
+        self._condition = threading.Condition()
+        self._tokens = float(burst)
+        self._updated_at = time.monotonic()
+        self._in_flight = 0
+
+    def take_token(self) -> float:
+        with self._condition:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated_at) * self.rate)
+            self._updated_at = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0.0
+            return (1 - self._tokens) / self.rate
+
+    def acquire_slot(self, timeout: float) -> Optional[str]:
+        with self._condition:
+            if not self._condition.wait_for(lambda: self._in_flight < self.max_in_flight, timeout=timeout):
+                return None
+            self._in_flight += 1
+            return 'slot'
+
+    def release_slot(self, slot: str) -> None:
+        with self._condition:
+            self._in_flight -= 1
+            self._condition.notify()
+
+    def in_flight(self) -> int:
+        with self._condition:
+            return self._in_flight
+
+
+class SQLiteLimiterStore(LimiterStore):
+    """
+    Token bucket and in-flight leases in a SQLite database, shared by all
+    processes that open the same file.
+    """
+
+    def __init__(self, rate: float, burst: int, max_in_flight: int, path: str = LLM_LIMITER_DB_PATH) -> None:
+        """
+        Open (and if needed create) the shared limiter state.
+
+        Args:
+            rate: Tokens added per second
+            burst: Bucket capacity
+            max_in_flight: Maximum concurrent calls across processes
+            path: Database file path
+        """
+        self.rate = rate
+        self.burst = burst
+        self.max_in_flight = max_in_flight
+        self.path = path
+
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=10)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.execute(
+            'CREATE TABLE IF NOT EXISTS token_bucket (id INTEGER PRIMARY KEY CHECK (id = 1), '
+            'tokens REAL NOT NULL, updated_at REAL NOT NULL)'
+        )
+        self._connection.execute(
+            'INSERT OR IGNORE INTO token_bucket (id, tokens, updated_at) VALUES (1, ?, ?)', (float(burst), time.time())
+        )
+        self._connection.execute(
+            'CREATE TABLE IF NOT EXISTS in_flight (slot TEXT PRIMARY KEY, expires_at REAL NOT NULL)'
+        )
+
+    def take_token(self) -> float:
+        with self._lock:
+            self._connection.execute('BEGIN IMMEDIATE')
+            try:
+                now = time.time()
+                tokens, updated_at = self._connection.execute(
+                    'SELECT tokens, updated_at FROM token_bucket WHERE id = 1'
+                ).fetchone()
+                tokens = min(self.burst, tokens + max(0.0, now - updated_at) * self.rate)
+                wait = 0.0
+                if tokens >= 1:
+                    tokens -= 1
+                else:
+                    wait = (1 - tokens) / self.rate
+                self._connection.execute(
+                    'UPDATE token_bucket SET tokens = ?, updated_at = ? WHERE id = 1', (tokens, now)
+                )
+                self._connection.execute('COMMIT')
+                return wait
+            except Exception:
+                self._connection.execute('ROLLBACK')
+                raise
+
+    def _try_acquire_slot(self) -> Optional[str]:
+        """Insert a lease if fewer than max_in_flight are live"""
+        with self._lock:
+            self._connection.execute('BEGIN IMMEDIATE')
+            try:
+                now = time.time()
+                self._connection.execute('DELETE FROM in_flight WHERE expires_at < ?', (now,))
+                (count,) = self._connection.execute('SELECT COUNT(*) FROM in_flight').fetchone()
+                slot = None
+                if count < self.max_in_flight:
+                    slot = uuid.uuid4().hex
+                    self._connection.execute(
+                        'INSERT INTO in_flight (slot, expires_at) VALUES (?, ?)', (slot, now + LLM_SLOT_LEASE_SECONDS)
+                    )
+                self._connection.execute('COMMIT')
+                return slot
+            except Exception:
+                self._connection.execute('ROLLBACK')
+                raise
+
+    def acquire_slot(self, timeout: float) -> Optional[str]:
+        wait_until = time.monotonic() + timeout
+        while True:
+            slot = self._try_acquire_slot()
+            if slot is not None:
+                return slot
+            remaining = wait_until - time.monotonic()
+            if remaining <= 0:
+                return None
+            time.sleep(min(SLOT_POLL_SECONDS, remaining))
+
+    def release_slot(self, slot: str) -> None:
+        with self._lock:
+            self._connection.execute('DELETE FROM in_flight WHERE slot = ?', (slot,))
+
+    def in_flight(self) -> int:
+        with self._lock:
+            (count,) = self._connection.execute(
+                'SELECT COUNT(*) FROM in_flight WHERE expires_at >= ?', (time.time(),)
+            ).fetchone()
+            return count
+
+
+# ============================================================================
+# RATE LIMITER CLASS
+# ============================================================================
+
+class RateLimiter:
+    """
+    Queues calls until both a rate token and an in-flight slot are available.
+    A rate or in-flight limit of 0 disables that limit.
+    """
+
+    def __init__(
+        self,
+        rate: float = LLM_RATE_LIMIT_PER_SECOND,
+        burst: int = LLM_RATE_LIMIT_BURST,
+        max_in_flight: int = LLM_MAX_IN_FLIGHT,
+        max_wait_seconds: float = LLM_QUEUE_MAX_WAIT_SECONDS,
+        store: str = LLM_LIMITER_STORE
+    ) -> None:
+        """
+        Initialize the limiter.
+
+        Args:
+            rate: Calls per second (0 for no rate limit)
+            burst: Calls allowed back to back before the rate applies
+            max_in_flight: Maximum concurrent calls (0 for no cap)
+            max_wait_seconds: Maximum time a call waits in the queue
+            store: 'memory' (this process) or 'sqlite' (all processes on the host)
+
+        Raises:
+            ValueError: If the store name is unknown
+        """
+        self.rate = rate
+        self.max_in_flight = max_in_flight
+        self.max_wait_seconds = max_wait_seconds
+        self.store_name = store
+
+        self.store: LimiterStore
+        if store == 'memory':
+            self.store = MemoryLimiterStore(rate, burst, max_in_flight)
+        elif store == 'sqlite':
+            self.store = SQLiteLimiterStore(rate, burst, max_in_flight)
+        else:
+            raise ValueError(f"Unknown limiter store: {store}")
+
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._max_queued = 0
+        self._admitted = 0
+        self._rejected = 0
+        self._total_wait_seconds = 0.0
+        self._max_wait_observed = 0.0
+
+    def _wait_for_token(self, wait_until: float) -> bool:
+        """Block until a rate token is taken, or return False once wait_until passes"""
+        while True:
+            wait = self.store.take_token()
+            if wait == 0:
+                return True
+            remaining = wait_until - time.monotonic()
+            if remaining <= 0:
+                return False
+            time.sleep(min(wait, remaining))
+
+    @contextmanager
+    def slot(self, deadline: Optional[Deadline] = None) -> Iterator[None]:
+        """
+        Hold an admission for the duration of one call.
+
+        Args:
+            deadline: Optional request deadline, bounding the queue wait
+
+        Raises:
+            RateLimitTimeout: If no admission was granted within the maximum wait or the deadline
+        """
+        max_wait = self.max_wait_seconds
+        if deadline is not None:
+            max_wait = min(max_wait, deadline.remaining())
+
+        started = time.monotonic()
+        wait_until = started + max_wait
+
+        with self._lock:
+            self._queued += 1
+            self._max_queued = max(self._max_queued, self._queued)
+
+        slot = None
+        try:
+            admitted = self.rate <= 0 or self._wait_for_token(wait_until)
+            if admitted and self.max_in_flight > 0:
+                slot = self.store.acquire_slot(max(0.0, wait_until - time.monotonic()))
+                admitted = slot is not None
+        finally:
+            waited = time.monotonic() - started
+            with self._lock:
+                self._queued -= 1
+                self._total_wait_seconds += waited
+                self._max_wait_observed = max(self._max_wait_observed, waited)
+
+        if not admitted:
+            with self._lock:
+                self._rejected += 1
+            raise RateLimitTimeout(f"No LLM capacity within {max_wait:.1f}s")
+
+        with self._lock:
+            self._admitted += 1
+        try:
+            yield
+        finally:
+            if slot is not None:
+                self.store.release_slot(slot)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get limiter statistics.
+
+        Returns:
+            Dictionary with limits, queue depth, wait times and in-flight calls
+        """
+        with self._lock:
+            requests = self._admitted + self._rejected
+            counters = {
+                'store': self.store_name,
+                'rate_per_second': self.rate,
+                'max_in_flight': self.max_in_flight,
+                'queue_depth': self._queued,
+                'max_queue_depth': self._max_queued,
+                'admitted': self._admitted,
+                'rejected': self._rejected,
+                'avg_wait_seconds': self._total_wait_seconds / requests if requests else 0.0,
+                'max_wait_seconds': self._max_wait_observed
+            }
+        counters['in_flight'] = self.store.in_flight()
+        return counters
+
+
+# ============================================================================
+# SHARED LIMITER
+# ============================================================================
+
+_shared_limiter: Optional[RateLimiter] = None
+_shared_limiter_lock = threading.Lock()
+
+
+def get_llm_limiter() -> RateLimiter:
+    """
+    Get the process-wide LLM rate limiter, creating it on first use.
+
+    Returns:
+        The shared RateLimiter
+    """
+    global _shared_limiter
+    with _shared_limiter_lock:
+        if _shared_limiter is None:
+            _shared_limiter = RateLimiter()
+        return _shared_limiter
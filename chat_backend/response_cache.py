@@ -0,0 +1,189 @@
+"""
+Response Cache
+
+Opt-in cache of final chat answers for repeated catalog questions ("what do
+you sell?", "show me products"). Entries are keyed by the normalized last
+user message and the catalog version, so a catalog change never serves a
+stale answer. Conversations that touch the cart or checkout always bypass
+the cache.
+"""
+
+import copy
+import os
+import re
+import threading
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+from dotenv import load_dotenv
+
+from ttl_cache import TTLCache
+
+
+load_dotenv()
+
+# ============================================================================
+# CONSTANTS
+# ============================================================================
+
+RESPONSE_CACHE_ENABLED: bool = os.getenv('RESPONSE_CACHE_ENABLED', 'False').lower() == 'true'
+RESPONSE_CACHE_TTL_SECONDS: float = float(os.getenv('RESPONSE_CACHE_TTL_SECONDS', '300'))
+RESPONSE_CACHE_MAX_ENTRIES: int = int(os.getenv('RESPONSE_CACHE_MAX_ENTRIES', '1000'))
+
+# Answers are only cached if every tool they used is a read-only catalog tool
+CACHEABLE_TOOLS = {'list_products', 'search_products'}
+# Tools that mean the conversation has cart or checkout state
+STATEFUL_TOOLS = {'add_to_cart', 'start_checkout', 'complete_checkout'}
+# Words that mean the question itself is about cart or checkout state
+STATEFUL_WORDS = {'cart', 'checkout', 'buy', 'purchase', 'pay', 'payment', 'order', 'token'}
+
+# Words dropped when normalizing, so politeness and phrasing do not split entries
+FILLER_WORDS = {'a', 'an', 'the', 'please', 'pls', 'can', 'could', 'would', 'you', 'me', 'i', 'us', 'hi', 'hello', 'hey'}
+
+WORD_PATTERN = re.compile(r'[a-z0-9]+')
+
+
+# ============================================================================
+# HELPER FUNCTIONS
+# ============================================================================
+
+def normalize_question(text: Optional[str]) -> List[str]:
+    """
+    Reduce a user message to its significant lowercase words.
+
+    Args:
+        text: User message content
+
+    Returns:
+        Words in order, without punctuation and filler words
+    """
+    words = WORD_PATTERN.findall(str(text or '').lower())
+    return [word for word in words if word not in FILLER_WORDS]
+
+
+def _called_tools(message: Dict[str, Any]) -> List[str]:
+    """
+    List the tools a message called or reported a result for.
+
+    Args:
+        message: Chat message (assistant, tool, or a previous response with original_tool_calls)
+
+    Returns:
+        Tool names
+    """
+    names = [
+        tool_call['function']['name']
+        for key in ('tool_calls', 'original_tool_calls')
+        for tool_call in message.get(key) or []
+    ]
+    if message.get('role') == 'tool' and message.get('name'):
+        names.append(message['name'])
+    return names
+
+
+# ============================================================================
+# RESPONSE CACHE CLASS
+# ============================================================================
+
+class ResponseCache:
+    """
+    TTL + LRU cache of final answers to stateless catalog questions.
+    """
+
+    def __init__(
+        self,
+        enabled: bool = RESPONSE_CACHE_ENABLED,
+        ttl_seconds: float = RESPONSE_CACHE_TTL_SECONDS,
+        max_entries: int = RESPONSE_CACHE_MAX_ENTRIES
+    ) -> None:
+        """
+        Initialize the response cache.
+
+        Args:
+            enabled: Whether answers are cached at all
+            ttl_seconds: Lifetime of a cached answer
+            max_entries: Maximum number of cached answers
+        """
+        self.enabled = enabled
+        self.entries = TTLCache(max_entries=max_entries, ttl_seconds=ttl_seconds)
+
+        self._lock = threading.Lock()
+        self._bypasses = 0
+        self._stores = 0
+        self._uncacheable = 0
+
+    def key(self, messages: List[Dict[str, Any]], catalog_version: Hashable) -> Optional[Tuple[Any, ...]]:
+        """
+        Build the cache key for a chat request.
+
+        Args:
+            messages: Message history, ending with the user's question
+            catalog_version: Version of the catalog data the answer depends on
+
+        Returns:
+            The cache key, or None if this request must bypass the cache
+        """
+        if not self.enabled:
+            return None
+
+        question = messages[-1] if messages else {}
+        words = normalize_question(question.get('content')) if question.get('role') == 'user' else []
+        stateful = (
+            not words
+            or STATEFUL_WORDS.intersection(words)
+            or any(STATEFUL_TOOLS.intersection(_called_tools(message)) for message in messages)
+        )
+
+        if stateful:
+            with self._lock:
+                self._bypasses += 1
+            return None
+
+        return (' '.join(words), catalog_version)
+
+    def get(self, key: Tuple[Any, ...]) -> Optional[Dict[str, Any]]:
+        """
+        Look up a cached answer.
+
+        Args:
+            key: Key returned by key()
+
+        Returns:
+            A copy of the cached response message, or None on a miss
+        """
+        response = self.entries.get(key)
+        return copy.deepcopy(response) if response is not None else None
+
+    def store(self, key: Tuple[Any, ...], response: Dict[str, Any]) -> None:
+        """
+        Cache a final answer if it only depended on catalog tools.
+
+        Args:
+            key: Key returned by key()
+            response: Final response message of the agent loop
+        """
+        if not response.get('content') or not CACHEABLE_TOOLS.issuperset(_called_tools(response)):
+            with self._lock:
+                self._uncacheable += 1
+            return
+
+        cached = copy.deepcopy(response)
+        cached.pop('agent_trace', None)
+        self.entries.set(key, cached)
+        with self._lock:
+            self._stores += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get response cache statistics.
+
+        Returns:
+            Dictionary with cache counters, bypasses and stores
+        """
+        with self._lock:
+            counters = {
+                'enabled': self.enabled,
+                'bypasses': self._bypasses,
+                'stores': self._stores,
+                'uncacheable': self._uncacheable
+            }
+        counters.update(self.entries.stats())
+        return counters
@@ -0,0 +1,324 @@
+"""
+Retries and Hedging
+
+Makes outbound calls resilient to transient failures: retries with
+exponential backoff and full jitter (honoring Retry-After), and optional
+hedging, which fires a duplicate request once the first one has taken longer
+than a latency percentile of recent calls and takes whichever finishes first.
+"""
+
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from email.utils import parsedate_to_datetime
+from typing import Any, Callable, Deque, Dict, Optional, TypeVar
+
+import requests
+from dotenv import load_dotenv
+
+from deadline import Deadline
+from rate_limiter import LLM_MAX_IN_FLIGHT
+
+
+load_dotenv()
+
+# ============================================================================
+# CONSTANTS
+# ============================================================================
+
+LLM_MAX_RETRIES: int = int(os.getenv('LLM_MAX_RETRIES', '2'))
+LLM_RETRY_BASE_SECONDS: float = float(os.getenv('LLM_RETRY_BASE_SECONDS', '0.5'))
+LLM_RETRY_MAX_SECONDS: float = float(os.getenv('LLM_RETRY_MAX_SECONDS', '8'))
+
+LLM_HEDGE_ENABLED: bool = os.getenv('LLM_HEDGE_ENABLED', 'False').lower() == 'true'
+LLM_HEDGE_PERCENTILE: float = float(os.getenv('LLM_HEDGE_PERCENTILE', '0.95'))
+LLM_HEDGE_MIN_SAMPLES: int = int(os.getenv('LLM_HEDGE_MIN_SAMPLES', '20'))
+LLM_LATENCY_WINDOW: int = int(os.getenv('LLM_LATENCY_WINDOW', '200'))
+# Hedged calls run on this pool; room for every admitted call plus a hedge each
+LLM_HEDGE_MAX_WORKERS: int = int(os.getenv('LLM_HEDGE_MAX_WORKERS', str(max(1, LLM_MAX_IN_FLIGHT) * 2)))
+
+# HTTP statuses worth retrying: throttling and transient server errors
+RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+
+T = TypeVar('T')
+
+
+# ============================================================================
+# HELPER FUNCTIONS
+# ============================================================================
+
+def _retry_after_seconds(error: Exception) -> Optional[float]:
+    """
+    Read the Retry-After header of a failed HTTP response.
+
+    Args:
+        error: Exception raised by the call
+
+    Returns:
+        Seconds to wait, or None if the response carries no usable Retry-After
+    """
+    response = getattr(error, 'response', None)
+    value = response.headers.get('Retry-After') if response is not None else None
+    if not value:
+        return None
+
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def is_retryable(error: Exception) -> bool:
+    """
+    Check whether a failed call may succeed if repeated.
+
+    Args:
+        error: Exception raised by the call
+
+    Returns:
+        True for connection errors, timeouts and retryable HTTP statuses
+    """
+    if isinstance(error, (requests.ConnectionError, requests.Timeout)):
+        return True
+    if isinstance(error, requests.HTTPError) and error.response is not None:
+        return error.response.status_code in RETRYABLE_STATUS_CODES
+    return False
+
+
+# ============================================================================
+# LATENCY TRACKER CLASS
+# ============================================================================
+
+class LatencyTracker:
+    """Rolling window of call latencies for percentile estimates."""
+
+    def __init__(self, window: int = LLM_LATENCY_WINDOW) -> None:
+        """
+        Initialize an empty tracker.
+
+        Args:
+            window: Number of most recent latencies kept
+        """
+        self._lock = threading.Lock()
+        self._samples: Deque[float] = deque(maxlen=window)
+
+    def record(self, seconds: float) -> None:
+        """Record the latency of a successful call."""
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, fraction: float, min_samples: int = 1) -> Optional[float]:
+        """
+        Estimate a latency percentile.
+
+        Args:
+            fraction: Percentile as a fraction (e.g. 0.95)
+            min_samples: Samples required before an estimate is returned
+
+        Returns:
+            Latency in seconds, or None if there are too few samples
+        """
+        with self._lock:
+            if len(self._samples) < max(1, min_samples):
+                return None
+            samples = sorted(self._samples)
+        index = min(len(samples) - 1, max(0, round(fraction * len(samples)) - 1))
+        return samples[index]
+
+
+# ============================================================================
+# RESILIENT CALLER CLASS
+# ============================================================================
+
+class ResilientCaller:
+    """
+    Runs calls with retries, backoff and optional hedging, and counts what happened.
+    """
+
+    def __init__(
+        self,
+        max_retries: int = LLM_MAX_RETRIES,
+        base_seconds: float = LLM_RETRY_BASE_SECONDS,
+        max_seconds: float = LLM_RETRY_MAX_SECONDS,
+        hedge_enabled: bool = LLM_HEDGE_ENABLED,
+        hedge_percentile: float = LLM_HEDGE_PERCENTILE,
+        hedge_min_samples: int = LLM_HEDGE_MIN_SAMPLES,
+        hedge_max_workers: int = LLM_HEDGE_MAX_WORKERS,
+        name: str = 'llm'
+    ) -> None:
+        """
+        Initialize the caller.
+
+        Args:
+            max_retries: Retries after the first attempt
+            base_seconds: Backoff ceiling of the first retry; doubles per retry
+            max_seconds: Maximum backoff; a longer Retry-After ends the retries
+            hedge_enabled: Fire a duplicate request when an attempt runs past the percentile
+            hedge_percentile: Latency percentile after which to hedge
+            hedge_min_samples: Successful calls needed before hedging starts
+            hedge_max_workers: Threads running hedgeable attempts and their hedges
+            name: Prefix for worker thread names
+        """
+        self.max_retries = max_retries
+        self.base_seconds = base_seconds
+        self.max_seconds = max_seconds
+        self.hedge_enabled = hedge_enabled
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+
+        self.latency = LatencyTracker()
+        self._executor = (
+            ThreadPoolExecutor(max_workers=hedge_max_workers, thread_name_prefix=f'{name}-hedge')
+            if hedge_enabled else None
+        )
+
+        self._lock = threading.Lock()
+        self._calls = 0
+        self._retries = 0
+        self._failures = 0
+        self._hedges = 0
+        self._hedge_wins = 0
+        self._hedges_skipped = 0
+
+    def backoff(self, retry: int, error: Exception) -> Optional[float]:
+        """
+        Compute the wait before a retry.
+
+        Args:
+            retry: Retry number, starting at 0
+            error: Exception raised by the failed attempt
+
+        Returns:
+            Seconds to wait: Retry-After if the upstream sent one, otherwise full jitter.
+            None if Retry-After asks for longer than max_seconds (the call is not retried).
+        """
+        retry_after = _retry_after_seconds(error)
+        if retry_after is not None:
+            return retry_after if retry_after <= self.max_seconds else None
+        return random.uniform(0, min(self.max_seconds, self.base_seconds * (2 ** retry)))
+
+    def _attempt(self, attempt: Callable[[], T], hedge: bool) -> T:
+        """
+        Run one attempt, hedged if enabled and the latency history allows it.
+        Only latencies of hedgeable calls are recorded, so other call shapes do not skew the percentile.
+        """
+        hedge_after = (
+            self.latency.percentile(self.hedge_percentile, self.hedge_min_samples)
+            if hedge and self._executor is not None else None
+        )
+
+        started = time.monotonic()
+        if hedge_after is None:
+            result = attempt()
+            if hedge:
+                self.latency.record(time.monotonic() - started)
+            return result
+
+        primary_started = threading.Event()
+
+        def run_primary() -> T:
+            primary_started.set()
+            return attempt()
+
+        primary = self._executor.submit(run_primary)
+        done, _ = wait([primary], timeout=hedge_after)
+        if not done and not primary_started.is_set():
+            # The pool is saturated and the primary is still queued; a hedge would only queue behind it
+            with self._lock:
+                self._hedges_skipped += 1
+            done, _ = wait([primary])
+        if done:
+            result = primary.result()
+            self.latency.record(time.monotonic() - started)
+            return result
+
+        # The primary is slower than usual: race a duplicate against it. The loser's thread
+        # is left to finish on its own, since in-flight requests cannot be cancelled.
+        with self._lock:
+            self._hedges += 1
+        secondary = self._executor.submit(attempt)
+        pending = {primary, secondary}
+        error: Optional[Exception] = None
+
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is not None:
+                    error = future.exception()
+                    continue
+                if future is secondary:
+                    with self._lock:
+                        self._hedge_wins += 1
+                self.latency.record(time.monotonic() - started)
+                return future.result()
+
+        raise error
+
+    def call(self, attempt: Callable[[], T], deadline: Optional[Deadline] = None, hedge: bool = True) -> T:
+        """
+        Run a call with retries.
+
+        Args:
+            attempt: Function making one attempt (it should resolve its own timeout per attempt)
+            deadline: Optional request deadline; no retry is started that cannot finish in time
+            hedge: Whether attempts may be hedged
+
+        Returns:
+            The result of the first successful attempt
+
+        Raises:
+            Exception: The last error, once it is not retryable or retries are exhausted
+        """
+        with self._lock:
+            self._calls += 1
+
+        retry = 0
+        while True:
+            try:
+                return self._attempt(attempt, hedge)
+            except Exception as e:
+                if retry >= self.max_retries or not is_retryable(e):
+                    with self._lock:
+                        self._failures += 1
+                    raise
+
+                delay = self.backoff(retry, e)
+                if delay is None or (deadline is not None and delay >= deadline.remaining()):
+                    with self._lock:
+                        self._failures += 1
+                    raise
+
+                print(f"Retrying after {type(e).__name__} in {delay:.2f}s (retry {retry + 1}/{self.max_retries})")
+                with self._lock:
+                    self._retries += 1
+                time.sleep(delay)
+                retry += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get retry and hedging counters.
+
+        Returns:
+            Dictionary with call, retry, failure and hedge counters and latency percentiles
+        """
+        with self._lock:
+            counters: Dict[str, Any] = {
+                'calls': self._calls,
+                'retries': self._retries,
+                'failures': self._failures,
+                'hedging_enabled': self.hedge_enabled,
+                'hedges': self._hedges,
+                'hedge_wins': self._hedge_wins,
+                'hedges_skipped': self._hedges_skipped
+            }
+        counters['p50_seconds'] = self.latency.percentile(0.50)
+        counters['p95_seconds'] = self.latency.percentile(0.95)
+        return counters
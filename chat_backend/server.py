@@ -3,16 +3,46 @@ Chat Backend Server
 
 Simple Python server that acts as a bridge between chat/AI agents and the seller backend.
 Handles product listing, checkout operations, and chat message processing.
+
+Request validation and reply shaping shared with asgi.py live in server_common;
+this module only adds the Flask routing.
 """
 
 import os
-from typing import Dict, Any, Tuple, Optional
-from flask import Flask, request, jsonify, Response
+from typing import Dict, Tuple, Optional
+from flask import Flask, request, jsonify, Response, stream_with_context
 from flask_cors import CORS
 from dotenv import load_dotenv
 
 from acp_client import ACPClient
+from checkout_session_cache import CheckoutSessionCache
+from checkout_state import CheckoutStateCache
+from conversation_store import create_conversation_store
+from deadline import Deadline
 from llm_service import LLMService
+from server_common import (
+    CHAT_REQUEST_DEADLINE_SECONDS,
+    CHECKOUT_COMPLETE_DEADLINE_SECONDS,
+    CHECKOUT_BATCH_DEADLINE_SECONDS,
+    Reply,
+    RequestError,
+    batch_operations,
+    batch_reply,
+    checkout_reply,
+    complete_checkout_arguments,
+    create_checkout_arguments,
+    format_sse_stream,
+    health_reply,
+    idempotency_headers,
+    process_chat,
+    product_page_arguments,
+    products_reply,
+    remember_read,
+    request_idempotency_key,
+    require_json,
+    stream_chat,
+    update_checkout_arguments
+)
 
 load_dotenv()
 
@@ -32,44 +62,36 @@ DEBUG: bool = os.getenv('DEBUG', 'True').lower() == 'true'
 app = Flask(__name__)
 CORS(app, resources={r"/*": {"origins": "*"}})
 
-acp_client = ACPClient()
+# Checkout writes made by routes and chat tools are written through to the session cache
+checkout_sessions = CheckoutSessionCache(CheckoutStateCache())
+acp_client = ACPClient(checkout_state=checkout_sessions.checkout_state, checkout_sessions=checkout_sessions)
 llm_service = LLMService(acp_client)
+conversation_store = create_conversation_store()
 
 
 # ============================================================================
 # HELPER FUNCTIONS
 # ============================================================================
 
-def _validate_request_json() -> Dict[str, Any]:
+def _json_reply(reply: Reply, headers: Optional[Dict[str, str]] = None) -> Tuple[Response, int, Dict[str, str]]:
     """
-    Validate that the request contains valid JSON data.
+    Convert a (body, status code) reply to a Flask response.
+    
+    Args:
+        reply: A tuple of (body, HTTP status code).
+        headers: Extra response headers (optional).
     
     Returns:
-        The parsed JSON data from the request.
-        
-    Raises:
-        ValueError: If request JSON is missing or invalid.
+        A tuple of (JSON response, HTTP status code, headers).
     """
-    if request.json is None:
-        raise ValueError("Request body must contain valid JSON")
-    return request.json
+    body, status_code = reply
+    return jsonify(body), status_code, headers or {}
 
 
-def _handle_acp_error(result: Dict[str, Any], default_status_code: int = 500) -> Tuple[Response, int]:
-    """
-    Handle errors returned from ACP client operations.
-    
-    Args:
-        result: The result dictionary from ACP client that contains an error.
-        default_status_code: Default HTTP status code to use if not specified in result.
-        
-    Returns:
-        A tuple of (JSON response, HTTP status code).
-    """
-    status_code = result.get('status_code')
-    if status_code is None:
-        status_code = default_status_code
-    return jsonify(result), status_code
+@app.errorhandler(RequestError)
+def _handle_request_error(error: RequestError) -> Tuple[Response, int, Dict[str, str]]:
+    """Reply to a request that cannot be served with its error and status code."""
+    return _json_reply(error.reply())
 
 
 # ============================================================================
@@ -77,19 +99,41 @@ def _handle_acp_error(result: Dict[str, Any], default_status_code: int = 500) ->
 # ============================================================================
 
 @app.route('/products', methods=['GET'])
-def list_products() -> Tuple[Response, int]:
+def list_products() -> Tuple[Response, int, Dict[str, str]]:
     """
     Get list of available products from the seller backend.
     
+    Without query parameters the cached default listing is returned. With
+    'cursor' and/or 'limit' a single page of the full catalog is returned,
+    including 'next_cursor' for fetching the following page.
+    
+    Query parameters:
+        - cursor: 'next_cursor' from the previous page (optional)
+        - limit: Page size between 1 and 100 (optional)
+    
     Returns:
         JSON response containing list of products, or error response if request fails.
     """
-    result = acp_client.list_products()
+    page = product_page_arguments(request.args)
+    
+    if page is None:
+        result = acp_client.list_products()
+    else:
+        result = acp_client.list_products_page(**page)
     
-    if 'error' in result:
-        return _handle_acp_error(result, default_status_code=500)
+    return _json_reply(products_reply(result))
+
+
+@app.route('/products/cache/invalidate', methods=['POST'])
+def invalidate_products_cache() -> Tuple[Response, int]:
+    """
+    Drop the cached product catalog so the next read refetches it from Stripe.
     
-    return jsonify(result), 200
+    Returns:
+        JSON response containing the catalog cache statistics after invalidation.
+    """
+    acp_client.invalidate_catalog()
+    return jsonify(acp_client.catalog_cache.stats()), 200
 
 
 # ============================================================================
@@ -97,7 +141,7 @@ def list_products() -> Tuple[Response, int]:
 # ============================================================================
 
 @app.route('/checkout/create', methods=['POST'])
-def create_checkout() -> Tuple[Response, int]:
+def create_checkout() -> Tuple[Response, int, Dict[str, str]]:
     """
     Create a new checkout session with specified items.
     
@@ -105,134 +149,141 @@ def create_checkout() -> Tuple[Response, int]:
         - items: List of items to purchase (required)
         - buyer: Buyer information dictionary (optional)
         - fulfillment_address: Shipping address dictionary (optional)
-        
+    
+    Headers:
+        - Idempotency-Key: Key making retries safe (optional; echoed back; only requests sent with a key are replay-protected)
+    
     Returns:
         JSON response containing checkout session details, or error response.
     """
-    request_data = _validate_request_json()
+    arguments = create_checkout_arguments(require_json(request.get_json(silent=True)))
     
-    if 'items' not in request_data:
-        return jsonify({'error': 'Items are required'}), 400
+    idempotency_key = request_idempotency_key(request.headers)
+    result = acp_client.create_checkout(**arguments, idempotency_key=idempotency_key)
     
-    result = acp_client.create_checkout(
-        items=request_data['items'],
-        buyer=request_data.get('buyer'),
-        fulfillment_address=request_data.get('fulfillment_address')
+    return _json_reply(
+        checkout_reply('create', result),
+        idempotency_headers(idempotency_key)
     )
-    
-    if 'error' in result:
-        return _handle_acp_error(result, default_status_code=500)
-    
-    return jsonify(result), 201
 
 
 @app.route('/checkout/<checkout_id>', methods=['GET'])
-def get_checkout(checkout_id: str) -> Tuple[Response, int]:
+def get_checkout(checkout_id: str) -> Tuple[Response, int, Dict[str, str]]:
     """
     Retrieve an existing checkout session by ID.
     
+    Sessions seen in a recent create/update/complete/cancel response or GET are
+    served from the checkout session cache without calling the seller backend.
+    
     Args:
         checkout_id: The unique identifier of the checkout session.
-        
+    
     Returns:
         JSON response containing checkout session details, or error response.
     """
-    result = acp_client.get_checkout(checkout_id)
+    cached = checkout_sessions.get(checkout_id)
+    if cached is not None:
+        return _json_reply((cached, 200))
     
-    if 'error' in result:
-        return _handle_acp_error(result, default_status_code=404)
+    ticket = checkout_sessions.ticket()
+    result = acp_client.get_checkout(checkout_id)
     
-    return jsonify(result), 200
+    remember_read(checkout_sessions, checkout_id, result, ticket)
+    return _json_reply(checkout_reply('get', result))
 
 
 @app.route('/checkout/<checkout_id>/update', methods=['PUT'])
-def update_checkout(checkout_id: str) -> Tuple[Response, int]:
+def update_checkout(checkout_id: str) -> Tuple[Response, int, Dict[str, str]]:
     """
     Update an existing checkout session.
     
     Args:
         checkout_id: The unique identifier of the checkout session to update.
-        
+    
     Request body may contain:
         - items: Updated list of items (optional)
         - buyer: Updated buyer information (optional)
         - fulfillment_address: Updated shipping address (optional)
         - fulfillment_option_id: Selected fulfillment option ID (optional)
-        
+    
     Returns:
         JSON response containing updated checkout session details, or error response.
     """
-    request_data = _validate_request_json()
-    
-    result = acp_client.update_checkout(
-        checkout_id=checkout_id,
-        items=request_data.get('items'),
-        buyer=request_data.get('buyer'),
-        fulfillment_address=request_data.get('fulfillment_address'),
-        fulfillment_option_id=request_data.get('fulfillment_option_id')
-    )
+    arguments = update_checkout_arguments(checkout_id, require_json(request.get_json(silent=True)))
     
-    if 'error' in result:
-        return _handle_acp_error(result, default_status_code=400)
+    result = acp_client.update_checkout(**arguments)
     
-    return jsonify(result), 200
+    return _json_reply(checkout_reply('update', result))
 
 
 @app.route('/checkout/<checkout_id>/complete', methods=['POST'])
-def complete_checkout(checkout_id: str) -> Tuple[Response, int]:
+def complete_checkout(checkout_id: str) -> Tuple[Response, int, Dict[str, str]]:
     """
     Complete a checkout session with payment.
     
     Args:
         checkout_id: The unique identifier of the checkout session to complete.
-        
+    
     Request body must contain:
         - payment_token: Payment token from payment provider (required)
         - payment_provider: Name of payment provider (optional, defaults to 'stripe')
         - billing_address: Billing address dictionary (optional)
-        
+    
+    Headers:
+        - Idempotency-Key: Key making retries safe (optional; echoed back; only requests sent with a key are replay-protected)
+    
     Returns:
         JSON response containing completion details, or error response.
     """
-    request_data = _validate_request_json()
+    deadline = Deadline(CHECKOUT_COMPLETE_DEADLINE_SECONDS)
+    arguments = complete_checkout_arguments(checkout_id, require_json(request.get_json(silent=True)))
     
-    if 'payment_token' not in request_data:
-        return jsonify({'error': 'Payment token is required'}), 400
+    idempotency_key = request_idempotency_key(request.headers)
+    result = acp_client.complete_checkout(**arguments, deadline=deadline, idempotency_key=idempotency_key)
     
-    payment_provider = request_data.get('payment_provider')
-    if payment_provider is None:
-        payment_provider = 'stripe'
-    
-    result = acp_client.complete_checkout(
-        checkout_id=checkout_id,
-        payment_token=request_data['payment_token'],
-        payment_provider=payment_provider,
-        billing_address=request_data.get('billing_address')
+    return _json_reply(
+        checkout_reply('complete', result),
+        idempotency_headers(idempotency_key)
     )
-    
-    if 'error' in result:
-        return _handle_acp_error(result, default_status_code=400)
-    
-    return jsonify(result), 200
 
 
 @app.route('/checkout/<checkout_id>/cancel', methods=['POST'])
-def cancel_checkout(checkout_id: str) -> Tuple[Response, int]:
+def cancel_checkout(checkout_id: str) -> Tuple[Response, int, Dict[str, str]]:
     """
     Cancel an existing checkout session.
     
     Args:
         checkout_id: The unique identifier of the checkout session to cancel.
-        
+    
     Returns:
         JSON response containing cancellation details, or error response.
     """
     result = acp_client.cancel_checkout(checkout_id)
     
-    if 'error' in result:
-        return _handle_acp_error(result, default_status_code=400)
+    return _json_reply(checkout_reply('cancel', result))
+
+
+@app.route('/checkout/batch', methods=['POST'])
+def batch_checkout() -> Tuple[Response, int, Dict[str, str]]:
+    """
+    Run many create/get/update/cancel checkout operations concurrently.
+    
+    Request body must contain:
+        - operations: List of operations (at most BATCH_MAX_OPERATIONS), each with 'op'
+          ('create', 'get', 'update' or 'cancel'), 'checkout_id' (except for create) and
+          the request body fields of the matching endpoint ('idempotency_key' for create)
+    
+    Returns:
+        JSON response with 'results': one entry per operation, in order, holding the
+        'status_code' and 'body' the matching single-operation endpoint would return.
+    """
+    deadline = Deadline(CHECKOUT_BATCH_DEADLINE_SECONDS)
+    operations = batch_operations(require_json(request.get_json(silent=True)))
+    
+    ticket = checkout_sessions.ticket()
+    results = acp_client.batch(operations, deadline=deadline)
     
-    return jsonify(result), 200
+    return _json_reply(batch_reply(checkout_sessions, operations, results, ticket))
 
 
 # ============================================================================
@@ -244,21 +295,82 @@ def chat() -> Tuple[Response, int]:
     """
     Process chat messages through the LLM service.
     
-    Request body must contain:
-        - messages: List of message dictionaries with 'role' and 'content' fields (required)
-        
+    Request body: see server_common.process_chat() (conversation or stateless mode).
+    
     Returns:
-        JSON response containing the LLM's response message.
+        JSON response containing the LLM's response message (with 'conversation_id' in
+        conversation mode), 400 for a malformed message, or 404 if the conversation is
+        unknown or expired (also when it expires while the turn runs).
+    """
+    deadline = Deadline(CHAT_REQUEST_DEADLINE_SECONDS)
+    request_data = require_json(request.get_json(silent=True))
+    
+    return jsonify(process_chat(llm_service, conversation_store, request_data, deadline)), 200
+
+
+@app.route('/chat/stream', methods=['POST'])
+def chat_stream() -> Response:
     """
-    request_data = _validate_request_json()
+    Process chat messages through the LLM service, streaming the response as Server-Sent Events.
     
-    if 'messages' not in request_data:
-        return jsonify({'error': 'Messages are required'}), 400
+    Request body: same as /chat (conversation or stateless mode).
     
-    messages = request_data['messages']
-    response = llm_service.process_message(messages)
+    Returns:
+        A text/event-stream response emitting 'token', 'tool_call', 'tool_result',
+        'message' (the final response, as returned by /chat) and 'done' events; an 'error'
+        event precedes 'message' if the conversation expired while the turn ran.
+    """
+    deadline = Deadline(CHAT_REQUEST_DEADLINE_SECONDS)
+    request_data = require_json(request.get_json(silent=True))
+    events = stream_chat(llm_service, conversation_store, request_data, deadline)
     
-    return jsonify(response), 200
+    return Response(
+        stream_with_context(format_sse_stream(events)),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+
+# ============================================================================
+# OPERATIONAL ENDPOINTS
+# ============================================================================
+
+@app.route('/health', methods=['GET'])
+def health() -> Tuple[Response, int, Dict[str, str]]:
+    """
+    Report the health of the upstreams this backend depends on (see server_common.health_reply()).
+    
+    Returns:
+        JSON response containing the overall status and each upstream's circuit breaker state.
+    """
+    return _json_reply(health_reply(acp_client.circuit_stats()))
+
+
+@app.route('/stats', methods=['GET'])
+def stats() -> Tuple[Response, int]:
+    """
+    Get runtime statistics used for capacity planning.
+    
+    Returns:
+        JSON response containing connection pool, cache, product index, context window and conversation statistics.
+    """
+    return jsonify({
+        'http_pool': acp_client.pool_stats(),
+        'catalog_cache': acp_client.catalog_cache.stats(),
+        'checkout_state': acp_client.checkout_state.stats(),
+        'checkout_sessions': checkout_sessions.stats(),
+        'idempotency': acp_client.idempotency_store.stats(),
+        'single_flight': acp_client.single_flight.stats(),
+        'product_index': llm_service.product_index.stats(),
+        'context_window': llm_service.context_window.stats(),
+        'response_cache': llm_service.response_cache.stats(),
+        'intent_router': llm_service.intent_router.stats(),
+        'llm_backend': llm_service.backend.stats(),
+        'llm_calls': llm_service.llm_caller.stats(),
+        'llm_limiter': llm_service.llm_limiter.stats(),
+        'circuit_breakers': acp_client.circuit_stats(),
+        'conversations': conversation_store.stats()
+    }), 200
 
 
 # ============================================================================
@@ -271,12 +383,18 @@ if __name__ == '__main__':
     print(f"Seller Backend: {acp_client.base_url}")
     print(f"\nAvailable endpoints:")
     print(f"  GET    /products                      - List products")
+    print(f"  GET    /products?cursor=&limit=       - List one page of the catalog")
+    print(f"  POST   /products/cache/invalidate     - Invalidate product cache")
     print(f"  POST   /checkout/create               - Create checkout")
     print(f"  GET    /checkout/<id>                 - Get checkout")
     print(f"  PUT    /checkout/<id>/update          - Update checkout")
     print(f"  POST   /checkout/<id>/complete        - Complete checkout")
     print(f"  POST   /checkout/<id>/cancel          - Cancel checkout")
+    print(f"  POST   /checkout/batch                - Run checkout operations in bulk")
     print(f"  POST   /chat                          - Process chat message")
+    print(f"  POST   /chat/stream                   - Process chat message (SSE stream)")
+    print(f"  GET    /health                        - Upstream health")
+    print(f"  GET    /stats                         - Runtime statistics")
     print(f"\n")
     
     app.run(host='0.0.0.0', port=CHAT_BACKEND_PORT, debug=DEBUG)
@@ -0,0 +1,567 @@
+"""
+Chat Backend Server Common
+
+Framework-independent parts of the Flask (server.py) and ASGI (asgi.py)
+servers: request deadlines, request validation, reply shaping, checkout
+session write-through and conversation turns. Helpers return plain
+(body, status code) pairs and raise RequestError for requests that cannot be
+served; each server only adds its framework's routing and JSON responses.
+"""
+
+import json
+import os
+from typing import Dict, Any, Tuple, Optional, Iterator, Generator, List, Mapping
+from dotenv import load_dotenv
+
+from acp_common import PRODUCT_PAGE_SIZE, MAX_PRODUCT_PAGE_SIZE, BATCH_MAX_OPERATIONS
+from checkout_session_cache import CheckoutSessionCache
+from circuit_breaker import STATE_CLOSED
+from conversation_store import ConversationStore
+from deadline import Deadline
+from idempotency import IDEMPOTENCY_HEADER
+from llm_service import LLMService
+
+load_dotenv()
+
+
+# ============================================================================
+# CONSTANTS
+# ============================================================================
+
+# End-to-end request deadlines in seconds, started when the request is received
+CHAT_REQUEST_DEADLINE_SECONDS: float = float(os.getenv('CHAT_REQUEST_DEADLINE_SECONDS', '90'))
+CHECKOUT_COMPLETE_DEADLINE_SECONDS: float = float(os.getenv('CHECKOUT_COMPLETE_DEADLINE_SECONDS', '45'))
+CHECKOUT_BATCH_DEADLINE_SECONDS: float = float(os.getenv('CHECKOUT_BATCH_DEADLINE_SECONDS', '60'))
+
+# Status codes of checkout operations, shared by the single-operation endpoints and batch results
+CHECKOUT_SUCCESS_STATUS_CODES: Dict[str, int] = {'create': 201, 'get': 200, 'update': 200, 'complete': 200, 'cancel': 200}
+CHECKOUT_ERROR_STATUS_CODES: Dict[str, int] = {'create': 500, 'get': 404, 'update': 400, 'complete': 400, 'cancel': 400}
+
+Reply = Tuple[Dict[str, Any], int]
+
+
+# ============================================================================
+# ERRORS
+# ============================================================================
+
+class RequestError(Exception):
+    """A request that cannot be served, reported as {'error': message} with its status code."""
+
+    def __init__(self, message: str, status_code: int = 400) -> None:
+        """
+        Initialize the error.
+
+        Args:
+            message: Error message returned to the client
+            status_code: HTTP status code of the reply
+        """
+        super().__init__(message)
+        self.status_code = status_code
+
+    def reply(self) -> Reply:
+        """
+        Get the error reply.
+
+        Returns:
+            A tuple of (error body, HTTP status code).
+        """
+        return {'error': str(self)}, self.status_code
+
+
+def conversation_not_found() -> RequestError:
+    """Error for a conversation that is unknown or expired."""
+    return RequestError('Conversation not found', 404)
+
+
+# ============================================================================
+# REQUEST VALIDATION
+# ============================================================================
+
+def require_json(request_data: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Validate that the request contains valid JSON data.
+
+    Args:
+        request_data: Parsed request body, or None if it is missing or invalid.
+
+    Returns:
+        The parsed JSON data from the request.
+
+    Raises:
+        RequestError: If request JSON is missing or invalid.
+    """
+    if request_data is None:
+        raise RequestError("Request body must contain valid JSON")
+    return request_data
+
+
+def request_idempotency_key(headers: Mapping[str, str]) -> Optional[str]:
+    """
+    Get the Idempotency-Key the client sent with the request.
+
+    Only client-sent keys get replay protection. Without one the operation runs
+    unrecorded, and the ACP client forwards a fresh key of its own upstream.
+
+    Args:
+        headers: Request headers.
+
+    Returns:
+        The client's key, or None if the client sent none.
+    """
+    return headers.get(IDEMPOTENCY_HEADER) or None
+
+
+def idempotency_headers(idempotency_key: Optional[str]) -> Dict[str, str]:
+    """
+    Get the response headers echoing the client's Idempotency-Key, so it can retry with it.
+
+    Args:
+        idempotency_key: Key the client sent, or None.
+
+    Returns:
+        Dictionary with the Idempotency-Key response header, or an empty one if the client sent no key.
+    """
+    if idempotency_key is None:
+        return {}
+    return {IDEMPOTENCY_HEADER: idempotency_key}
+
+
+def parse_page_limit(limit_param: Optional[str]) -> int:
+    """
+    Parse the 'limit' query parameter of a paged product request.
+
+    Args:
+        limit_param: Raw query parameter value, or None if absent.
+
+    Returns:
+        The page size to request.
+
+    Raises:
+        RequestError: If the limit is not an integer between 1 and the maximum page size.
+    """
+    if limit_param is None:
+        return PRODUCT_PAGE_SIZE
+
+    try:
+        limit = int(limit_param)
+    except ValueError:
+        raise RequestError('limit must be an integer')
+
+    if limit < 1 or limit > MAX_PRODUCT_PAGE_SIZE:
+        raise RequestError(f'limit must be between 1 and {MAX_PRODUCT_PAGE_SIZE}')
+    return limit
+
+
+def product_page_arguments(args: Mapping[str, str]) -> Optional[Dict[str, Any]]:
+    """
+    Get the page requested by a product listing request.
+
+    Args:
+        args: Query parameters, with optional 'cursor' and 'limit'.
+
+    Returns:
+        Keyword arguments for list_products_page(), or None for the default listing.
+
+    Raises:
+        RequestError: If the limit is invalid.
+    """
+    cursor = args.get('cursor')
+    limit_param = args.get('limit')
+
+    if cursor is None and limit_param is None:
+        return None
+    return {'cursor': cursor, 'limit': parse_page_limit(limit_param)}
+
+
+def create_checkout_arguments(request_data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Get the arguments of a checkout creation request.
+
+    Args:
+        request_data: Request body.
+
+    Returns:
+        Keyword arguments for create_checkout(), without the idempotency key.
+
+    Raises:
+        RequestError: If items are missing.
+    """
+    if 'items' not in request_data:
+        raise RequestError('Items are required')
+
+    return {
+        'items': request_data['items'],
+        'buyer': request_data.get('buyer'),
+        'fulfillment_address': request_data.get('fulfillment_address')
+    }
+
+
+def update_checkout_arguments(checkout_id: str, request_data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Get the arguments of a checkout update request.
+
+    Args:
+        checkout_id: The unique identifier of the checkout session to update.
+        request_data: Request body.
+
+    Returns:
+        Keyword arguments for update_checkout().
+    """
+    return {
+        'checkout_id': checkout_id,
+        'items': request_data.get('items'),
+        'buyer': request_data.get('buyer'),
+        'fulfillment_address': request_data.get('fulfillment_address'),
+        'fulfillment_option_id': request_data.get('fulfillment_option_id')
+    }
+
+
+def complete_checkout_arguments(checkout_id: str, request_data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Get the arguments of a checkout completion request.
+
+    Args:
+        checkout_id: The unique identifier of the checkout session to complete.
+        request_data: Request body.
+
+    Returns:
+        Keyword arguments for complete_checkout(), without the deadline and idempotency key.
+
+    Raises:
+        RequestError: If the payment token is missing.
+    """
+    if 'payment_token' not in request_data:
+        raise RequestError('Payment token is required')
+
+    payment_provider = request_data.get('payment_provider')
+    if payment_provider is None:
+        payment_provider = 'stripe'
+
+    return {
+        'checkout_id': checkout_id,
+        'payment_token': request_data['payment_token'],
+        'payment_provider': payment_provider,
+        'billing_address': request_data.get('billing_address')
+    }
+
+
+def batch_operations(request_data: Dict[str, Any]) -> List[Any]:
+    """
+    Get the operations of a batch request.
+
+    Args:
+        request_data: Request body.
+
+    Returns:
+        The operations to run.
+
+    Raises:
+        RequestError: If operations are missing or exceed BATCH_MAX_OPERATIONS.
+    """
+    operations = request_data.get('operations')
+
+    if not isinstance(operations, list) or not operations:
+        raise RequestError('Operations are required')
+
+    if len(operations) > BATCH_MAX_OPERATIONS:
+        raise RequestError(f'A batch can have at most {BATCH_MAX_OPERATIONS} operations')
+    return operations
+
+
+# ============================================================================
+# REPLIES
+# ============================================================================
+
+def acp_error_reply(result: Dict[str, Any], default_status_code: int = 500) -> Reply:
+    """
+    Handle errors returned from ACP client operations.
+
+    Args:
+        result: The result dictionary from ACP client that contains an error.
+        default_status_code: Default HTTP status code to use if not specified in result.
+
+    Returns:
+        A tuple of (error body, HTTP status code).
+    """
+    status_code = result.get('status_code')
+    if status_code is None:
+        status_code = default_status_code
+    return result, status_code
+
+
+def products_reply(result: Dict[str, Any]) -> Reply:
+    """
+    Build the reply of a product listing.
+
+    Args:
+        result: The result dictionary from ACP client.
+
+    Returns:
+        A tuple of (body, HTTP status code).
+    """
+    if 'error' in result:
+        return acp_error_reply(result, default_status_code=500)
+    return result, 200
+
+
+def checkout_reply(op: Optional[str], result: Dict[str, Any]) -> Reply:
+    """
+    Build the reply of a checkout operation.
+
+    Sessions returned by writes are written through to the checkout session cache
+    by the ACP client itself, at the version the write produced.
+
+    Args:
+        op: Operation name ('create', 'get', 'update', 'complete' or 'cancel'; None if invalid).
+        result: The result dictionary from ACP client.
+
+    Returns:
+        A tuple of (body, HTTP status code).
+    """
+    if 'error' in result:
+        return acp_error_reply(result, default_status_code=CHECKOUT_ERROR_STATUS_CODES.get(op, 400))
+
+    return result, CHECKOUT_SUCCESS_STATUS_CODES[op]
+
+
+def remember_read(
+    checkout_sessions: CheckoutSessionCache,
+    checkout_id: str,
+    result: Dict[str, Any],
+    ticket: int
+) -> None:
+    """
+    Store a session read from the seller backend in the checkout session cache.
+
+    Args:
+        checkout_sessions: Checkout session cache of the server.
+        checkout_id: ID of the checkout.
+        result: The result dictionary from ACP client.
+        ticket: Checkout session cache ticket taken before the read was sent.
+    """
+    if 'error' not in result:
+        checkout_sessions.put(checkout_id, result, ticket)
+
+
+def batch_reply(
+    checkout_sessions: CheckoutSessionCache,
+    operations: List[Any],
+    results: List[Dict[str, Any]],
+    ticket: int
+) -> Reply:
+    """
+    Build the reply of a batch, storing the sessions its 'get' operations read.
+
+    Args:
+        checkout_sessions: Checkout session cache of the server.
+        operations: The operation dictionaries from the request.
+        results: The result dictionaries from ACP client, in the same order.
+        ticket: Checkout session cache ticket taken before the batch was sent.
+
+    Returns:
+        A tuple of (body, HTTP status code); the body's 'results' hold each operation's
+        'status_code' and response 'body', as the matching single-operation endpoint
+        would have returned them.
+    """
+    items = []
+    for operation, result in zip(operations, results):
+        op = operation.get('op') if isinstance(operation, dict) else None
+        if op == 'get':
+            remember_read(checkout_sessions, operation.get('checkout_id'), result, ticket)
+        body, status_code = checkout_reply(op, result)
+        items.append({'status_code': status_code, 'body': body})
+    return {'results': items}, 200
+
+
+def health_reply(upstreams: Dict[str, Any]) -> Reply:
+    """
+    Build the health reply from each upstream's circuit breaker state.
+
+    The status is 'degraded' while any upstream circuit is not closed. The
+    reply is always 200, since the backend itself is still serving.
+
+    Args:
+        upstreams: Dictionary of upstream name to circuit statistics.
+
+    Returns:
+        A tuple of (body, HTTP status code).
+    """
+    degraded = any(circuit['state'] != STATE_CLOSED for circuit in upstreams.values())
+    return {
+        'status': 'degraded' if degraded else 'ok',
+        'upstreams': upstreams
+    }, 200
+
+
+# ============================================================================
+# CHAT
+# ============================================================================
+
+def _start_turn(conversation_store: ConversationStore, request_data: Dict[str, Any]) -> Tuple[str, list, int]:
+    """
+    Start a conversation turn for a request in conversation mode.
+
+    Args:
+        conversation_store: Conversation store of the server.
+        request_data: Request body with 'message' and optional 'conversation_id'.
+
+    Returns:
+        Tuple of (conversation ID, stored history plus the new user message, index of that message).
+
+    Raises:
+        RequestError: 404 if the conversation is unknown or expired, 400 for a malformed message.
+    """
+    try:
+        return conversation_store.start_turn(request_data.get('conversation_id'), request_data['message'])
+    except KeyError:
+        raise conversation_not_found()
+    except ValueError as e:
+        raise RequestError(str(e))
+
+
+def process_chat(
+    llm_service: LLMService,
+    conversation_store: ConversationStore,
+    request_data: Dict[str, Any],
+    deadline: Deadline
+) -> Dict[str, Any]:
+    """
+    Process a /chat request (blocking).
+
+    Request body must contain either:
+        - message: The new user message (string or message dictionary), plus
+          conversation_id: ID returned by a previous turn (optional; omit to start a new conversation)
+        - messages: Full list of message dictionaries with 'role' and 'content' fields (stateless mode)
+
+    Args:
+        llm_service: LLM service of the server.
+        conversation_store: Conversation store of the server.
+        request_data: Request body.
+        deadline: Time budget for the request.
+
+    Returns:
+        The LLM's response message, with 'conversation_id' in conversation mode.
+
+    Raises:
+        RequestError: 400 for a malformed request, or 404 if the conversation is unknown
+            or expired (also when it expires while the turn runs).
+    """
+    if 'message' in request_data:
+        conversation_id, messages, turn_start = _start_turn(conversation_store, request_data)
+        response = llm_service.process_message(messages, deadline=deadline)
+        if not conversation_store.finish_turn(conversation_id, messages, turn_start, response):
+            raise conversation_not_found()
+        response['conversation_id'] = conversation_id
+        return response
+
+    if 'messages' not in request_data:
+        raise RequestError('Messages are required')
+
+    return llm_service.process_message(request_data['messages'], deadline=deadline)
+
+
+def _record_streamed_turn(
+    conversation_store: ConversationStore,
+    events: Generator[Dict[str, Any], None, None],
+    conversation_id: str,
+    messages: list,
+    turn_start: int
+) -> Generator[Dict[str, Any], None, None]:
+    """
+    Pass chat events through, persisting the turn once the final message arrives.
+
+    Args:
+        conversation_store: Conversation store of the server.
+        events: Events produced by the LLM service.
+        conversation_id: Conversation the turn belongs to.
+        messages: Message list the LLM service works on.
+        turn_start: Index of the turn's user message.
+
+    Yields:
+        The same events, with 'conversation_id' added to the final message, or an 'error'
+        event before it if the conversation expired while the turn ran.
+    """
+    try:
+        for event in events:
+            if event['event'] == 'message':
+                if conversation_store.finish_turn(conversation_id, messages, turn_start, event['data']):
+                    event['data']['conversation_id'] = conversation_id
+                else:
+                    error, status_code = conversation_not_found().reply()
+                    yield {'event': 'error', 'data': {**error, 'status_code': status_code}}
+            yield event
+    finally:
+        # Closing this stream early must also release what the LLM service's stream holds
+        events.close()
+
+
+def stream_chat(
+    llm_service: LLMService,
+    conversation_store: ConversationStore,
+    request_data: Dict[str, Any],
+    deadline: Deadline
+) -> Generator[Dict[str, Any], None, None]:
+    """
+    Start a /chat/stream request (blocking until the conversation turn is started).
+
+    Args:
+        llm_service: LLM service of the server.
+        conversation_store: Conversation store of the server.
+        request_data: Request body, as for process_chat().
+        deadline: Time budget for the request.
+
+    Returns:
+        Blocking generator of 'token', 'tool_call', 'tool_result', 'message' (the final
+        response, as returned by /chat) and 'done' events; an 'error' event precedes
+        'message' if the conversation expired while the turn ran.
+
+    Raises:
+        RequestError: 400 for a malformed request, or 404 if the conversation is unknown or expired.
+    """
+    if 'message' in request_data:
+        conversation_id, messages, turn_start = _start_turn(conversation_store, request_data)
+        return _record_streamed_turn(
+            conversation_store,
+            llm_service.stream_message(messages, deadline=deadline),
+            conversation_id,
+            messages,
+            turn_start
+        )
+
+    if 'messages' not in request_data:
+        raise RequestError('Messages are required')
+
+    return llm_service.stream_message(request_data['messages'], deadline=deadline)
+
+
+def format_sse(event: Dict[str, Any]) -> str:
+    """
+    Format one chat event as a Server-Sent Event.
+
+    Args:
+        event: Event with 'event' name and 'data' payload.
+
+    Returns:
+        SSE frame ready to be written to the response.
+    """
+    return f"event: {event['event']}\ndata: {json.dumps(event['data'])}\n\n"
+
+
+def format_sse_stream(events: Generator[Dict[str, Any], None, None]) -> Iterator[str]:
+    """
+    Format chat events as Server-Sent Events.
+
+    The events are closed when the response stops early (client disconnect),
+    so the LLM call's rate limiter slot and running tools are released at once.
+
+    Args:
+        events: Blocking generator of events with 'event' name and 'data' payload.
+
+    Yields:
+        SSE frames ready to be written to the response.
+    """
+    try:
+        for event in events:
+            yield format_sse(event)
+    finally:
+        events.close()
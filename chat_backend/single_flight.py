@@ -0,0 +1,203 @@
+"""
+Single-Flight Request Coalescing
+
+Collapses concurrent identical reads into one upstream call: the first
+caller for a key runs the call, callers arriving while it is in flight wait
+for it and share its result (or its exception). Nothing is cached; once the
+call returns, the next caller for the key starts a new one.
+"""
+
+import asyncio
+import os
+from abc import ABC, abstractmethod
+import threading
+from typing import Any, Awaitable, Callable, Dict, Hashable, TypeVar
+from dotenv import load_dotenv
+
+
+load_dotenv()
+
+# ============================================================================
+# CONSTANTS
+# ============================================================================
+
+SINGLE_FLIGHT_ENABLED: bool = os.getenv('SINGLE_FLIGHT_ENABLED', 'True').lower() == 'true'
+
+T = TypeVar('T')
+
+
+# ============================================================================
+# HELPER CLASSES
+# ============================================================================
+
+class _Call:
+    """A call in flight, and the outcome its waiters share."""
+
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Any = None
+
+
+# ============================================================================
+# SINGLE FLIGHT CLASSES
+# ============================================================================
+
+class _FlightCounters(ABC):
+    """Collapsed-call counters shared by the thread and asyncio variants."""
+
+    def __init__(self, enabled: bool) -> None:
+        self.enabled = enabled
+        self._counter_lock = threading.Lock()
+        self._executions = 0
+        self._collapsed: Dict[str, int] = {}
+
+    def _count(self, key: Hashable, collapsed: bool) -> None:
+        """Count a caller as a leader or a collapsed follower. Keys start with the operation name."""
+        with self._counter_lock:
+            if collapsed:
+                operation = str(key[0] if isinstance(key, tuple) else key)
+                self._collapsed[operation] = self._collapsed.get(operation, 0) + 1
+            else:
+                self._executions += 1
+
+    @abstractmethod
+    def _in_flight(self) -> int:
+        """Number of keys with a call in flight."""
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get coalescing statistics.
+
+        Returns:
+            Dictionary with upstream executions, collapsed callers (total and per operation)
+            and the share of callers that were collapsed
+        """
+        with self._counter_lock:
+            collapsed = sum(self._collapsed.values())
+            calls = self._executions + collapsed
+            return {
+                'enabled': self.enabled,
+                'calls': calls,
+                'executions': self._executions,
+                'collapsed': collapsed,
+                'collapsed_by_operation': dict(self._collapsed),
+                'collapse_rate': collapsed / calls if calls else 0.0,
+                'in_flight': self._in_flight()
+            }
+
+
+class SingleFlight(_FlightCounters):
+    """
+    Thread-based single flight for blocking clients.
+    """
+
+    def __init__(self, enabled: bool = SINGLE_FLIGHT_ENABLED) -> None:
+        """
+        Initialize with no calls in flight.
+
+        Args:
+            enabled: Whether concurrent calls are collapsed at all
+        """
+        super().__init__(enabled)
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+
+    def _in_flight(self) -> int:
+        return len(self._calls)
+
+    def do(self, key: Hashable, fn: Callable[[], T]) -> T:
+        """
+        Run fn, or wait for the identical call already in flight.
+
+        Args:
+            key: Identity of the call; a tuple starting with the operation name
+            fn: Function making the upstream call
+
+        Returns:
+            The result of the call (shared by all callers of the key)
+
+        Raises:
+            Exception: Whatever the call raised
+        """
+        if not self.enabled:
+            return fn()
+
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+        self._count(key, collapsed=not leader)
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+
+class AsyncSingleFlight(_FlightCounters):
+    """
+    asyncio single flight for async clients; use one per event loop.
+    """
+
+    def __init__(self, enabled: bool = SINGLE_FLIGHT_ENABLED) -> None:
+        """
+        Initialize with no calls in flight.
+
+        Args:
+            enabled: Whether concurrent calls are collapsed at all
+        """
+        super().__init__(enabled)
+        self._calls: Dict[Hashable, "asyncio.Task[Any]"] = {}
+
+    def _in_flight(self) -> int:
+        return len(self._calls)
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        """
+        Await fn(), or the identical call already in flight.
+
+        Args:
+            key: Identity of the call; a tuple starting with the operation name
+            fn: Coroutine function making the upstream call
+
+        Returns:
+            The result of the call (shared by all callers of the key)
+
+        Raises:
+            Exception: Whatever the call raised
+        """
+        if not self.enabled:
+            return await fn()
+
+        task = self._calls.get(key)
+        self._count(key, collapsed=task is not None)
+        if task is None:
+            # The call runs as its own task, so it outlives any caller that is cancelled
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            task.add_done_callback(lambda done: self._finish(key, done))
+
+        # Shielded, so a cancelled caller (the first one included) does not cancel the call for the others
+        return await asyncio.shield(task)
+
+    def _finish(self, key: Hashable, task: "asyncio.Task[Any]") -> None:
+        """Forget a finished call, so the next caller for the key starts a new one."""
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        if not task.cancelled():
+            # Mark the exception retrieved when every caller was cancelled before it was raised
+            task.exception()